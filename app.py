@@ -3,14 +3,23 @@ nest_asyncio.apply()
 
 """Main application module."""
 import os
-from flask import Flask
+from flask import Flask, jsonify
 from dotenv import load_dotenv
 import structlog
 from config import config
-from extensions import init_extensions, init_gemini
+from extensions import init_extensions, init_gemini, start_gemini_background_init, limiter, verdict_cache, url_verdict_cache, similarity_index, image_hash_index, heuristic_filter
 from errors import init_error_handlers
 import atexit
 from utils.gemini_thread import GeminiThreadManager
+from utils.analysis_tools import get_analysis_tools
+from utils.ocr_pool import OCRPool
+from utils.safe_browsing_db import SafeBrowsingDatabase
+from utils.http_client import get_http_client
+from utils.orchestrator import get_orchestrator_metrics
+from utils.batch_verification import get_batch_metrics
+from utils.ocr_preprocess import PreprocessOptions
+from utils.uploads import get_upload_metrics
+from utils.file_types import get_mime_detector
 from flask_wtf.csrf import generate_csrf
 
 # Configure logging
@@ -20,14 +29,6 @@ logger = structlog.get_logger()
 load_dotenv()
 logger.info("Environment variables loaded")
 
-# Initialize the thread manager as a global instance
-# This ensures it's created only once and shared across the application
-gemini_thread_manager = GeminiThreadManager(
-    max_workers=int(os.getenv('GEMINI_MAX_WORKERS', '5')),
-    queue_size=int(os.getenv('GEMINI_QUEUE_SIZE', '100')),
-    default_timeout=float(os.getenv('GEMINI_DEFAULT_TIMEOUT', '30.0'))
-)
-
 def create_app(config_name='default'):
     """Create and configure the Flask application."""
     app = Flask(__name__)
@@ -45,11 +46,75 @@ def create_app(config_name='default'):
     # Initialize extensions
     init_extensions(app)
     
-    # Initialize Gemini API configuration and attach thread manager to app
-    app.gemini_config_ok = init_gemini(app)
+    # Check Gemini settings without any outbound call or heavy import;
+    # readiness is filled in by the background health probe. With the probe
+    # disabled nothing would ever set it, so a configured key and model count
+    # as ready.
+    app.gemini_configured = init_gemini(app)
+    app.gemini_config_ok = (
+        not app.config['GEMINI_HEALTH_PROBE_ENABLED']
+        and app.gemini_configured
+        and bool(app.config.get('GEMINI_MODEL'))
+    )
+    app.gemini_probe_error = None if app.gemini_configured else 'Gemini API key not configured'
+    app.gemini_last_probe = None
+    
+    # One thread manager serves all Gemini traffic of this app; the blueprints
+    # reach it through current_app.gemini_thread_manager
+    gemini_thread_manager = GeminiThreadManager(
+        max_workers=app.config['GEMINI_MAX_WORKERS'],
+        queue_size=app.config['GEMINI_QUEUE_SIZE'],
+        default_timeout=app.config['GEMINI_DEFAULT_TIMEOUT'],
+        verdict_cache=verdict_cache,
+        priority_lanes=app.config['GEMINI_PRIORITY_LANES']
+    )
     app.gemini_thread_manager = gemini_thread_manager
     
-    if not app.gemini_config_ok:
+    # OCR runs in worker processes so it never blocks the event loop; workers
+    # are started on the first image
+    ocr_preprocess = PreprocessOptions.from_config(app.config)
+    ocr_pool = None
+    if app.config['OCR_POOL_ENABLED']:
+        ocr_pool = OCRPool(
+            max_workers=app.config['OCR_POOL_WORKERS'] or None,
+            queue_size=app.config['OCR_POOL_QUEUE_SIZE'],
+            job_timeout=app.config['OCR_JOB_TIMEOUT'],
+            start_method=app.config['OCR_POOL_START_METHOD'],
+            engine=app.config['OCR_ENGINE'],
+            preprocess=ocr_preprocess
+        )
+    get_analysis_tools().ocr_pool = ocr_pool
+    get_analysis_tools().ocr_engine = app.config['OCR_ENGINE']
+    get_analysis_tools().ocr_preprocess = ocr_preprocess
+    get_analysis_tools().safe_browsing.verdict_cache = url_verdict_cache
+    get_analysis_tools().safe_browsing.max_concurrent_requests = app.config['SAFE_BROWSING_MAX_CONCURRENT_REQUESTS']
+    get_analysis_tools().analysis_deadline = app.config['ANALYSIS_DEADLINE']
+    
+    # Outbound HTTP calls share pooled keep-alive sessions for the app's lifetime
+    get_http_client().configure(
+        limit=app.config['HTTP_POOL_LIMIT'],
+        limit_per_host=app.config['HTTP_POOL_LIMIT_PER_HOST'],
+        dns_cache_ttl=app.config['HTTP_DNS_CACHE_TTL'],
+        keepalive_timeout=app.config['HTTP_KEEPALIVE_TIMEOUT'],
+        connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+        total_timeout=app.config['HTTP_TOTAL_TIMEOUT']
+    )
+    
+    # Optional local Safe Browsing hash-prefix database; remote lookups are
+    # used until its first update completes
+    safe_browsing_db = None
+    if app.config['SAFE_BROWSING_LOCAL_DB_ENABLED'] and get_analysis_tools().google_safe_browsing_key:
+        safe_browsing_db = SafeBrowsingDatabase(
+            app.config['SAFE_BROWSING_DB_PATH'],
+            get_analysis_tools().safe_browsing
+        )
+        safe_browsing_db.start_updates(
+            interval=app.config['SAFE_BROWSING_UPDATE_INTERVAL'],
+            session_factory=get_http_client().session
+        )
+        get_analysis_tools().safe_browsing.local_db = safe_browsing_db
+    
+    if not app.gemini_configured:
         logger.error("Failed to initialize Gemini API configuration")
         # We continue app initialization but some features will be disabled
     
@@ -60,9 +125,13 @@ def create_app(config_name='default'):
     from routes.main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
-    from routes.api import api as api_blueprint
+    from routes.api import api as api_blueprint, warm_gemini_models
     app.register_blueprint(api_blueprint, url_prefix='/api')
     
+    # Import/configure Gemini, build the shared models and probe in the background
+    if app.gemini_configured:
+        start_gemini_background_init(app, warm_up=lambda: warm_gemini_models(app))
+    
     # Add CSRF token context processor
     @app.context_processor
     def inject_csrf_token_value():
@@ -70,12 +139,46 @@ def create_app(config_name='default'):
     
     # Register cleanup function
     atexit.register(lambda: gemini_thread_manager.shutdown())
+    if ocr_pool is not None:
+        atexit.register(lambda: ocr_pool.shutdown(wait=False))
+    if safe_browsing_db is not None:
+        atexit.register(lambda: safe_browsing_db.close())
+    atexit.register(lambda: get_http_client().close())
+    
+    # Liveness and readiness endpoints for process managers and load balancers
+    @app.route('/healthz')
+    @limiter.exempt
+    def healthz():
+        return jsonify({'status': 'ok'})
+    
+    @app.route('/readyz')
+    @limiter.exempt
+    def readyz():
+        ready = bool(app.gemini_config_ok)
+        return jsonify({
+            'status': 'ready' if ready else 'not_ready',
+            'gemini_configured': app.gemini_configured,
+            'gemini_ok': ready,
+            'gemini_last_probe': app.gemini_last_probe,
+            'gemini_error': app.gemini_probe_error,
+        }), 200 if ready else 503
     
     # Add metrics endpoint if in debug mode
     if app.debug:
         @app.route('/debug/metrics')
         def metrics():
-            return gemini_thread_manager.get_metrics()
+            return {
+                **gemini_thread_manager.get_metrics(),
+                **similarity_index.get_metrics(),
+                **heuristic_filter.get_metrics(),
+                **image_hash_index.get_metrics(),
+                **get_analysis_tools().get_metrics(),
+                **get_http_client().get_metrics(),
+                **get_orchestrator_metrics(),
+                **get_batch_metrics(),
+                **get_upload_metrics(),
+                **get_mime_detector().get_metrics(),
+            }
     
     logger.info(f"Flask app created with config: {config_name}")
     return app
@@ -8,11 +8,85 @@ class Config:
     # Flask Configuration
     SECRET_KEY = os.getenv('SECRET_KEY', os.urandom(24))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_IMAGE_UPLOAD_BYTES = int(os.getenv('MAX_IMAGE_UPLOAD_BYTES', str(5 * 1024 * 1024)))
+    ALLOWED_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp')
     UPLOAD_FOLDER = 'temp_uploads'
     
     # Gemini API Configuration
     GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
     GEMINI_MODEL = 'gemini-1.5-flash'
+    GEMINI_MAX_WORKERS = int(os.getenv('GEMINI_MAX_WORKERS', '5'))
+    GEMINI_QUEUE_SIZE = int(os.getenv('GEMINI_QUEUE_SIZE', '100'))
+    GEMINI_DEFAULT_TIMEOUT = float(os.getenv('GEMINI_DEFAULT_TIMEOUT', '30.0'))
+    GEMINI_PRIORITY_LANES = os.getenv('GEMINI_PRIORITY_LANES', 'form,api').split(',')
+    GEMINI_HEALTH_PROBE_ENABLED = os.getenv('GEMINI_HEALTH_PROBE_ENABLED', 'true').lower() == 'true'
+    GEMINI_HEALTH_PROBE_INTERVAL = int(os.getenv('GEMINI_HEALTH_PROBE_INTERVAL', '300'))  # 0 = probe once
+    GEMINI_HEALTH_PROBE_TIMEOUT = float(os.getenv('GEMINI_HEALTH_PROBE_TIMEOUT', '10.0'))
+    
+    # OCR Configuration
+    OCR_POOL_ENABLED = os.getenv('OCR_POOL_ENABLED', 'true').lower() == 'true'
+    OCR_POOL_WORKERS = int(os.getenv('OCR_POOL_WORKERS', '0'))  # 0 = one per CPU
+    OCR_POOL_QUEUE_SIZE = int(os.getenv('OCR_POOL_QUEUE_SIZE', '32'))
+    OCR_JOB_TIMEOUT = float(os.getenv('OCR_JOB_TIMEOUT', '30.0'))
+    OCR_POOL_START_METHOD = os.getenv('OCR_POOL_START_METHOD', 'spawn')
+    OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')  # 'auto', 'tesserocr' or 'subprocess'
+    OCR_PREPROCESS_ENABLED = os.getenv('OCR_PREPROCESS_ENABLED', 'true').lower() == 'true'
+    OCR_TARGET_DPI = int(os.getenv('OCR_TARGET_DPI', '300'))
+    OCR_MAX_SIDE = int(os.getenv('OCR_MAX_SIDE', '2000'))  # 0 = no limit
+    OCR_GRAYSCALE = os.getenv('OCR_GRAYSCALE', 'true').lower() == 'true'
+    OCR_BINARIZE = os.getenv('OCR_BINARIZE', 'false').lower() == 'true'
+    OCR_CROP_BORDERS = os.getenv('OCR_CROP_BORDERS', 'true').lower() == 'true'
+    OCR_CROP_TOP = float(os.getenv('OCR_CROP_TOP', '0.0'))  # e.g. 0.04 to drop a phone status bar
+    
+    # Analysis Configuration
+    ANALYSIS_DEADLINE = float(os.getenv('ANALYSIS_DEADLINE', '45.0'))  # end to end, seconds
+    SAFE_BROWSING_MAX_CONCURRENT_REQUESTS = int(os.getenv('SAFE_BROWSING_MAX_CONCURRENT_REQUESTS', '4'))
+    
+    # Batch Verification Configuration (/api/verificar/batch)
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+    BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(2 * 1024 * 1024)))
+    BATCH_ITEMS_PER_PROMPT = int(os.getenv('BATCH_ITEMS_PER_PROMPT', '10'))  # messages packed per Gemini call
+    BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))  # Gemini calls in flight per batch
+    BATCH_DEADLINE = float(os.getenv('BATCH_DEADLINE', '120.0'))  # end to end, seconds
+    
+    # Outbound HTTP Configuration
+    HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))
+    HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '10'))
+    HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30.0'))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5.0'))
+    HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '15.0'))
+    
+    # Safe Browsing Configuration
+    SAFE_BROWSING_LOCAL_DB_ENABLED = os.getenv('SAFE_BROWSING_LOCAL_DB_ENABLED', 'false').lower() == 'true'
+    SAFE_BROWSING_DB_PATH = os.getenv('SAFE_BROWSING_DB_PATH', 'instance/safe_browsing')
+    SAFE_BROWSING_UPDATE_INTERVAL = int(os.getenv('SAFE_BROWSING_UPDATE_INTERVAL', '1800'))
+    URL_VERDICT_CACHE_ENABLED = os.getenv('URL_VERDICT_CACHE_ENABLED', 'true').lower() == 'true'
+    URL_VERDICT_CACHE_BACKEND = os.getenv('URL_VERDICT_CACHE_BACKEND', 'local')  # 'local' or 'shared'
+    URL_VERDICT_CACHE_NEGATIVE_TTL = int(os.getenv('URL_VERDICT_CACHE_NEGATIVE_TTL', '300'))  # when the API gives none
+    URL_VERDICT_CACHE_MAX_TTL = int(os.getenv('URL_VERDICT_CACHE_MAX_TTL', '3600'))
+    URL_VERDICT_CACHE_MAX_BYTES = int(os.getenv('URL_VERDICT_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+    
+    # Caching Configuration
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+    CACHE_DEFAULT_TIMEOUT = 300
+    VERDICT_CACHE_ENABLED = os.getenv('VERDICT_CACHE_ENABLED', 'true').lower() == 'true'
+    VERDICT_CACHE_BACKEND = os.getenv('VERDICT_CACHE_BACKEND', 'local')  # 'local' or 'shared'
+    VERDICT_CACHE_TTL = int(os.getenv('VERDICT_CACHE_TTL', '3600'))
+    VERDICT_CACHE_MAX_BYTES = int(os.getenv('VERDICT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    SIMILARITY_INDEX_ENABLED = os.getenv('SIMILARITY_INDEX_ENABLED', 'true').lower() == 'true'
+    SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.95'))
+    SIMILARITY_INDEX_MAX_ENTRIES = int(os.getenv('SIMILARITY_INDEX_MAX_ENTRIES', '100000'))
+    IMAGE_HASH_INDEX_ENABLED = os.getenv('IMAGE_HASH_INDEX_ENABLED', 'true').lower() == 'true'
+    IMAGE_HASH_MAX_DISTANCE = int(os.getenv('IMAGE_HASH_MAX_DISTANCE', '6'))  # bits of the 64-bit dHash
+    IMAGE_HASH_VERIFY_DISTANCE = int(os.getenv('IMAGE_HASH_VERIFY_DISTANCE', '12'))  # bits of the 256-bit dHash
+    IMAGE_HASH_MAX_ENTRIES = int(os.getenv('IMAGE_HASH_MAX_ENTRIES', '10000'))
+    
+    # Heuristic Pre-filter Configuration
+    HEURISTICS_ENABLED = os.getenv('HEURISTICS_ENABLED', 'true').lower() == 'true'
+    HEURISTICS_SHORT_CIRCUIT = os.getenv('HEURISTICS_SHORT_CIRCUIT', 'off')  # 'off', 'scam' or 'both'
+    HEURISTICS_SCAM_THRESHOLD = int(os.getenv('HEURISTICS_SCAM_THRESHOLD', '70'))  # score out of 100
     
     # Security Configuration
     SESSION_COOKIE_SECURE = True
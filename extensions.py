@@ -3,19 +3,28 @@ nest_asyncio.apply()  # Apply this first, before any other imports
 
 """Flask extensions and third-party service configurations."""
 import os
+import time
+import threading
 import logging
 import structlog
-import google.generativeai as genai
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
 from flask_caching import Cache
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from utils.caching import VerdictCache, UrlVerdictCache
+from utils.similarity import SimilarityIndex, ImageHashIndex
+from utils.heuristics import HeuristicFilter
+from middleware import reject_oversized_uploads
 
 # Initialize extensions
 csrf = CSRFProtect()
 cache = Cache()
+verdict_cache = VerdictCache()
+url_verdict_cache = UrlVerdictCache()
+similarity_index = SimilarityIndex()
+image_hash_index = ImageHashIndex()
+heuristic_filter = HeuristicFilter()
 talisman = Talisman()
 limiter = Limiter(
     key_func=get_remote_address,
@@ -40,43 +49,108 @@ structlog.configure(
 )
 logger = structlog.get_logger()
 
+_gemini_configured_key = None
+_gemini_configure_lock = threading.Lock()
+
+def configure_gemini(api_key):
+    """Import and configure google.generativeai once per process.
+    
+    The import is deferred to here because it is by far the most expensive
+    one in the app; callers on the request path use this as a cheap
+    idempotent guard.
+    """
+    global _gemini_configured_key
+    if _gemini_configured_key == api_key:
+        return
+    with _gemini_configure_lock:
+        if _gemini_configured_key == api_key:
+            return
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _gemini_configured_key = api_key
+        logger.info("Gemini API configured globally")
+
 def init_gemini(app):
-    """Initialize Gemini API configuration and test it."""
+    """Check the Gemini API configuration.
+    
+    Makes no outbound calls and does not import google.generativeai; that is
+    done by start_gemini_background_init (or the first request) so app
+    startup never waits on the network or on heavy imports.
+    """
     try:
         gemini_api_key = app.config.get("GEMINI_API_KEY")
         if not gemini_api_key:
             raise ValueError("Gemini API key not found in app config")
-        
-        genai.configure(api_key=gemini_api_key)
-        logger.info("Gemini API configured globally")
-        
-        # Test the API with a temporary model instance
-        temp_model = genai.GenerativeModel(
-            app.config.get("GEMINI_MODEL", "gemini-1.5-flash"),
-            safety_settings={
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            }
-        )
-        
-        # Test the model
-        test_response = temp_model.generate_content("Test connection. Respond with 'OK'.")
-        if test_response and test_response.text and "OK" in test_response.text:
-            logger.info(f"Gemini API test successful: {test_response.text.strip()}")
-            return True
-        else:
-            raise Exception(f"Invalid Gemini test response: {test_response.text if test_response else 'No response'}")
+        return True
             
     except Exception as e:
         logger.error(f"Critical error initializing Gemini: {str(e)}", exc_info=True)
         return False
 
+def probe_gemini(app):
+    """Check that the configured key can reach the configured model.
+    
+    Uses a model metadata lookup, which spends no tokens. Updates
+    app.gemini_config_ok, app.gemini_probe_error and app.gemini_last_probe.
+    """
+    model_name = app.config.get("GEMINI_MODEL", "gemini-1.5-flash")
+    try:
+        import google.generativeai as genai
+        configure_gemini(app.config.get("GEMINI_API_KEY"))
+        genai.get_model(
+            f"models/{model_name}",
+            request_options={'timeout': app.config.get('GEMINI_HEALTH_PROBE_TIMEOUT', 10.0)}
+        )
+        if not app.gemini_config_ok:
+            logger.info(f"Gemini health probe succeeded for {model_name}")
+        app.gemini_config_ok = True
+        app.gemini_probe_error = None
+    except Exception as e:
+        logger.error(f"Gemini health probe failed: {str(e)}")
+        app.gemini_config_ok = False
+        app.gemini_probe_error = str(e)
+    app.gemini_last_probe = time.time()
+    return app.gemini_config_ok
+
+def start_gemini_background_init(app, warm_up=None):
+    """Configure Gemini, warm models and run the health probe in a daemon thread.
+    
+    Args:
+        app: The Flask application
+        warm_up: Optional callable run once after configuration (e.g. building shared models)
+    """
+    interval = app.config.get('GEMINI_HEALTH_PROBE_INTERVAL', 300)
+    probe_enabled = app.config.get('GEMINI_HEALTH_PROBE_ENABLED', True)
+    
+    def _run():
+        try:
+            configure_gemini(app.config.get("GEMINI_API_KEY"))
+            if warm_up is not None:
+                warm_up()
+        except Exception as e:
+            logger.error(f"Gemini background initialization failed: {str(e)}", exc_info=True)
+        
+        while probe_enabled:
+            probe_gemini(app)
+            if interval <= 0:
+                return
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=_run, name="gemini_background_init", daemon=True)
+    thread.start()
+    return thread
+
 def init_extensions(app):
     """Initialize all Flask extensions."""
+    # before_request hooks run in registration order: size check first, then CSRF
+    app.before_request(reject_oversized_uploads)
     csrf.init_app(app)
     cache.init_app(app)
+    verdict_cache.init_app(app, shared_cache=cache)
+    url_verdict_cache.init_app(app, shared_cache=cache)
+    similarity_index.init_app(app)
+    image_hash_index.init_app(app)
+    heuristic_filter.init_app(app)
     limiter.init_app(app)
     
     # Configure Content Security Policy
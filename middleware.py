@@ -1,14 +1,17 @@
 """Middleware module for request processing."""
 import uuid
 from functools import wraps
-from flask import request, g, current_app
+from flask import request, g, current_app, jsonify, flash, redirect, url_for
 import structlog
 from werkzeug.utils import secure_filename
-import magic
 import os
+from utils.uploads import sniff_mime, content_length_exceeds
 
 logger = structlog.get_logger()
 
+# Views that take an image upload, limited to MAX_IMAGE_UPLOAD_BYTES
+IMAGE_UPLOAD_ENDPOINTS = ('main.process_analysis', 'api.analyze_image_api')
+
 def init_request_id():
     """Initialize request ID for tracking."""
     request_id = request.headers.get('X-Request-ID') or str(uuid.uuid4())
@@ -22,6 +25,35 @@ def log_request_info():
                 path=request.path,
                 remote_addr=request.remote_addr)
 
+def reject_oversized_uploads():
+    """Refuse image uploads whose Content-Length is over the limit.
+
+    Registered ahead of CSRFProtect, whose check reads request.form, so an
+    oversized body is turned away before anything parses or spools it.
+    """
+    if request.endpoint not in IMAGE_UPLOAD_ENDPOINTS:
+        return None
+    max_bytes = current_app.config['MAX_IMAGE_UPLOAD_BYTES']
+    if not content_length_exceeds(request, max_bytes):
+        return None
+    message = f'Arquivo muito grande. Limite máximo é {max_bytes // (1024 * 1024)}MB.'
+    logger.warning("Upload refused before parsing",
+                   path=request.path,
+                   content_length=request.content_length)
+    if request.blueprint == 'api':
+        return jsonify({
+            'extracted_text': None,
+            'text_analysis': {
+                'risk_level': 'Indeterminado',
+                'summary': None,
+                'alerts': [],
+                'recommendation': None,
+                'error': message
+            }
+        }), 413
+    flash(message, 'error')
+    return redirect(url_for('main.index'))
+
 def validate_file_type(allowed_mimetypes=None):
     """
     Decorator to validate file type using libmagic.
@@ -45,13 +77,8 @@ def validate_file_type(allowed_mimetypes=None):
                     'status_code': 400
                 }, 400
             
-            # Read file content for MIME type detection
-            file_content = file.read()
-            file.seek(0)  # Reset file pointer
-            
-            # Detect MIME type
-            mime = magic.Magic(mime=True)
-            file_type = mime.from_buffer(file_content)
+            # Detect MIME type from the first bytes only; the upload is read once by the view
+            file_type = sniff_mime(file)
             
             if allowed_mimetypes and file_type not in allowed_mimetypes:
                 return {
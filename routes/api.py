@@ -1,34 +1,76 @@
-from flask import Blueprint, request, jsonify, current_app
-from extensions import limiter  # Import the global limiter instance
-from utils.analysis_tools import AnalysisTools
-from utils.gemini_thread import GeminiThreadManager
+from flask import Blueprint, Response, request, jsonify, current_app
+from extensions import limiter, similarity_index, image_hash_index, heuristic_filter, configure_gemini  # Import the global extension instances
+from utils.analysis_tools import get_analysis_tools
+from utils.async_utils import BackgroundEventLoop
+from utils.batch_verification import (
+    BatchRequestError, batch_generation_config, build_batch_prompt, chunked, count_batch, group_duplicates,
+    parse_batch_body, parse_batch_response
+)
+from utils.gemini_thread import GeminiThreadManager, GeminiQueueFullError, GeminiTimeoutError
+from utils.ocr_pool import OCRQueueFullError
+from utils.orchestrator import Deadline, DeadlineExceededError, run_stages, timed_out_stages
+from utils.uploads import read_upload, UploadTooLargeError, UnsupportedUploadError
 import json
+import queue
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import structlog
 import asyncio
 
 logger = structlog.get_logger()
 
-analysis_tools_instance = AnalysisTools()
-gemini_thread_manager = GeminiThreadManager(max_workers=5)
-
 api = Blueprint('api', __name__)
 
+MODEL_GENERATION_CONFIG = {"temperature": 0.7, "max_output_tokens": 2048}
+VERIFY_GENERATION_CONFIG = {"temperature": 0.7, "max_output_tokens": 2048}
+# Set by verificar_lote for each result, whatever the verdict itself contains
+BATCH_RESULT_KEYS = ('id', 'source', 'duplicate_of')
+
+def get_gemini_thread_manager() -> GeminiThreadManager:
+    """Return the app-wide GeminiThreadManager created in create_app."""
+    return current_app.gemini_thread_manager
+
+def warm_gemini_models(app):
+    """Build the shared Gemini model ahead of the first request."""
+    app.gemini_thread_manager.warm_models([{
+        'model_name': app.config.get("GEMINI_MODEL", "gemini-1.5-flash"),
+        'generation_config': MODEL_GENERATION_CONFIG,
+    }])
+
 def create_gemini_model():
-    """Create a new Gemini model instance with current app configuration."""
+    """Get the shared Gemini model instance for the current app configuration."""
     if not current_app.config.get("GEMINI_API_KEY"):
         logger.error("Gemini API key not configured")
         return None
         
     try:
-        return gemini_thread_manager.create_model(
+        configure_gemini(current_app.config["GEMINI_API_KEY"])
+        return get_gemini_thread_manager().get_model(
             model_name=current_app.config.get("GEMINI_MODEL", "gemini-1.5-flash"),
-            generation_config={"temperature": 0.7, "max_output_tokens": 2048}
+            generation_config=MODEL_GENERATION_CONFIG
             # Safety settings will use defaults from GeminiThreadManager
         )
     except Exception as e:
         logger.error(f"Error creating Gemini model: {str(e)}", exc_info=True)
         return None
 
+def build_verification_prompt(message: str) -> str:
+    """Prompt of /api/verificar; batch verdicts are cached under its key too."""
+    return f"""
+    Você é um especialista em segurança digital e detecção de fraudes. Analise a seguinte mensagem com extremo cuidado:
+    ---
+    {message}
+    ---
+    Retorne uma análise detalhada em formato JSON com as seguintes informações:
+    {{
+      "risk_level": "string (Valores: Baixo, Médio, Alto, Muito Alto)",
+      "summary": "string (Resumo conciso da análise)",
+      "alerts": ["string (Pontos suspeitos)"],
+      "recommendation": "string (Recomendação principal)"
+    }}
+    Forneça apenas o objeto JSON como resposta.
+    """
+
 @api.route('/verificar', methods=['POST'])
 @limiter.limit("10 per minute")  # Rate limit: 10 requests per minute
 async def verificar_golpe():
@@ -52,32 +94,35 @@ async def verificar_golpe():
         if not mensagem_usuario:
             return jsonify({'error': 'Nenhuma mensagem fornecida.'}), 400
         
-        # Create new model instance for this request
+        # Reuse the verdict of a near-duplicate message (same campaign, different details)
+        similar = similarity_index.lookup(mensagem_usuario)
+        if similar:
+            logger.info(f"api.verificar_golpe: Near-duplicate of {similar['neighbor_id']} (score={similar['score']})")
+            return jsonify({
+                **similar['verdict'],
+                'similar_match': {'neighbor_id': similar['neighbor_id'], 'score': similar['score']}
+            })
+        
+        # Obvious cases (per HEURISTICS_SHORT_CIRCUIT) are answered without Gemini
+        heuristic_verdict = heuristic_filter.short_circuit_verdict(mensagem_usuario)
+        if heuristic_verdict:
+            logger.info(f"api.verificar_golpe: Answered by heuristics (score={heuristic_verdict['heuristic_score']})")
+            return jsonify(heuristic_verdict)
+        
+        # Get the shared model instance
         gemini_model = create_gemini_model()
         if not gemini_model:
             return jsonify({'error': 'Falha ao inicializar modelo Gemini', 'risk_level': 'Indeterminado'}), 500
         
-        prompt = f"""
-        Você é um especialista em segurança digital e detecção de fraudes. Analise a seguinte mensagem com extremo cuidado:
-        ---
-        {mensagem_usuario}
-        ---
-        Retorne uma análise detalhada em formato JSON com as seguintes informações:
-        {{
-          "risk_level": "string (Valores: Baixo, Médio, Alto, Muito Alto)",
-          "summary": "string (Resumo conciso da análise)",
-          "alerts": ["string (Pontos suspeitos)"],
-          "recommendation": "string (Recomendação principal)"
-        }}
-        Forneça apenas o objeto JSON como resposta.
-        """
+        prompt = build_verification_prompt(mensagem_usuario)
         logger.debug(f"api.verificar_golpe: Sending prompt to Gemini: {prompt[:150]}...")
         
         try:
-            response = await gemini_thread_manager.generate_content(
+            response = await get_gemini_thread_manager().generate_content(
                 gemini_model,
                 prompt,
-                generation_config={"temperature": 0.7, "max_output_tokens": 2048}
+                generation_config=VERIFY_GENERATION_CONFIG,
+                lane='api'
             )
             logger.debug("api.verificar_golpe: Received response from Gemini.")
             
@@ -94,6 +139,8 @@ async def verificar_golpe():
             cleaned_response = response.text.strip().removeprefix("```json").removesuffix("```").strip()
             try:
                 analysis_data = json.loads(cleaned_response)
+                if isinstance(analysis_data, dict):
+                    similarity_index.add(mensagem_usuario, analysis_data)
                 return jsonify(analysis_data)
             except json.JSONDecodeError as e:
                 logger.error(f"api.verificar_golpe: JSON decode error: {e}. Raw: {cleaned_response[:200]}")
@@ -101,6 +148,10 @@ async def verificar_golpe():
                 response_data['raw_response'] = cleaned_response
                 return jsonify(response_data), 500
 
+        except GeminiQueueFullError as e:
+            logger.warning(f"api.verificar_golpe: Gemini queue full, rejecting request: {str(e)}")
+            response_data['error'] = 'Serviço sobrecarregado. Tente novamente em instantes.'
+            return jsonify(response_data), 503, {'Retry-After': str(e.retry_after)}
         except RuntimeError as e:
             logger.error(f"api.verificar_golpe: Runtime error from Gemini Thread Manager: {str(e)}", exc_info=True)
             response_data['error'] = f'Erro de processamento assíncrono: {str(e)}'
@@ -117,9 +168,247 @@ async def verificar_golpe():
         response_data['recommendation'] = 'Tente novamente mais tarde.'
         return jsonify(response_data), 500
 
+@api.route('/verificar/batch', methods=['POST'])
+@limiter.limit("5 per minute")
+async def verificar_lote():
+    """Screen many messages at once (JSON array or NDJSON body).
+
+    Returns one result per submitted message, in order, each with the same
+    fields as /api/verificar plus its 'id' and the 'source' of the verdict
+    ('similar', 'heuristics', 'cache', 'gemini' or 'error').
+    """
+    if not current_app.config.get("GEMINI_API_KEY"):
+        logger.error("api.verificar_lote: Gemini API not configured.")
+        return jsonify({'error': 'Serviço de IA não configurado.'}), 500
+
+    max_bytes = current_app.config['BATCH_MAX_BYTES']
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({'error': f'Lote muito grande. Limite máximo é {max_bytes // 1024}KB.'}), 413
+    try:
+        items = parse_batch_body(request.get_data(cache=False), request.mimetype, current_app.config['BATCH_MAX_ITEMS'])
+    except BatchRequestError as e:
+        return jsonify({'error': str(e)}), 400
+
+    gemini_model = create_gemini_model()
+    if not gemini_model:
+        return jsonify({'error': 'Falha ao inicializar modelo Gemini'}), 500
+    thread_manager = get_gemini_thread_manager()
+    verdict_cache = thread_manager.verdict_cache
+    model_name = getattr(gemini_model, 'model_name', '')
+
+    def cache_key(message: str) -> str:
+        return verdict_cache.key_for(build_verification_prompt(message), model_name, VERIFY_GENERATION_CONFIG)
+
+    # Each distinct message goes through the same shortcuts as /api/verificar
+    groups = group_duplicates(items)
+    verdicts = {}
+    pending = []
+    for normalized, positions in groups.items():
+        message = items[positions[0]]['message']
+        if not normalized:
+            verdicts[normalized] = ('error', {'error': 'Nenhuma mensagem fornecida.', 'risk_level': 'Indeterminado'})
+            continue
+        similar = similarity_index.lookup(message)
+        if similar:
+            verdicts[normalized] = ('similar', {
+                **similar['verdict'],
+                'similar_match': {'neighbor_id': similar['neighbor_id'], 'score': similar['score']}
+            })
+            continue
+        heuristic_verdict = heuristic_filter.short_circuit_verdict(message)
+        if heuristic_verdict:
+            verdicts[normalized] = ('heuristics', heuristic_verdict)
+            continue
+        cached_text = verdict_cache.get(cache_key(message)) if verdict_cache is not None else None
+        if cached_text is not None:
+            try:
+                verdicts[normalized] = ('cache', json.loads(cached_text.strip().removeprefix("```json").removesuffix("```")))
+                continue
+            except json.JSONDecodeError:
+                pass
+        pending.append((normalized, message))
+
+    # The rest is packed several messages per prompt, chunks running side by side
+    deadline = Deadline(current_app.config['BATCH_DEADLINE'])
+    chunks = list(chunked(pending, current_app.config['BATCH_ITEMS_PER_PROMPT']))
+    stages = {
+        f"chunk_{number}": thread_manager.generate_content(
+            gemini_model,
+            build_batch_prompt([message for _, message in chunk]),
+            generation_config=batch_generation_config(len(chunk)),
+            timeout=deadline.remaining(minimum=1.0),
+            use_cache=False,
+            lane='api'
+        )
+        for number, chunk in enumerate(chunks)
+    }
+    outcomes = await run_stages(stages, deadline, max_concurrency=current_app.config['BATCH_MAX_CONCURRENCY'])
+
+    for number, chunk in enumerate(chunks):
+        error = None
+        try:
+            response = outcomes[f"chunk_{number}"].result()
+            if response.prompt_feedback and response.prompt_feedback.block_reason:
+                error = f'Bloqueado pela IA: {response.prompt_feedback.block_reason_message or response.prompt_feedback.block_reason}'
+                chunk_verdicts = {}
+            else:
+                chunk_verdicts = parse_batch_response(response.text, len(chunk))
+        except GeminiQueueFullError as e:
+            logger.warning(f"api.verificar_lote: Gemini queue full for chunk {number}: {str(e)}")
+            error = 'Serviço sobrecarregado. Tente novamente em instantes.'
+        except (DeadlineExceededError, GeminiTimeoutError) as e:
+            logger.warning(f"api.verificar_lote: Chunk {number} cut off: {str(e)}")
+            error = 'Tempo limite da análise excedido.'
+        except (ValueError, AttributeError) as e:
+            logger.error(f"api.verificar_lote: Unusable Gemini answer for chunk {number}: {str(e)}")
+            error = f'Erro ao decodificar JSON da IA: {e}'
+        except Exception as e:
+            logger.error(f"api.verificar_lote: Error calling Gemini Thread Manager: {str(e)}", exc_info=True)
+            error = f'Falha na comunicação com IA: {str(e)}'
+
+        for position, (normalized, message) in enumerate(chunk):
+            analysis_data = None if error else chunk_verdicts.get(position)
+            if analysis_data is None:
+                verdicts[normalized] = ('error', {
+                    'error': error or 'A IA não retornou análise para esta mensagem.',
+                    'risk_level': 'Indeterminado'
+                })
+                continue
+            verdicts[normalized] = ('gemini', analysis_data)
+
+    # Like partial image results, verdicts of a batch cut short by the deadline are not reused
+    if not timed_out_stages(outcomes):
+        for normalized, message in pending:
+            source, analysis_data = verdicts[normalized]
+            if source != 'gemini':
+                continue
+            similarity_index.add(message, analysis_data)
+            if verdict_cache is not None:
+                # A later /api/verificar of the same message is a cache hit
+                verdict_cache.set(cache_key(message), json.dumps(analysis_data, ensure_ascii=False))
+
+    results = [None] * len(items)
+    for normalized, positions in groups.items():
+        source, verdict = verdicts[normalized]
+        first_id = items[positions[0]]['id']
+        fields = {key: value for key, value in verdict.items() if key not in BATCH_RESULT_KEYS}
+        for position in positions:
+            results[position] = {**fields, 'id': items[position]['id'], 'source': source}
+            if position != positions[0]:
+                results[position]['duplicate_of'] = first_id
+
+    sources = [source for source, _ in verdicts.values()]
+    stats = {
+        'items': len(items),
+        'unique': len(groups),
+        'duplicates': len(items) - len(groups),
+        **{source: sources.count(source) for source in ('similar', 'heuristics', 'cache', 'gemini', 'error')},
+        'prompts': len(chunks),
+    }
+    count_batch(requests=1, items=stats['items'], duplicates=stats['duplicates'], similar=stats['similar'],
+                heuristics=stats['heuristics'], cache=stats['cache'], gemini=stats['gemini'],
+                prompts=stats['prompts'], errors=stats['error'])
+    logger.info(f"api.verificar_lote: {stats['items']} messages, {stats['unique']} distinct, "
+                f"{stats['gemini']} answered by Gemini in {stats['prompts']} prompts")
+
+    response_data = {'results': results, 'stats': stats}
+    if timed_out_stages(outcomes):
+        response_data['timed_out_stages'] = timed_out_stages(outcomes)
+    return jsonify(response_data)
+
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+# Extra wait for the final event after the analysis deadline
+STREAM_GRACE_SECONDS = 5.0
+
+_stream_loop = None
+_stream_loop_lock = threading.Lock()
+
+def get_stream_loop() -> BackgroundEventLoop:
+    """Return the event loop that runs streamed analyses, starting it on first use."""
+    global _stream_loop
+    if _stream_loop is None:
+        with _stream_loop_lock:
+            if _stream_loop is None:
+                _stream_loop = BackgroundEventLoop("analysis_stream")
+    return _stream_loop
+
+def _ignore_event(event: str, data: Dict):
+    pass
+
+def _stream_format() -> Optional[str]:
+    """'ndjson' or 'sse' when the client asked for a streamed response, else None."""
+    requested = request.args.get('stream')
+    if requested in STREAM_MIMETYPES:
+        return requested
+    best = request.accept_mimetypes.best_match(['application/json', *STREAM_MIMETYPES.values()],
+                                               default='application/json')
+    for name, mimetype in STREAM_MIMETYPES.items():
+        if best == mimetype:
+            return name
+    return None
+
+def _format_event(stream_format: str, event: str, data: Dict) -> str:
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({'event': event, 'data': data}, ensure_ascii=False) + '\n'
+
+def _stream_analysis(stream_format: str, pipeline: Callable[[Callable], Awaitable[Tuple[Dict, int, Dict]]],
+                     deadline: Deadline) -> Response:
+    """Run ``pipeline(emit)`` on the stream loop and relay its events as they happen.
+
+    The last event is always 'final', carrying the HTTP status and result the
+    non-streamed endpoint would have returned.
+    """
+    app = current_app._get_current_object()
+    events = queue.Queue()
+
+    def emit(event: str, data: Dict):
+        events.put((event, data))
+
+    async def _run():
+        with app.app_context():
+            result, status, _ = await pipeline(emit)
+        emit('final', {'status': status, 'result': result})
+
+    future = get_stream_loop().submit(_run())
+    future.add_done_callback(lambda _: events.put(None))
+
+    def generate():
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=deadline.remaining() + STREAM_GRACE_SECONDS)
+                except queue.Empty:
+                    logger.warning("api.analyze_image_api: Streamed analysis produced no final event in time")
+                    item = ('final', {'status': 504, 'result': {'error': 'Tempo limite da análise excedido.'}})
+                if item is None:
+                    if not future.cancelled() and future.exception() is not None:
+                        logger.error(f"api.analyze_image_api: Streamed analysis failed: {str(future.exception())}")
+                        yield _format_event(stream_format, 'final', {
+                            'status': 500, 'result': {'error': f'Erro inesperado no servidor: {str(future.exception())}'}
+                        })
+                    break
+                yield _format_event(stream_format, *item)
+                if item[0] == 'final':
+                    break
+        finally:
+            # Client gone or stream over: stop whatever is still running
+            future.cancel()
+
+    return Response(generate(), mimetype=STREAM_MIMETYPES[stream_format],
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @api.route('/analyze_image', methods=['POST'])
 @limiter.limit("5 per minute")  # Rate limit: 5 requests per minute (more restrictive due to image processing)
 async def analyze_image_api():
+    """Analyze a screenshot: OCR, URL checks and a Gemini verdict.
+
+    With ``?stream=ndjson`` or ``?stream=sse`` (or an Accept header asking
+    for either), stage events are streamed as they complete instead of one
+    JSON document at the end; see analyze_image_data for the events.
+    """
+    # OCR, URL checks and the Gemini call share one end-to-end deadline
+    deadline = Deadline(current_app.config['ANALYSIS_DEADLINE'])
     final_results = {
         'extracted_text': None,
         'text_analysis': {
@@ -146,29 +435,131 @@ async def analyze_image_api():
             final_results['text_analysis']['error'] = 'Nenhum arquivo selecionado'
             return jsonify(final_results), 400
 
-        image_data = file.read()
+        # Oversized bodies were already refused by middleware.reject_oversized_uploads
+        max_bytes = current_app.config['MAX_IMAGE_UPLOAD_BYTES']
+        try:
+            image_data = read_upload(file, max_bytes, current_app.config['ALLOWED_IMAGE_TYPES'])
+        except UploadTooLargeError:
+            final_results['text_analysis']['error'] = f'Arquivo muito grande. Limite máximo é {max_bytes // (1024 * 1024)}MB.'
+            return jsonify(final_results), 413
+        except UnsupportedUploadError as e:
+            final_results['text_analysis']['error'] = f'Formato de arquivo não suportado ({e.detected_type}). Use PNG, JPEG ou WebP.'
+            return jsonify(final_results), 415
         if not image_data:
             final_results['text_analysis']['error'] = 'Arquivo de imagem vazio'
             return jsonify(final_results), 400
 
+        stream_format = _stream_format()
+        if stream_format:
+            return _stream_analysis(stream_format, lambda emit: analyze_image_data(image_data, deadline, emit), deadline)
+        final_results, status, headers = await analyze_image_data(image_data, deadline)
+        return jsonify(final_results), status, headers
+
+    except Exception as e:
+        logger.error(f"api.analyze_image_api: Erro inesperado GERAL: {str(e)}", exc_info=True)
+        if not isinstance(final_results, dict) or not final_results:
+            final_results = {'extracted_text': '[Erro antes da extração]', 'error': str(e)}
+        
+        final_results['text_analysis'] = {
+            'error': f'Erro inesperado no servidor: {str(e)}',
+            'risk_level': 'Indeterminado',
+            'summary': 'Falha crítica no processamento.',
+            'alerts': [],
+            'recommendation': 'Tente novamente mais tarde.'
+        }
+        return jsonify(final_results), 500
+
+async def _check_urls(urls: List[str], emit: Callable[[str, Dict], None]) -> Dict:
+    url_results = await get_analysis_tools().analyze_urls(urls)
+    emit('url_verdicts', url_results)
+    return url_results
+
+async def analyze_image_data(image_data: bytes, deadline: Deadline,
+                             emit: Optional[Callable[[str, Dict], None]] = None) -> Tuple[Dict, int, Dict]:
+    """Run the image analysis pipeline on an uploaded, validated image.
+
+    ``emit(event, data)`` is called as stages complete: 'ocr' with the
+    extracted text, 'urls' with the URLs found in it, 'url_verdicts' with the
+    Safe Browsing results and 'token' with each piece of Gemini's answer as
+    it streams in.
+
+    Returns:
+        Tuple of (result dict, HTTP status, extra headers)
+    """
+    streaming = emit is not None
+    emit = emit or _ignore_event
+    final_results = {
+        'extracted_text': None,
+        'text_analysis': {
+            'risk_level': 'Indeterminado',
+            'summary': None,
+            'alerts': [],
+            'recommendation': None,
+            'error': None
+        }
+    }
+
+    try:
+        # Reuse the result of a byte-identical upload now, of a similar-looking one
+        # (forwarded, re-compressed, resized or just the same layout) once OCR
+        # shows it has the same links
+        image_fingerprint = await asyncio.to_thread(image_hash_index.fingerprint, image_data)
+        similar = image_hash_index.lookup(image_fingerprint)
+        if similar and similar['exact']:
+            logger.info(f"api.analyze_image_api: Identical to image {similar['neighbor_id']}")
+            return {
+                **similar['result'],
+                'similar_image': {'neighbor_id': similar['neighbor_id'], 'distance': similar['distance']}
+            }, 200, {}
+
         logger.info("api.analyze_image_api: Starting OCR")
-        ocr_results = await analysis_tools_instance.analyze_image(image_data)
+        ocr_outcome = (await run_stages({'ocr': get_analysis_tools().analyze_image(image_data)}, deadline))['ocr']
+        try:
+            ocr_results = ocr_outcome.result()
+        except OCRQueueFullError as e:
+            logger.warning(f"api.analyze_image_api: OCR queue full, rejecting request: {str(e)}")
+            final_results['text_analysis']['error'] = 'Serviço sobrecarregado. Tente novamente em instantes.'
+            return final_results, 503, {'Retry-After': str(e.retry_after)}
+        except DeadlineExceededError:
+            logger.warning("api.analyze_image_api: OCR did not finish before the deadline")
+            ocr_results = {'extracted_text': '', 'urls_found': [], 'error': 'Tempo limite da análise excedido durante o OCR'}
+            final_results['timed_out_stages'] = ['ocr']
         
         final_results.update(ocr_results)
-        if 'extracted_text' in final_results and final_results['extracted_text']:
-            formatted_text = final_results['extracted_text'].replace('\n', '<br>')
+        emit('ocr', {'extracted_text': final_results.get('extracted_text'), 'error': ocr_results.get('error')})
+        emit('urls', {'urls_found': ocr_results.get('urls_found', [])})
+        # A near-identical screenshot is only reused if it links to the same hosts
+        if similar and not ocr_results.get('error') and image_hash_index.same_links(similar, ocr_results.get('extracted_text')):
+            logger.info(f"api.analyze_image_api: Near-identical to image {similar['neighbor_id']} (distance={similar['distance']})")
+            return {
+                **similar['result'],
+                'extracted_text': ocr_results.get('extracted_text'),
+                'urls_found': ocr_results.get('urls_found', []),
+                'similar_image': {'neighbor_id': similar['neighbor_id'], 'distance': similar['distance']}
+            }, 200, {}
 
         if ocr_results.get('extracted_text') and not ocr_results.get('error'):
             extracted_text = ocr_results['extracted_text'].strip()
+            gemini_model = None
             if len(extracted_text) > 5:
-                logger.info("api.analyze_image_api: OCRed, analyzing text with Gemini")
-                
-                # Create new model instance for this request
+                # Get the shared model instance
                 gemini_model = create_gemini_model()
                 if not gemini_model:
                     final_results['text_analysis']['error'] = 'Falha ao inicializar modelo Gemini'
-                    return jsonify(final_results), 500
-                
+                    return final_results, 500, {}
+            else:
+                logger.info("api.analyze_image_api: Texto extraído muito curto.")
+                final_results['text_analysis'].update({
+                    'risk_level': 'Não Analisável',
+                    'summary': 'Texto muito curto.'
+                })
+
+            # Safe Browsing lookups run alongside the Gemini call, both bounded by the deadline
+            stages = {}
+            if ocr_results.get('urls_found'):
+                stages['urls'] = _check_urls(ocr_results['urls_found'], emit)
+            if gemini_model is not None:
+                logger.info("api.analyze_image_api: OCRed, analyzing text with Gemini")
                 prompt_for_image_text = f"""
                 Analise o seguinte texto extraído de uma imagem para identificar possíveis golpes ou fraudes.
                 Texto: --- {extracted_text} ---
@@ -177,13 +568,27 @@ async def analyze_image_api():
                 Apenas o JSON como resposta.
                 """
                 logger.debug(f"api.analyze_image_api: Sending prompt: {prompt_for_image_text[:150]}...")
-                
+                stages['gemini'] = get_gemini_thread_manager().generate_content(
+                    gemini_model,
+                    prompt_for_image_text,
+                    generation_config={"temperature": 0.7, "max_output_tokens": 1024},
+                    timeout=deadline.remaining(minimum=1.0),
+                    lane='api',
+                    on_text=(lambda text: emit('token', {'text': text})) if streaming else None
+                )
+            outcomes = await run_stages(stages, deadline)
+            if timed_out_stages(outcomes):
+                final_results['timed_out_stages'] = timed_out_stages(outcomes)
+
+            if 'urls' in outcomes:
+                try:
+                    final_results.update(outcomes['urls'].result())
+                except Exception as e:
+                    logger.warning(f"api.analyze_image_api: URL checks incomplete: {str(e)}")
+
+            if 'gemini' in outcomes:
                 try:
-                    response = await gemini_thread_manager.generate_content(
-                        gemini_model,
-                        prompt_for_image_text,
-                        generation_config={"temperature": 0.7, "max_output_tokens": 1024}
-                    )
+                    response = outcomes['gemini'].result()
                     logger.debug("api.analyze_image_api: Received response.")
 
                     if response.prompt_feedback and response.prompt_feedback.block_reason:
@@ -203,6 +608,16 @@ async def analyze_image_api():
                         logger.error("api.analyze_image_api: Gemini returned empty text response.")
                         final_results['text_analysis']['error'] = 'Resposta vazia da IA'
 
+                except GeminiQueueFullError as e:
+                    logger.warning(f"api.analyze_image_api: Gemini queue full, rejecting request: {str(e)}")
+                    final_results['text_analysis']['error'] = 'Serviço sobrecarregado. Tente novamente em instantes.'
+                    return final_results, 503, {'Retry-After': str(e.retry_after)}
+                except (DeadlineExceededError, GeminiTimeoutError) as e:
+                    logger.warning(f"api.analyze_image_api: Gemini analysis cut off: {str(e)}")
+                    final_results['text_analysis'].update({
+                        'error': 'Tempo limite da análise excedido.',
+                        'summary': 'A análise da IA não terminou a tempo.'
+                    })
                 except RuntimeError as e:
                     logger.error(f"api.analyze_image_api: Runtime error from Gemini Thread Manager: {str(e)}", exc_info=True)
                     final_results['text_analysis'].update({
@@ -215,12 +630,6 @@ async def analyze_image_api():
                         'error': f'Falha na comunicação com IA: {str(e)}',
                         'summary': 'Não foi possível obter análise da IA.'
                     })
-            else:
-                logger.info("api.analyze_image_api: Texto extraído muito curto.")
-                final_results['text_analysis'].update({
-                    'risk_level': 'Não Analisável',
-                    'summary': 'Texto muito curto.'
-                })
         else:
             error_msg = ocr_results.get('error', 'Texto não extraído')
             logger.warning(f"api.analyze_image_api: Sem texto do OCR: {error_msg}")
@@ -243,6 +652,14 @@ async def analyze_image_api():
             'alerts': [],
             'recommendation': 'Tente novamente mais tarde.'
         }
-        return jsonify(final_results), 500
+        return final_results, 500, {}
 
-    return jsonify(final_results) 
\ No newline at end of file
+    # Results cut short by the deadline are answered but never reused
+    if (not final_results.get('error') and not final_results['text_analysis'].get('error')
+            and not final_results.get('timed_out_stages')):
+        image_hash_index.add(image_fingerprint, {
+            'extracted_text': final_results.get('extracted_text'),
+            'urls_found': final_results.get('urls_found', []),
+            'text_analysis': final_results['text_analysis'],
+        })
+    return final_results, 200, {} 
\ No newline at end of file
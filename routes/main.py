@@ -3,14 +3,17 @@ from flask import Blueprint, render_template, request, current_app, redirect, ur
 import structlog
 import json
 import asyncio
-from utils.analysis_tools import AnalysisTools
-from routes.api import gemini_thread_manager, create_gemini_model
+from utils.analysis_tools import get_analysis_tools
+from routes.api import get_gemini_thread_manager, create_gemini_model
+from extensions import image_hash_index
+from utils.uploads import read_upload, UploadTooLargeError, UnsupportedUploadError
+from utils.gemini_thread import GeminiQueueFullError
+from utils.ocr_pool import OCRQueueFullError
 from flask_wtf.csrf import validate_csrf, ValidationError as CSRFValidationError
 from werkzeug.exceptions import Forbidden
 
 logger = structlog.get_logger()
 main = Blueprint('main', __name__)
-analysis_tools = AnalysisTools()
 
 @main.route('/')
 def index():
@@ -96,10 +99,11 @@ def process_analysis():
 
                 # Run Gemini analysis synchronously
                 try:
-                    response = asyncio.run(gemini_thread_manager.generate_content(
+                    response = asyncio.run(get_gemini_thread_manager().generate_content(
                         gemini_model,
                         prompt,
-                        generation_config={"temperature": 0.7, "max_output_tokens": 2048}
+                        generation_config={"temperature": 0.7, "max_output_tokens": 2048},
+                        lane='form'
                     ))
                     
                     if response.prompt_feedback and response.prompt_feedback.block_reason:
@@ -110,6 +114,9 @@ def process_analysis():
                     else:
                         analysis['text_analysis']['error'] = 'Resposta vazia da IA'
                     
+                except GeminiQueueFullError as e:
+                    logger.warning(f"process_analysis: Gemini queue full: {e}")
+                    analysis['text_analysis']['error'] = 'Serviço sobrecarregado. Tente novamente em instantes.'
                 except json.JSONDecodeError as e:
                     logger.error(f"process_analysis: JSON decode error: {e}")
                     analysis['text_analysis']['error'] = 'Erro ao processar resposta da IA'
@@ -126,25 +133,40 @@ def process_analysis():
 
                 submission['input_type'] = 'Imagem'
 
-                # Validate file type
-                if not file.content_type in ['image/jpeg', 'image/png', 'image/webp']:
+                # Validate file type (sniffed from the first bytes) and size, then read once;
+                # oversized bodies were already refused by middleware.reject_oversized_uploads
+                max_bytes = current_app.config['MAX_IMAGE_UPLOAD_BYTES']
+                try:
+                    image_data = read_upload(file, max_bytes, current_app.config['ALLOWED_IMAGE_TYPES'])
+                except UnsupportedUploadError:
                     flash('Formato de arquivo não suportado. Use PNG, JPEG ou WebP.', 'error')
                     return redirect(url_for('main.index'))
+                except UploadTooLargeError:
+                    flash(f'Arquivo muito grande. Limite máximo é {max_bytes // (1024 * 1024)}MB.', 'error')
+                    return redirect(url_for('main.index'))
 
-                image_data = file.read()
                 if not image_data:
                     flash('Arquivo de imagem vazio.', 'error')
                     return redirect(url_for('main.index'))
 
-                # Check file size (5MB limit)
-                if len(image_data) > 5 * 1024 * 1024:
-                    flash('Arquivo muito grande. Limite máximo é 5MB.', 'error')
-                    return redirect(url_for('main.index'))
+                # Reuse the result of a byte-identical upload; similar-looking ones wait for OCR
+                image_fingerprint = image_hash_index.fingerprint(image_data)
+                similar = image_hash_index.lookup(image_fingerprint)
+                if similar and similar['exact']:
+                    logger.info(f"process_analysis: Identical to image {similar['neighbor_id']}")
+                    submission['extracted_text'] = similar['result']['extracted_text']
+                    analysis['text_analysis'] = similar['result']['text_analysis']
+                    return render_template('results.html', submission=submission, analysis=analysis)
 
                 # Run OCR analysis synchronously
                 try:
-                    ocr_results = asyncio.run(analysis_tools.analyze_image(image_data))
+                    ocr_results = asyncio.run(get_analysis_tools().analyze_image(image_data))
                     submission['extracted_text'] = ocr_results.get('extracted_text', '')
+                    # A near-identical screenshot is only reused if it links to the same hosts
+                    if similar and not ocr_results.get('error') and image_hash_index.same_links(similar, submission['extracted_text']):
+                        logger.info(f"process_analysis: Near-identical to image {similar['neighbor_id']} (distance={similar['distance']})")
+                        analysis['text_analysis'] = similar['result']['text_analysis']
+                        return render_template('results.html', submission=submission, analysis=analysis)
 
                     if ocr_results.get('extracted_text') and not ocr_results.get('error'):
                         extracted_text = ocr_results['extracted_text'].strip()
@@ -170,10 +192,11 @@ def process_analysis():
                             """
 
                             # Run Gemini analysis synchronously
-                            response = asyncio.run(gemini_thread_manager.generate_content(
+                            response = asyncio.run(get_gemini_thread_manager().generate_content(
                                 gemini_model,
                                 prompt,
-                                generation_config={"temperature": 0.7, "max_output_tokens": 1024}
+                                generation_config={"temperature": 0.7, "max_output_tokens": 1024},
+                                lane='form'
                             ))
 
                             if response.prompt_feedback and response.prompt_feedback.block_reason:
@@ -181,6 +204,11 @@ def process_analysis():
                             elif response.text:
                                 cleaned_response = response.text.strip().removeprefix("```json").removesuffix("```").strip()
                                 analysis['text_analysis'] = json.loads(cleaned_response)
+                                image_hash_index.add(image_fingerprint, {
+                                    'extracted_text': submission['extracted_text'],
+                                    'urls_found': ocr_results.get('urls_found', []),
+                                    'text_analysis': analysis['text_analysis'],
+                                })
                             else:
                                 analysis['text_analysis']['error'] = 'Resposta vazia da IA'
                         else:
@@ -194,6 +222,9 @@ def process_analysis():
                             'summary': f'Falha na extração de texto: {ocr_results.get("error", "Erro desconhecido")}'
                         })
 
+                except (GeminiQueueFullError, OCRQueueFullError) as e:
+                    logger.warning(f"process_analysis: Queue full: {e}")
+                    analysis['text_analysis']['error'] = 'Serviço sobrecarregado. Tente novamente em instantes.'
                 except Exception as e:
                     logger.error(f"process_analysis: Image analysis error: {e}", exc_info=True)
                     analysis['text_analysis']['error'] = f'Erro no processamento da imagem: {str(e)}'
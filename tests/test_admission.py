@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+from flask import Flask
+
+import routes.api as api
+from utils.admission import AdmissionController, AdmissionQueueFullError, AdmissionTimeoutError
+from utils.gemini_thread import GeminiQueueFullError
+
+
+def test_admits_up_to_slots_then_queues_then_rejects():
+    async def run():
+        admission = AdmissionController(slots=1, queue_size=1, name='test')
+        assert await admission.acquire() == 0.0
+        waiter = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionQueueFullError) as full:
+            await admission.acquire()
+        assert full.value.retry_after >= 1
+        admission.release(hold_time=0.5)
+        assert await waiter >= 0.0
+        admission.release()
+        return admission.get_metrics()
+
+    metrics = asyncio.run(run())
+    assert metrics['test_admitted'] == 2
+    assert metrics['test_rejected'] == 1
+    assert metrics['test_active'] == 0 and metrics['test_queued'] == 0
+    assert metrics['test_max_queue_depth'] == 1
+
+
+def test_higher_priority_lane_is_served_first():
+    async def run():
+        admission = AdmissionController(slots=1, queue_size=10, lanes=('form', 'api'))
+        await admission.acquire()
+        order = []
+
+        async def wait(lane, label):
+            await admission.acquire(lane=lane)
+            order.append(label)
+            admission.release()
+
+        tasks = [asyncio.ensure_future(wait(lane, label)) for lane, label in
+                 (('api', 'api-1'), ('api', 'api-2'), ('form', 'form-1'), ('unknown', 'other'))]
+        await asyncio.sleep(0)
+        admission.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ['form-1', 'api-1', 'api-2', 'other']
+
+
+def test_queue_timeout_and_cancellation_leave_no_waiters():
+    async def run():
+        admission = AdmissionController(slots=1, queue_size=5, name='test')
+        await admission.acquire()
+        with pytest.raises(AdmissionTimeoutError):
+            await admission.acquire(timeout=0.05)
+        cancelled = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        admission.release()
+        # The slot is free again, not handed to a waiter that gave up
+        assert await admission.acquire(timeout=0.05) == 0.0
+        return admission.get_metrics()
+
+    metrics = asyncio.run(run())
+    assert metrics['test_queue_timeouts'] == 1
+    assert metrics['test_queued'] == 0 and metrics['test_active'] == 1
+
+
+def test_release_wakes_waiters_on_other_threads():
+    admission = AdmissionController(slots=1, queue_size=5)
+    asyncio.run(admission.acquire())
+    results = []
+
+    def worker():
+        async def run():
+            results.append(await admission.acquire(timeout=5))
+            admission.release()
+        asyncio.run(run())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while admission.get_metrics()['admission_queued'] < 3:
+        time.sleep(0.001)
+    admission.release()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 3
+    assert admission.get_metrics()['admission_active'] == 0
+
+
+def test_full_gemini_queue_answers_503_with_retry_after(monkeypatch):
+    class FullManager:
+        async def generate_content(self, *args, **kwargs):
+            raise GeminiQueueFullError(retry_after=7)
+
+    app = Flask(__name__)
+    app.config.update(GEMINI_API_KEY='key', RATELIMIT_ENABLED=False)
+    app.register_blueprint(api.api, url_prefix='/api')
+    app.gemini_thread_manager = FullManager()
+    monkeypatch.setattr(api, 'create_gemini_model', lambda: object())
+    monkeypatch.setattr(api, 'heuristic_filter', types.SimpleNamespace(short_circuit_verdict=lambda message: None))
+    response = app.test_client().post('/api/verificar', json={'message': 'mensagem qualquer para verificar'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
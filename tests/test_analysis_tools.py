@@ -0,0 +1,131 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+import utils.analysis_tools as analysis_tools
+from utils.ocr_pool import OCREngineError, OCRUnavailableError
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    # Neither the pytesseract package nor the binary is needed on the tesserocr path
+    monkeypatch.setitem(sys.modules, 'pytesseract', None)
+    tools = analysis_tools.AnalysisTools()
+    tools._ocr_lang = 'por+eng'
+    return tools
+
+
+def test_analyze_image_without_pytesseract(tools, monkeypatch):
+    monkeypatch.setattr(analysis_tools, 'run_ocr', lambda *args: ('  Pague em bit.ly/pix  ', 'tesserocr'))
+    results = asyncio.run(tools.analyze_image(b'image'))
+    assert results == {'extracted_text': 'Pague em bit.ly/pix', 'urls_found': ['http://bit.ly/pix'], 'error': None}
+    assert tools.metrics['ocr_engine_calls'] == 1
+    assert tools.metrics['ocr_subprocess_spawns'] == 0
+
+
+@pytest.mark.parametrize('error, marker', [
+    (OCRUnavailableError('tesseract not found'), 'Tesseract não encontrado'),
+    (OCREngineError('Failed loading language'), 'Failed loading language'),
+])
+def test_analyze_image_reports_ocr_errors(tools, monkeypatch, error, marker):
+    def fail(*args):
+        raise error
+    monkeypatch.setattr(analysis_tools, 'run_ocr', fail)
+    results = asyncio.run(tools.analyze_image(b'image'))
+    assert results['error']
+    assert marker in results['extracted_text']
+
+
+def test_languages_from_tesserocr_without_pytesseract(monkeypatch):
+    tesserocr = types.SimpleNamespace(get_languages=lambda: ('/usr/share/tessdata/', ['eng', 'por']))
+    monkeypatch.setitem(sys.modules, 'pytesseract', None)
+    monkeypatch.setitem(sys.modules, 'tesserocr', tesserocr)
+    monkeypatch.setattr(analysis_tools, '_tesseract_languages', None)
+    assert analysis_tools.get_tesseract_languages() == ['eng', 'por']
+    assert analysis_tools.choose_ocr_lang(analysis_tools.get_tesseract_languages()) == 'por+eng'
+
+
+class FakePytesseract(types.ModuleType):
+    """pytesseract stand-in counting language probes (each one is a tesseract subprocess)."""
+
+    class TesseractError(Exception):
+        pass
+
+    def __init__(self, languages):
+        super().__init__('pytesseract')
+        self.languages = languages
+        self.probes = 0
+
+    def get_languages(self, config=''):
+        self.probes += 1
+        if self.languages is None:
+            raise self.TesseractError('tessdata not found')
+        return list(self.languages)
+
+
+@pytest.fixture
+def fake_pytesseract(monkeypatch):
+    fake = FakePytesseract(['eng', 'osd', 'por'])
+    monkeypatch.setitem(sys.modules, 'pytesseract', fake)
+    monkeypatch.setattr(analysis_tools, '_tesseract_languages', None)
+    monkeypatch.setattr(analysis_tools, '_tesseract_language_probes', 0)
+    return fake
+
+
+def test_languages_are_discovered_once(fake_pytesseract):
+    for _ in range(5):
+        assert analysis_tools.get_tesseract_languages() == ['eng', 'osd', 'por']
+    assert fake_pytesseract.probes == 1
+    assert analysis_tools._tesseract_language_probes == 1
+
+
+def test_failed_discovery_is_not_cached(fake_pytesseract):
+    fake_pytesseract.languages = None
+    assert analysis_tools.get_tesseract_languages() is None
+    fake_pytesseract.languages = ['por']
+    assert analysis_tools.get_tesseract_languages() == ['por']
+    assert fake_pytesseract.probes == 2
+
+
+def test_refresh_rediscovers_and_resets_the_ocr_language(fake_pytesseract, monkeypatch):
+    tools = analysis_tools.AnalysisTools()
+    monkeypatch.setattr(analysis_tools, 'get_analysis_tools', lambda: tools)
+    assert tools.ocr_lang == 'por+eng'
+    fake_pytesseract.languages = ['eng']
+    assert tools.ocr_lang == 'por+eng'
+    assert analysis_tools.refresh_tesseract_languages() == ['eng']
+    assert tools.ocr_lang == 'eng'
+    assert fake_pytesseract.probes == 2
+
+
+def test_ocr_language_falls_back_without_caching(fake_pytesseract):
+    tools = analysis_tools.AnalysisTools()
+    fake_pytesseract.languages = None
+    assert tools.ocr_lang == 'eng'
+    fake_pytesseract.languages = ['por', 'eng']
+    assert tools.ocr_lang == 'por+eng'
+    assert tools.ocr_lang == 'por+eng'
+    assert fake_pytesseract.probes == 2
+
+
+@pytest.mark.parametrize('languages, expected', [
+    (['eng', 'por'], 'por+eng'),
+    (['por', 'spa'], 'por'),
+    (['eng', 'spa'], 'eng'),
+    (['spa'], 'eng'),
+    (None, 'eng'),
+])
+def test_choose_ocr_lang(languages, expected):
+    assert analysis_tools.choose_ocr_lang(languages) == expected
+
+
+def test_metrics_count_spawns_per_request(fake_pytesseract):
+    tools = analysis_tools.AnalysisTools()
+    analysis_tools.get_tesseract_languages()
+    tools.metrics.update(ocr_requests=4, ocr_subprocess_spawns=4)
+    metrics = tools.get_metrics()
+    assert metrics['tesseract_language_probes'] == 1
+    assert metrics['tesseract_subprocess_spawns'] == 5
+    assert metrics['tesseract_spawns_per_request'] == 1.25
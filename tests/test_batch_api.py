@@ -0,0 +1,73 @@
+import asyncio
+import json
+import re
+import types
+
+import pytest
+from flask import Flask
+
+import routes.api as api
+from utils.caching import VerdictCache
+from utils.similarity import SimilarityIndex
+
+
+class FakeThreadManager:
+    """Answers packed prompts; messages containing 'lento' make their chunk overrun."""
+
+    def __init__(self):
+        self.verdict_cache = VerdictCache()
+        self.prompts = 0
+
+    async def generate_content(self, model, prompt, **kwargs):
+        self.prompts += 1
+        payload = json.loads(re.search(r'(\[\{"id".*?\}\])\n', prompt).group(1))
+        if any('lento' in item['message'] for item in payload):
+            await asyncio.sleep(5)
+        answer = [{'id': item['id'], 'risk_level': 'Alto', 'summary': item['message']} for item in payload]
+        return types.SimpleNamespace(prompt_feedback=None, text=json.dumps(answer))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(
+        GEMINI_API_KEY='key', BATCH_MAX_BYTES=1 << 20, BATCH_MAX_ITEMS=100, BATCH_ITEMS_PER_PROMPT=2,
+        BATCH_DEADLINE=0.5, BATCH_MAX_CONCURRENCY=4, RATELIMIT_ENABLED=False,
+    )
+    app.register_blueprint(api.api, url_prefix='/api')
+    app.gemini_thread_manager = FakeThreadManager()
+    monkeypatch.setattr(api, 'create_gemini_model', lambda: types.SimpleNamespace(model_name='m'))
+    monkeypatch.setattr(api, 'similarity_index', SimilarityIndex())
+    monkeypatch.setattr(api, 'heuristic_filter', types.SimpleNamespace(short_circuit_verdict=lambda message: None))
+    return app.test_client()
+
+
+def test_complete_batch_is_reused(client):
+    messages = ['mensagem um sobre pix', 'mensagem dois sobre boleto', 'mensagem três sobre entrega']
+    body = client.post('/api/verificar/batch', json=messages).get_json()
+    assert [result['source'] for result in body['results']] == ['gemini'] * 3
+    assert 'timed_out_stages' not in body
+
+    body = client.post('/api/verificar/batch', json=messages).get_json()
+    assert {result['source'] for result in body['results']} <= {'similar', 'cache'}
+
+
+def test_timed_out_batch_is_not_reused(client):
+    messages = ['mensagem um sobre pix', 'mensagem dois sobre boleto', 'mensagem lento sobre entrega']
+    body = client.post('/api/verificar/batch', json=messages).get_json()
+    assert [result['source'] for result in body['results']] == ['gemini', 'gemini', 'error']
+    assert body['timed_out_stages'] == ['chunk_1']
+
+    body = client.post('/api/verificar/batch', json=messages[:2]).get_json()
+    assert [result['source'] for result in body['results']] == ['gemini', 'gemini']
+
+
+def test_verdict_fields_do_not_override_the_item(client, monkeypatch):
+    verdict = {'risk_level': 'Alto', 'id': 'golpe-1', 'source': 'gemini', 'duplicate_of': 'x'}
+    monkeypatch.setattr(api, 'heuristic_filter', types.SimpleNamespace(short_circuit_verdict=lambda message: verdict))
+    body = client.post('/api/verificar/batch', json=[{'id': 'a', 'message': 'pix agora'},
+                                                     {'id': 'b', 'message': 'pix agora'}]).get_json()
+    assert body['results'] == [
+        {'id': 'a', 'source': 'heuristics', 'risk_level': 'Alto'},
+        {'id': 'b', 'source': 'heuristics', 'risk_level': 'Alto', 'duplicate_of': 'a'},
+    ]
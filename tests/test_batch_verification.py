@@ -0,0 +1,96 @@
+import pytest
+
+from utils.batch_verification import (
+    MAX_OUTPUT_TOKENS,
+    BatchRequestError,
+    batch_generation_config,
+    build_batch_prompt,
+    chunked,
+    group_duplicates,
+    parse_batch_body,
+    parse_batch_response,
+)
+
+
+def test_parse_json_array_of_strings_and_objects():
+    body = '["  oi  ", {"id": "abc", "message": "pix"}, {"message": "sem id"}]'.encode()
+    assert parse_batch_body(body, 'application/json', 10) == [
+        {'id': '0', 'message': 'oi'},
+        {'id': 'abc', 'message': 'pix'},
+        {'id': '2', 'message': 'sem id'},
+    ]
+
+
+def test_parse_messages_object():
+    body = b'{"messages": ["a", "b"]}'
+    assert [item['message'] for item in parse_batch_body(body, 'application/json', 10)] == ['a', 'b']
+
+
+def test_parse_ndjson_skips_blank_lines():
+    body = b'"a"\n\n{"id": 7, "message": "b"}\n'
+    assert parse_batch_body(body, 'application/x-ndjson', 10) == [
+        {'id': '0', 'message': 'a'},
+        {'id': '7', 'message': 'b'},
+    ]
+
+
+@pytest.mark.parametrize('body, mimetype, fragment', [
+    (b'\xff\xfe', 'application/json', 'UTF-8'),
+    (b'[1,', 'application/json', 'JSON inválido'),
+    (b'"a"\n{', 'application/x-ndjson', 'JSON inválido'),
+    (b'{"mensagens": []}', 'application/json', 'array'),
+    (b'[]', 'application/json', 'Nenhuma'),
+    (b'["a", "b", "c"]', 'application/json', 'Máximo de 2'),
+    (b'[42]', 'application/json', 'Item 0'),
+    (b'[{"message": 42}]', 'application/json', "'message'"),
+])
+def test_malformed_bodies_are_rejected(body, mimetype, fragment):
+    with pytest.raises(BatchRequestError) as excinfo:
+        parse_batch_body(body, mimetype, 2)
+    assert fragment in str(excinfo.value)
+
+
+def test_group_duplicates_by_normalized_text():
+    items = [{'message': 'Olá  Mundo'}, {'message': 'outra'}, {'message': 'olá mundo'}]
+    groups = group_duplicates(items)
+    assert sorted(groups.values()) == [[0, 2], [1]]
+
+
+def test_chunked():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunked([], 3)) == []
+
+
+def test_prompt_numbers_messages_from_one():
+    prompt = build_batch_prompt(['primeira', 'segunda "aspas"'])
+    assert '{"id": "1", "message": "primeira"}' in prompt
+    assert '"id": "2", "message": "segunda \\"aspas\\""' in prompt
+
+
+def test_generation_config_scales_output_budget():
+    assert batch_generation_config(2)['max_output_tokens'] == 800
+    assert batch_generation_config(1000)['max_output_tokens'] == MAX_OUTPUT_TOKENS
+
+
+def test_parse_response_by_position():
+    text = '''```json
+    [{"id": "2", "risk_level": "Alto"}, {"id": " 1 ", "risk_level": "Baixo"},
+     {"id": "1", "risk_level": "Médio"}, {"id": "9"}, {"id": "x"}, "lixo"]
+    ```'''
+    assert parse_batch_response(text, 2) == {
+        0: {'risk_level': 'Baixo'},
+        1: {'risk_level': 'Alto'},
+    }
+
+
+def test_parse_response_results_object_and_missing_items():
+    assert parse_batch_response('{"results": [{"id": "1", "risk_level": "Baixo"}]}', 3) == {
+        0: {'risk_level': 'Baixo'}
+    }
+
+
+def test_parse_response_rejects_non_arrays():
+    with pytest.raises(ValueError):
+        parse_batch_response('{"risk_level": "Baixo"}', 1)
+    with pytest.raises(ValueError):
+        parse_batch_response('não é json', 1)
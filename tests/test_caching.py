@@ -0,0 +1,199 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from utils.caching import LocalCacheBackend, UrlVerdictCache, VerdictCache, make_cache_key, normalize_message
+from utils.gemini_thread import CachedGeminiResponse, GeminiThreadManager
+from utils.safe_browsing import ThreatLookup
+
+
+def test_normalize_message_ignores_case_emoji_and_spacing():
+    original = 'URGENTE!!  Seu PIX foi   bloqueado 🚨👍🏽\nClique: bit.ly/x'
+    forwarded = 'urgente!! seu pix foi bloqueado clique: BIT.LY/X'
+    assert normalize_message(original) == normalize_message(forwarded.replace('BIT.LY/X', 'bit.ly/x'))
+    assert normalize_message('Ｐｉｘ') == 'pix'
+    assert normalize_message('') == ''
+    assert normalize_message(None) == ''
+
+
+def test_cache_key_depends_on_text_model_and_config():
+    key = make_cache_key('Olá  Mundo', 'gemini-1.5-flash', {'temperature': 0.7, 'max_output_tokens': 10})
+    assert key == make_cache_key('olá mundo', 'gemini-1.5-flash', {'max_output_tokens': 10, 'temperature': 0.7})
+    assert key.startswith('verdict:')
+    assert key != make_cache_key('olá mundo', 'gemini-1.5-pro', {'temperature': 0.7, 'max_output_tokens': 10})
+    assert key != make_cache_key('olá mundo', 'gemini-1.5-flash', {'temperature': 0.2, 'max_output_tokens': 10})
+    assert key != make_cache_key('olá mundo!', 'gemini-1.5-flash', {'temperature': 0.7, 'max_output_tokens': 10})
+
+
+def test_local_backend_evicts_least_recently_used():
+    backend = LocalCacheBackend(max_bytes=25)
+    backend.set('a', 'x' * 9)
+    backend.set('b', 'x' * 9)
+    assert backend.get('a') is not None
+    backend.set('c', 'x' * 9)
+    assert backend.get('b') is None
+    assert backend.get('a') is not None and backend.get('c') is not None
+    assert backend.stats()['evictions'] == 1
+    assert not backend.set('big', 'x' * 100)
+
+
+def test_local_backend_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    backend = LocalCacheBackend(default_timeout=10)
+    backend.set('a', 'v')
+    backend.set('forever', 'v', timeout=0)
+    now[0] += 11
+    assert backend.get('a') is None
+    assert backend.get('forever') == 'v'
+    assert backend.stats()['expirations'] == 1
+
+
+def test_verdict_cache_counts_and_survives_backend_errors():
+    cache = VerdictCache()
+    key = cache.key_for('mensagem', 'm')
+    assert cache.get(key) is None
+    cache.set(key, '{"risk_level": "Alto"}')
+    cache.set(key, '')
+    assert cache.get(key) == '{"risk_level": "Alto"}'
+    metrics = cache.get_metrics()
+    assert (metrics['cache_hits'], metrics['cache_misses'], metrics['cache_stores']) == (1, 1, 1)
+    assert metrics['cache_hit_rate'] == 0.5
+
+    class Broken:
+        def get(self, key):
+            raise ConnectionError('redis down')
+        set = get
+    cache.backend = Broken()
+    assert cache.get(key) is None
+    cache.set(key, 'v')
+    assert cache.get_metrics()['cache_errors'] == 2
+
+
+def test_disabled_verdict_cache():
+    cache = VerdictCache(enabled=False)
+    cache.set('k', 'v')
+    assert cache.get('k') is None
+
+
+class FakeModel:
+    model_name = 'fake'
+    _custom_safety_settings = {'test': 'none'}
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        return types.SimpleNamespace(prompt_feedback=None, text=f'{{"prompt": "{prompt}"}}')
+
+
+@pytest.fixture
+def manager():
+    manager = GeminiThreadManager(max_workers=2, queue_size=4, verdict_cache=VerdictCache())
+    yield manager
+    manager.shutdown()
+
+
+def test_manager_serves_repeated_prompts_from_cache(manager):
+    model = FakeModel()
+
+    async def run():
+        first = await manager.generate_content(model, 'Seu PIX foi bloqueado')
+        second = await manager.generate_content(model, 'seu pix foi  bloqueado 🚨')
+        uncached = await manager.generate_content(model, 'Seu PIX foi bloqueado', use_cache=False)
+        return first, second, uncached
+
+    first, second, uncached = asyncio.run(run())
+    assert isinstance(second, CachedGeminiResponse) and second.text == first.text
+    assert not isinstance(uncached, CachedGeminiResponse)
+    assert model.calls == 2
+
+
+class RecordingBackend(LocalCacheBackend):
+    def __init__(self):
+        super().__init__()
+        self.timeouts = {}
+
+    def set(self, key, value, timeout=None):
+        self.timeouts[key] = timeout
+        return super().set(key, value, timeout)
+
+
+def phishing_match(url, duration='600s'):
+    return {'threatType': 'SOCIAL_ENGINEERING', 'threat': {'url': url}, 'cacheDuration': duration}
+
+
+def test_url_cache_hits_on_canonical_form():
+    cache = UrlVerdictCache()
+    cache.store_many({'http://Evil.example/login': ThreatLookup([phishing_match('http://Evil.example/login')])})
+    results = cache.get_many(['http://evil.example:80/login#top', 'http://evil.example/other'])
+    assert list(results) == ['http://evil.example:80/login#top']
+    # Matches name the URL that was asked about
+    assert results['http://evil.example:80/login#top'].matches[0]['threat'] == {
+        'url': 'http://evil.example:80/login#top'
+    }
+    metrics = cache.get_metrics()
+    assert (metrics['url_cache_hits'], metrics['url_cache_misses']) == (1, 1)
+    assert metrics['url_cache_hit_rate'] == 0.5
+
+
+def test_url_cache_host_root_match_covers_the_host():
+    cache = UrlVerdictCache()
+    cache.store_many({'http://evil.example/': ThreatLookup([phishing_match('http://evil.example/')])})
+    results = cache.get_many(['https://evil.example/any/path?x=1'])
+    assert results['https://evil.example/any/path?x=1'].matches[0]['threatType'] == 'SOCIAL_ENGINEERING'
+    assert cache.get_metrics()['url_cache_host_hits'] == 1
+
+
+def test_url_cache_clean_result_is_not_a_host_verdict():
+    cache = UrlVerdictCache()
+    cache.store_many({'http://ok.example/': ThreatLookup([])})
+    assert cache.get_many(['http://ok.example/'])['http://ok.example/'].matches == []
+    assert cache.get_many(['http://ok.example/page']) == {}
+
+
+def test_url_cache_ttls_follow_the_api_and_are_capped():
+    backend = RecordingBackend()
+    cache = UrlVerdictCache(backend=backend, negative_ttl=300, max_ttl=3600)
+    cache.store_many({
+        'http://a.example/x': ThreatLookup([phishing_match('http://a.example/x', '600s'),
+                                            phishing_match('http://a.example/x', '90s')]),
+        'http://b.example/x': ThreatLookup([phishing_match('http://b.example/x', '86400s')]),
+        'http://c.example/x': ThreatLookup([], None, 45.0),
+        'http://d.example/x': ThreatLookup([]),
+        'http://e.example/x': ThreatLookup([], None, 0.0),
+    })
+    assert sorted(backend.timeouts.values()) == [45, 90, 300, 3600]
+    # A zero duration means "do not cache", not "never expire"
+    assert cache.get_many(['http://e.example/x']) == {}
+
+
+def test_url_cache_never_stores_errors_or_unparseable_urls():
+    cache = UrlVerdictCache()
+    cache.store_many({
+        'http://a.example/': ThreatLookup([], ConnectionError('timeout')),
+        'http:///x': ThreatLookup([]),
+    })
+    assert cache.get_many(['http://a.example/', 'http:///x']) == {}
+    assert cache.get_metrics()['url_cache_stores'] == 0
+
+
+def test_url_cache_survives_backend_errors_and_can_be_disabled():
+    class Broken:
+        def get(self, key):
+            raise ConnectionError('redis down')
+
+        def set(self, key, value, timeout=None):
+            raise ConnectionError('redis down')
+
+    cache = UrlVerdictCache(backend=Broken())
+    cache.store_many({'http://a.example/x': ThreatLookup([])})
+    assert cache.get_many(['http://a.example/x']) == {}
+    assert cache.get_metrics()['url_cache_errors'] == 3
+
+    disabled = UrlVerdictCache(enabled=False)
+    disabled.store_many({'http://a.example/x': ThreatLookup([])})
+    assert disabled.get_many(['http://a.example/x']) == {}
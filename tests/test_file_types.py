@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from utils.file_types import MimeDetectionError, MimeDetector, detect_signature, get_mime_detector
+
+
+@pytest.mark.parametrize('head, expected', [
+    (b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR', 'image/png'),
+    (b'\xff\xd8\xff\xe0\0\x10JFIF', 'image/jpeg'),
+    (b'RIFF\x24\0\0\0WEBPVP8 ', 'image/webp'),
+    (b'%PDF-1.7\n%\xe2\xe3', 'application/pdf'),
+    ('Você ganhou um prêmio, acesse bit.ly/x\n'.encode(), 'text/plain'),
+    ('ção'.encode()[:-1], 'text/plain'),  # head cut inside a character
+    (b'<html><body>x</body></html>', None),
+    (b'{"a": 1}', None),
+    (b'RIFF\x24\0\0\0WAVEfmt ', None),
+    (b'\0\x01\x02binary', None),
+    (b'\xff\xfe\xfd not utf-8 at all, far from the end of the head', None),
+    (b'   ', None),
+])
+def test_detect_signature(head, expected):
+    assert detect_signature(head) == expected
+
+
+def test_fast_path_skips_libmagic():
+    detector = MimeDetector()
+    assert detector.detect(b'\x89PNG\r\n\x1a\n') == 'image/png'
+    assert detector.get_metrics() == {
+        'mime_detections': 1,
+        'mime_fast_path_hits': 1,
+        'mime_libmagic_calls': 0,
+        'mime_libmagic_handles': 0,
+        'mime_libmagic_errors': 0,
+    }
+
+
+def test_other_types_fall_back_to_libmagic():
+    pytest.importorskip('magic')
+    detector = MimeDetector()
+    assert detector.detect(b'<html><body>x</body></html>') == 'text/html'
+    assert detector.from_libmagic(b'%PDF-1.4\n1 0 obj\n') == 'application/pdf'
+    metrics = detector.get_metrics()
+    assert metrics['mime_libmagic_calls'] == 2
+    # The handle is returned to the pool and reused
+    assert metrics['mime_libmagic_handles'] == 1
+
+
+def test_handle_pool_is_bounded_under_concurrency():
+    pytest.importorskip('magic')
+    detector = MimeDetector(pool_size=2)
+    barrier = threading.Barrier(8)
+
+    def detect():
+        barrier.wait()
+        for _ in range(20):
+            assert detector.from_libmagic(b'<html></html>') == 'text/html'
+
+    threads = [threading.Thread(target=detect) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert detector.get_metrics()['mime_libmagic_handles'] <= 2
+    assert detector.get_metrics()['mime_libmagic_calls'] == 160
+
+
+def test_shared_detector_is_a_singleton():
+    assert get_mime_detector() is get_mime_detector()
+
+
+def test_missing_libmagic_does_not_exhaust_the_pool(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'magic', None)
+    detector = MimeDetector(pool_size=2, acquire_timeout=5.0)
+    start = time.monotonic()
+    for _ in range(5):
+        assert detector.detect(b'<html></html>') == 'application/octet-stream'
+    # Each failure gave its slot back instead of leaving callers waiting on the queue
+    assert time.monotonic() - start < 1.0
+    assert detector._created == 0
+    assert detector.get_metrics()['mime_libmagic_errors'] == 5
+    with pytest.raises(MimeDetectionError):
+        detector.from_libmagic(b'<html></html>')
+
+
+def test_waiting_for_a_busy_handle_times_out():
+    detector = MimeDetector(pool_size=0, acquire_timeout=0.05)
+    with pytest.raises(MimeDetectionError):
+        detector.from_libmagic(b'<html></html>')
+    assert detector.detect(b'<html></html>') == 'application/octet-stream'
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+from utils.gemini_thread import GeminiThreadManager, GeminiTimeoutError
+
+
+class FakeModel:
+    model_name = 'fake'
+    _custom_safety_settings = {'test': 'none'}
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.loops = set()
+        self.threads = set()
+        self.cancelled = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.loops.add(asyncio.get_running_loop())
+        self.threads.add(threading.current_thread().name)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return types.SimpleNamespace(prompt_feedback=None, text=prompt)
+
+
+@pytest.fixture
+def manager():
+    manager = GeminiThreadManager(max_workers=20, queue_size=20, default_timeout=5.0)
+    yield manager
+    manager.shutdown()
+
+
+def test_model_registry_shares_instances(manager, monkeypatch):
+    monkeypatch.setattr(manager, 'create_model', lambda *args: object())
+    first = manager.get_model('gemini-1.5-flash', generation_config={'temperature': 0.7})
+    assert manager.get_model('gemini-1.5-flash', generation_config={'temperature': 0.7}) is first
+    assert manager.get_model('gemini-1.5-flash', generation_config={'temperature': 0.2}) is not first
+    assert manager.get_model('gemini-1.5-pro', generation_config={'temperature': 0.7}) is not first
+    manager.warm_models([{'model_name': 'gemini-1.5-flash', 'generation_config': {'temperature': 0.7}}])
+    metrics = manager.get_metrics()
+    assert metrics['registered_models'] == 3
+    assert metrics['model_registry_hits'] == 2
+
+
+def test_calls_are_multiplexed_on_one_long_lived_loop(manager):
+    model = FakeModel(delay=0.2)
+
+    async def run():
+        return await asyncio.gather(*[manager.generate_content(model, f"p{i}", use_cache=False) for i in range(15)])
+
+    start = time.monotonic()
+    responses = asyncio.run(run())
+    # Twice as many calls as the old five worker threads, still one round trip of latency
+    assert time.monotonic() - start < 0.5
+    assert [response.text for response in responses] == [f"p{i}" for i in range(15)]
+    assert model.threads == {'gemini_worker'} and len(model.loops) == 1
+
+    asyncio.run(manager.generate_content(model, 'again', use_cache=False))
+    assert len(model.loops) == 1
+
+
+def test_timed_out_call_is_cancelled_and_frees_its_slot():
+    manager = GeminiThreadManager(max_workers=1, queue_size=1, default_timeout=5.0)
+    model = FakeModel(delay=5.0)
+    try:
+        with pytest.raises(GeminiTimeoutError):
+            asyncio.run(manager.generate_content(model, 'slow', timeout=0.1, use_cache=False))
+        deadline = time.monotonic() + 2
+        while model.cancelled == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert model.cancelled == 1
+        # The only slot is free again right away
+        model.delay = 0.0
+        response = asyncio.run(manager.generate_content(model, 'fast', timeout=1.0, use_cache=False))
+        assert response.text == 'fast'
+        metrics = manager.get_metrics()
+        assert metrics['timeouts'] == 1 and metrics['cancelled'] == 1
+    finally:
+        manager.shutdown()
+
+
+def test_abandoned_caller_cancels_the_rpc(manager):
+    model = FakeModel(delay=5.0)
+
+    async def run():
+        call = asyncio.ensure_future(manager.generate_content(model, 'slow', use_cache=False))
+        await asyncio.sleep(0.1)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(run())
+    deadline = time.monotonic() + 2
+    while model.cancelled == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert model.cancelled == 1
+    assert manager.get_metrics()['gemini_admission_active'] == 0
@@ -0,0 +1,155 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import types
+
+import pytest
+
+import extensions
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: importing app creates the WSGI application
+HEALTH_SCRIPT = """
+import json
+import app
+client = app.application.test_client()
+responses = {path: client.get(path) for path in ('/healthz', '/readyz')}
+print('RESULT ' + json.dumps({path: [r.status_code, r.get_json()] for path, r in responses.items()}))
+"""
+
+
+# Which manager each blueprint's Gemini traffic goes through
+MANAGER_SCRIPT = """
+import json
+import app
+from routes import api, main
+application = app.application
+with application.app_context():
+    manager = api.get_gemini_thread_manager()
+    print('RESULT ' + json.dumps({
+        'shared': manager is application.gemini_thread_manager,
+        'max_workers': manager.max_workers,
+        'lanes': list(manager.admission.lanes),
+        'module_level': [hasattr(module, 'gemini_thread_manager') for module in (app, api, main)],
+    }))
+"""
+
+
+def run_app_script(script: str, **env) -> dict:
+    env = dict(os.environ, **{'GEMINI_HEALTH_PROBE_ENABLED': 'false', 'SAFE_BROWSING_LOCAL_DB_ENABLED': 'false', **env})
+    completed = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_ROOT, env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    (line,) = [line for line in completed.stdout.splitlines() if line.startswith('RESULT ')]
+    return json.loads(line[len('RESULT '):])
+
+
+def request_health(api_key: str) -> dict:
+    return run_app_script(HEALTH_SCRIPT, GOOGLE_API_KEY=api_key)
+
+
+def test_health_endpoints_without_a_key():
+    results = request_health('')
+    assert results['/healthz'] == [200, {'status': 'ok'}]
+    status, body = results['/readyz']
+    assert status == 503
+    assert body['status'] == 'not_ready'
+    assert body['gemini_configured'] is False
+    assert body['gemini_error'] == 'Gemini API key not configured'
+
+
+def test_app_starts_not_ready_until_the_probe_succeeds():
+    # The probe has not succeeded (the key is fake), yet startup completes
+    results = run_app_script(HEALTH_SCRIPT, GOOGLE_API_KEY='test-key', GEMINI_HEALTH_PROBE_ENABLED='true')
+    status, body = results['/readyz']
+    assert status == 503
+    assert body['gemini_configured'] is True
+    assert body['gemini_ok'] is False
+
+
+def test_configured_app_is_ready_when_probing_is_disabled():
+    status, body = request_health('test-key')['/readyz']
+    assert status == 200
+    assert body['status'] == 'ready'
+    assert body['gemini_last_probe'] is None
+
+
+def test_one_configured_manager_serves_the_app():
+    result = run_app_script(MANAGER_SCRIPT, GOOGLE_API_KEY='', GEMINI_MAX_WORKERS='7',
+                            GEMINI_PRIORITY_LANES='form,api,batch')
+    assert result == {
+        'shared': True,
+        'max_workers': 7,
+        'lanes': ['form', 'api', 'batch'],
+        'module_level': [False, False, False],
+    }
+
+
+class FakeApp:
+    def __init__(self, **config):
+        self.config = config
+        self.gemini_config_ok = False
+        self.gemini_probe_error = None
+        self.gemini_last_probe = None
+
+
+def test_init_gemini_only_checks_the_key():
+    assert extensions.init_gemini(FakeApp(GEMINI_API_KEY='key')) is True
+    assert extensions.init_gemini(FakeApp()) is False
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    genai = pytest.importorskip('google.generativeai')
+    calls = []
+
+    def get_model(name, request_options=None):
+        calls.append((name, request_options))
+        if fake.error is not None:
+            raise fake.error
+        return types.SimpleNamespace(name=name)
+
+    fake = types.SimpleNamespace(calls=calls, error=None)
+    monkeypatch.setattr(genai, 'get_model', get_model)
+    monkeypatch.setattr(extensions, 'configure_gemini', lambda api_key: None)
+    return fake
+
+
+def test_probe_updates_readiness(fake_genai):
+    app = FakeApp(GEMINI_API_KEY='key', GEMINI_MODEL='gemini-test', GEMINI_HEALTH_PROBE_TIMEOUT=2.0)
+    assert extensions.probe_gemini(app) is True
+    assert fake_genai.calls == [('models/gemini-test', {'timeout': 2.0})]
+    assert app.gemini_config_ok and app.gemini_probe_error is None
+    assert app.gemini_last_probe is not None
+
+    fake_genai.error = PermissionError('API key not valid')
+    assert extensions.probe_gemini(app) is False
+    assert app.gemini_probe_error == 'API key not valid'
+
+
+def test_background_init_warms_up_then_probes(monkeypatch):
+    events = []
+    monkeypatch.setattr(extensions, 'configure_gemini', lambda api_key: events.append('configure'))
+    monkeypatch.setattr(extensions, 'probe_gemini', lambda app: events.append('probe'))
+    app = FakeApp(GEMINI_API_KEY='key', GEMINI_HEALTH_PROBE_INTERVAL=0)
+
+    thread = extensions.start_gemini_background_init(app, warm_up=lambda: events.append('warm_up'))
+    assert isinstance(thread, threading.Thread) and thread.daemon
+    thread.join(5)
+    assert events == ['configure', 'warm_up', 'probe']
+
+
+def test_failed_warm_up_still_probes(monkeypatch):
+    events = []
+    monkeypatch.setattr(extensions, 'configure_gemini', lambda api_key: None)
+    monkeypatch.setattr(extensions, 'probe_gemini', lambda app: events.append('probe'))
+
+    def warm_up():
+        raise RuntimeError('no network')
+
+    app = FakeApp(GEMINI_HEALTH_PROBE_INTERVAL=0)
+    extensions.start_gemini_background_init(app, warm_up=warm_up).join(5)
+    assert events == ['probe']
@@ -0,0 +1,122 @@
+import pytest
+from flask import Flask
+
+from utils.heuristics import HeuristicFilter, extract_hosts, host_signals, registrable_domain, score_message
+
+SCAM = ("URGENTE: seu CPF está bloqueado! Regularize seu cadastro imediatamente "
+        "em receita-federal-gov.top/regularizar")
+BENIGN = "Oi mãe, chego em casa umas 19h, quer que eu passe na padaria?"
+
+
+def test_scam_message_scores_high():
+    result = score_message(SCAM)
+    assert result.verdict == 'scam'
+    assert result.score >= 70
+    names = {signal.name for signal in result.signals}
+    assert {'blocked_document', 'urgency', 'update_data', 'suspicious_tld', 'lookalike_domain'} <= names
+    assert result.hosts == ['receita-federal-gov.top']
+    # Strongest signals first
+    assert [s.weight for s in result.signals] == sorted((s.weight for s in result.signals), reverse=True)
+
+
+def test_plain_message_is_benign():
+    result = score_message(BENIGN)
+    assert result == (0, 'benign', [], [])
+
+
+def test_link_alone_is_uncertain():
+    result = score_message("Olha as fotos da festa: fotos.example.com/album")
+    assert result.verdict == 'uncertain'
+    assert result.hosts == ['fotos.example.com']
+
+
+def test_each_rule_counts_once_and_score_is_capped():
+    once = score_message("chave pix")
+    twice = score_message("chave pix, chave pix, chave pix")
+    assert once.score == twice.score == 10
+    assert score_message(SCAM + " " + "Troquei de número, me passa o código do WhatsApp").score == 100
+
+
+def test_accents_and_case_are_folded():
+    assert score_message("VOCÊ GANHOU um prêmio").signals[0].name == 'prize'
+
+
+def test_new_number_scam():
+    names = {s.name for s in score_message("Oi, troquei de número, salva esse contato").signals}
+    assert 'new_number' in names
+
+
+@pytest.mark.parametrize('host, expected', [
+    ('www.itau.com.br', 'itau.com.br'),
+    ('servicos.receita.fazenda.gov.br', 'fazenda.gov.br'),
+    ('bit.ly', 'bit.ly'),
+    ('a.b.example.com', 'example.com'),
+])
+def test_registrable_domain(host, expected):
+    assert registrable_domain(host) == expected
+
+
+@pytest.mark.parametrize('host, expected', [
+    ('www.itau.com.br', []),
+    ('itau-seguranca.com', ['lookalike_domain']),
+    ('1tau.app-login.xyz', ['suspicious_tld', 'lookalike_domain']),
+    ('fotos.example.xyz', ['suspicious_tld']),
+    ('nubank-c0nta.top', ['suspicious_tld', 'lookalike_domain']),
+    ('bit.ly', ['shortener']),
+    ('10.0.0.1', ['ip_host']),
+    ('xn--ita-boa.com', ['punycode_domain']),
+    ('www.detran.sp.gov.br', []),
+    ('banco-do-brasil.online', ['suspicious_tld', 'lookalike_domain']),
+    # Brands inside unrelated words are not lookalikes
+    ('vitauto.com', []),
+    ('caixaforte-moveis.com.br', []),
+])
+def test_host_signals(host, expected):
+    assert host_signals(host) == expected
+
+
+def test_extract_hosts_is_distinct_and_punycode():
+    text = "itaú.com.br/a itaú.com.br/b bit.ly/x"
+    assert extract_hosts(text) == ['xn--ita-boa.com.br', 'bit.ly']
+
+
+@pytest.mark.parametrize('mode, scam, benign', [
+    ('off', False, False),
+    ('scam', True, False),
+    ('both', True, True),
+])
+def test_short_circuit_modes(mode, scam, benign):
+    heuristics = HeuristicFilter(short_circuit=mode)
+    scam_verdict = heuristics.short_circuit_verdict(SCAM)
+    benign_verdict = heuristics.short_circuit_verdict(BENIGN)
+    assert (scam_verdict is not None) == scam
+    assert (benign_verdict is not None) == benign
+    if scam_verdict:
+        assert scam_verdict['risk_level'] in ('Alto', 'Muito Alto')
+        assert scam_verdict['source'] == 'heuristics'
+        assert scam_verdict['alerts']
+    if benign_verdict:
+        assert benign_verdict['risk_level'] == 'Baixo'
+    metrics = heuristics.get_metrics()
+    assert metrics['heuristics_evaluated'] == 2
+    assert metrics['heuristics_scam_verdicts'] == 1
+    assert metrics['heuristics_benign_verdicts'] == 1
+    assert metrics['heuristics_llm_calls_avoided'] == scam + benign
+
+
+def test_uncertain_message_goes_to_the_llm():
+    assert HeuristicFilter(short_circuit='both').short_circuit_verdict("veja bit.ly/abc") is None
+
+
+def test_disabled_filter_does_nothing():
+    heuristics = HeuristicFilter(short_circuit='both', enabled=False)
+    assert heuristics.evaluate(SCAM) is None
+    assert heuristics.short_circuit_verdict(SCAM) is None
+    assert heuristics.get_metrics()['heuristics_evaluated'] == 0
+
+
+def test_init_app_rejects_unknown_mode():
+    app = Flask(__name__)
+    app.config['HEURISTICS_SHORT_CIRCUIT'] = 'always'
+    with pytest.raises(ValueError):
+        HeuristicFilter().init_app(app)
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from utils.async_utils import BackgroundEventLoop
+from utils.http_client import HttpClient
+from utils.safe_browsing import SafeBrowsingClient
+
+
+class FixtureServer:
+    """Local threatMatches:find stand-in, optionally slow."""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.port = None
+        self._runner = None
+
+    async def find(self, request):
+        await asyncio.sleep(self.delay)
+        body = await request.json()
+        return web.json_response({'matches': [
+            {'threatType': 'SOCIAL_ENGINEERING', 'threat': {'url': entry['url']}}
+            for entry in body['threatInfo']['threatEntries'] if 'evil' in entry['url']
+        ]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v4/threatMatches:find', self.find)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+@pytest.fixture
+def server():
+    """A fixture server running on its own background loop."""
+    loop = BackgroundEventLoop('test_fixture_server')
+    server = FixtureServer()
+    loop.submit(server.start()).result(5)
+    yield server
+    loop.submit(server.stop()).result(5)
+    loop.stop()
+
+
+@pytest.fixture
+def http_client():
+    client = HttpClient(total_timeout=0.5, connect_timeout=0.5)
+    yield client
+    client.close()
+
+
+def lookup(http_client, safe_browsing, urls):
+    async def _run():
+        return await http_client.run(lambda session: safe_browsing.find_threat_matches(session, urls))
+    return asyncio.run(_run())
+
+
+def test_session_is_reused_across_requests(server, http_client):
+    safe_browsing = SafeBrowsingClient('key', api_url=f"http://127.0.0.1:{server.port}/v4")
+    for _ in range(3):
+        results = lookup(http_client, safe_browsing, ['http://evil.example/', 'http://ok.example/'])
+        assert results['http://evil.example/'].matches
+        assert results['http://ok.example/'].matches == []
+    metrics = http_client.get_metrics()
+    assert metrics['http_sessions_created'] == 1
+    assert metrics['http_requests'] == 3
+    assert metrics['http_connections_created'] == 1
+    assert metrics['http_connections_reused'] == 2
+
+
+def test_session_timeout_applies_to_safe_browsing(server, http_client):
+    server.delay = 3.0
+    safe_browsing = SafeBrowsingClient('key', api_url=f"http://127.0.0.1:{server.port}/v4")
+    start = time.monotonic()
+    results = lookup(http_client, safe_browsing, ['http://evil.example/'])
+    assert time.monotonic() - start < 2.0
+    assert isinstance(results['http://evil.example/'].error, asyncio.TimeoutError)
+
+
+def test_configure_rejects_unknown_options():
+    client = HttpClient()
+    client.configure(limit_per_host=4)
+    assert client.limit_per_host == 4
+    with pytest.raises(TypeError):
+        client.configure(metrics={})
+    with pytest.raises(TypeError):
+        client.configure(verify_ssl=False)
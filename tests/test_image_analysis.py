@@ -0,0 +1,140 @@
+import asyncio
+import io
+import types
+
+import pytest
+from PIL import Image
+
+import routes.api as api
+from utils.orchestrator import Deadline
+from utils.similarity import ImageHashIndex
+
+VERDICT_TEXT = '```json\n{"risk_level": "Alto", "summary": "s", "alerts": [], "recommendation": "r"}\n```'
+
+
+def make_image(seed: int = 0) -> bytes:
+    image = Image.new('RGB', (64, 48), 'white')
+    for x in range(64):
+        for y in range(48):
+            image.putpixel((x, y), ((x * 7 + seed) % 256, (y * 11) % 256, (x * y) % 256))
+    buf = io.BytesIO()
+    image.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class FakeTools:
+    def __init__(self, text, url_delay=0.0):
+        self.text = text
+        self.url_delay = url_delay
+
+    async def analyze_image(self, image_data):
+        from utils.url_extractor import extract_urls
+        return {'extracted_text': self.text, 'urls_found': extract_urls(self.text), 'error': None}
+
+    async def analyze_urls(self, urls):
+        await asyncio.sleep(self.url_delay)
+        return {'url_analysis': [{'url': url, 'status': 'safe'} for url in urls]}
+
+
+class FakeThreadManager:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content(self, model, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return types.SimpleNamespace(prompt_feedback=None, text=VERDICT_TEXT)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    index = ImageHashIndex()
+    manager = FakeThreadManager()
+    state = types.SimpleNamespace(index=index, manager=manager, tools=FakeTools('Seu Pix foi bloqueado, acesse bit.ly/pix'))
+    monkeypatch.setattr(api, 'image_hash_index', index)
+    monkeypatch.setattr(api, 'get_analysis_tools', lambda: state.tools)
+    monkeypatch.setattr(api, 'get_gemini_thread_manager', lambda: state.manager)
+    monkeypatch.setattr(api, 'create_gemini_model', lambda: object())
+    return state
+
+
+def analyze(image_data, seconds=5.0):
+    return asyncio.run(api.analyze_image_data(image_data, Deadline(seconds)))
+
+
+def test_complete_result_is_reused(pipeline):
+    image = make_image()
+    result, status, _ = analyze(image)
+    assert status == 200 and result['text_analysis']['risk_level'] == 'Alto'
+    assert 'timed_out_stages' not in result
+
+    reused, status, _ = analyze(image)
+    assert status == 200 and reused['similar_image']['distance'] == 0
+    assert reused['text_analysis'] == result['text_analysis']
+    assert pipeline.manager.calls == 1
+
+
+def test_timed_out_result_is_not_reused(pipeline):
+    pipeline.tools.url_delay = 5.0
+    image = make_image()
+    result, status, _ = analyze(image, seconds=0.3)
+    assert status == 200
+    assert result['timed_out_stages'] == ['urls']
+    assert result['text_analysis']['risk_level'] == 'Alto'
+    assert len(pipeline.index.index) == 0
+
+    pipeline.tools.url_delay = 0.0
+    result, _, _ = analyze(image)
+    assert 'similar_image' not in result
+    assert pipeline.manager.calls == 2
+
+
+def test_near_match_is_reused_only_with_same_hosts(pipeline, monkeypatch):
+    fingerprints = iter([(0xF0F0, 0xABCD, 'a'), (0xF0F1, 0xABCF, 'b'), (0xF0F1, 0xABCF, 'c')])
+    monkeypatch.setattr(pipeline.index, 'fingerprint', lambda image_data: next(fingerprints))
+    analyze(b'original')
+
+    # Same campaign screenshot, re-compressed: same link, different amount
+    pipeline.tools.text = 'Seu Pix de R$ 90 foi bloqueado, acesse bit.ly/pix'
+    result, _, _ = analyze(b'copy')
+    assert result['similar_image']['distance'] == 1
+    assert result['extracted_text'] == pipeline.tools.text
+    assert pipeline.manager.calls == 1
+
+    # Same layout, link swapped for another host
+    pipeline.tools.text = 'Seu Pix foi bloqueado, acesse golpe-pix.top/x'
+    result, _, _ = analyze(b'swapped')
+    assert 'similar_image' not in result
+    assert result['urls_found'] == ['http://golpe-pix.top/x']
+    assert pipeline.manager.calls == 2
+    assert pipeline.index.get_metrics()['image_hash_host_mismatches'] == 1
+
+
+def test_same_layout_with_other_link_is_ocred_and_not_reused(pipeline, monkeypatch):
+    # Two chat screenshots whose dHashes collide but whose bytes differ
+    monkeypatch.setattr(pipeline.index, 'fingerprint',
+                        lambda image_data: (0xF0F0, 0xABCD, image_data.decode()))
+    analyze(b'original')
+    pipeline.tools.text = 'Seu Pix foi bloqueado, acesse golpe-pix.top/x'
+    result, _, _ = analyze(b'other message')
+    assert 'similar_image' not in result
+    assert result['extracted_text'] == pipeline.tools.text
+    assert pipeline.manager.calls == 2
+    assert pipeline.index.get_metrics()['image_hash_exact_hits'] == 0
+
+
+def test_index_only_skips_ocr_on_identical_bytes():
+    index = ImageHashIndex()
+    index.add((0xF0F0, 0xABCD, 'digest'), {'extracted_text': 'acesse bit.ly/pix', 'text_analysis': {}})
+    assert index.lookup((0xF0F0, 0xABCD, 'digest'))['exact']
+    # Same perceptual hashes, different file: still needs OCR and the link check
+    same_look = index.lookup((0xF0F0, 0xABCD, 'other'))
+    assert same_look['distance'] == 0 and not same_look['exact']
+
+    near = index.lookup((0xF0F1, 0xABCD, 'other'))
+    assert not near['exact'] and near['hosts'] == frozenset({'bit.ly'})
+    assert index.same_links(near, 'Acesse BIT.LY/outro')
+    assert not index.same_links(near, 'acesse bit.ly/pix ou wa.me/55')
+    assert not index.same_links(near, 'sem links')
+    assert index.lookup((0xF0F0, 0xFFFF_FFFF, 'other')) is None
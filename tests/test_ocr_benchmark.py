@@ -0,0 +1,33 @@
+import os
+
+from utils.ocr_benchmark import char_accuracy, load_fixtures, measure_preprocessing
+from utils.ocr_preprocess import PreprocessOptions
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGES_DIR = os.path.join(PROJECT_ROOT, 'static', 'images')
+GROUND_TRUTH_DIR = os.path.join(PROJECT_ROOT, 'tests', 'fixtures', 'ocr')
+
+
+def test_every_ground_truth_has_its_screenshot():
+    fixtures = load_fixtures(IMAGES_DIR, GROUND_TRUTH_DIR)
+    expected = sorted(os.path.splitext(name)[0] for name in os.listdir(GROUND_TRUTH_DIR) if name.endswith('.txt'))
+    assert [os.path.splitext(fixture.name)[0] for fixture in fixtures] == expected
+    assert all(fixture.expected_text.strip() for fixture in fixtures)
+
+
+def test_images_without_ground_truth_are_kept_by_default():
+    names = [fixture.name for fixture in load_fixtures(IMAGES_DIR)]
+    assert 'loading.gif' not in names
+    assert len(names) > len(load_fixtures(IMAGES_DIR, GROUND_TRUTH_DIR))
+
+
+def test_char_accuracy_ignores_whitespace():
+    assert char_accuracy('Pague  o\nboleto', 'Pague o boleto') == 1.0
+    assert 0 < char_accuracy('Pague o boleto', 'Pague o bo1eto') < 1
+
+
+def test_measure_preprocessing_reports_the_prepared_image():
+    fixture = load_fixtures(IMAGES_DIR, GROUND_TRUTH_DIR)[0]
+    result = measure_preprocessing(fixture, PreprocessOptions(max_side=500), repeat=1)
+    assert max(result['size']) <= 500 and result['mode'] == 'L'
+    assert result['ms'] > 0
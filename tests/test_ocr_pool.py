@@ -0,0 +1,156 @@
+import asyncio
+import concurrent.futures
+import io
+import sys
+import time
+import types
+
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+import utils.ocr_pool as ocr_pool
+from utils.ocr_pool import (
+    OCREngineError,
+    OCRPool,
+    OCRQueueFullError,
+    OCRTimeoutError,
+    OCRUnavailableError,
+    run_ocr,
+)
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 20), 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def fake_run_ocr(image_data, lang, timeout, engine, preprocess):
+    time.sleep(float(image_data or 0))
+    return f"texto {lang}", engine
+
+
+@pytest.fixture
+def thread_pool(monkeypatch):
+    """An OCRPool whose jobs run fake_run_ocr in threads of this process."""
+    monkeypatch.setattr(ocr_pool, 'run_ocr', fake_run_ocr)
+    pool = OCRPool(max_workers=1, queue_size=1, job_timeout=5.0, engine='subprocess')
+    pool._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_job_result_and_metrics(thread_pool):
+    assert asyncio.run(thread_pool.extract_text(b'0', 'por')) == ('texto por', 'subprocess')
+    metrics = thread_pool.get_metrics()
+    assert metrics['ocr_pool_jobs'] == metrics['ocr_pool_completed'] == 1
+    assert metrics['ocr_pool_workers'] == 1
+
+
+def test_jobs_beyond_the_queue_are_rejected(thread_pool):
+    async def run():
+        return await asyncio.gather(*[thread_pool.extract_text(b'0.3', 'por') for _ in range(3)],
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert results[:2] == [('texto por', 'subprocess')] * 2
+    assert isinstance(results[2], OCRQueueFullError)
+    assert results[2].retry_after >= 1
+
+
+def test_job_waiting_too_long_times_out(thread_pool):
+    async def run():
+        slow = asyncio.ensure_future(thread_pool.extract_text(b'1', 'por'))
+        await asyncio.sleep(0.05)
+        with pytest.raises(OCRTimeoutError):
+            await thread_pool.extract_text(b'0', 'por', timeout=0.2)
+        await slow
+
+    asyncio.run(run())
+    assert thread_pool.get_metrics()['ocr_pool_timeouts'] == 1
+
+
+def test_worker_errors_propagate_to_the_caller():
+    # A real spawned worker; the image fails to decode before Tesseract is needed
+    pool = OCRPool(max_workers=1, queue_size=1, job_timeout=30.0)
+    try:
+        with pytest.raises(UnidentifiedImageError):
+            asyncio.run(pool.extract_text(b'not an image', 'por'))
+        assert pool.get_metrics()['ocr_pool_failed'] == 1
+        assert pool.get_metrics()['ocr_pool_active'] == 0
+    finally:
+        pool.shutdown()
+
+
+class FakeTesserocrAPI:
+    def __init__(self, finished=True):
+        self.finished = finished
+        self.cleared = 0
+
+    def SetImage(self, image):
+        self.size = image.size
+
+    def Recognize(self, timeout=0):
+        self.timeout = timeout
+        return self.finished
+
+    def GetUTF8Text(self):
+        return 'Pague em bit.ly/pix'
+
+    def Clear(self):
+        self.cleared += 1
+
+
+def test_run_ocr_uses_the_warm_tesserocr_engine(monkeypatch):
+    api = FakeTesserocrAPI()
+    monkeypatch.setattr(ocr_pool, '_get_tesserocr_api', lambda lang: api)
+    assert run_ocr(png_bytes(), 'por', timeout=2.5, engine='auto') == ('Pague em bit.ly/pix', 'tesserocr')
+    assert api.timeout == 2500 and api.cleared == 1
+
+
+def test_interrupted_tesserocr_recognition_times_out(monkeypatch):
+    api = FakeTesserocrAPI(finished=False)
+    monkeypatch.setattr(ocr_pool, '_get_tesserocr_api', lambda lang: api)
+    with pytest.raises(OCRTimeoutError):
+        run_ocr(png_bytes(), 'por', timeout=1, engine='tesserocr')
+    assert api.cleared == 1
+
+
+@pytest.mark.parametrize('engine', ['auto', 'tesserocr'])
+def test_run_ocr_falls_back_to_the_subprocess(monkeypatch, engine):
+    monkeypatch.setattr(ocr_pool, '_get_tesserocr_api', lambda lang: None)
+    monkeypatch.setattr(ocr_pool, '_ocr_with_subprocess', lambda image, lang, timeout: f"{lang}:{image.size}")
+    assert run_ocr(png_bytes(), 'eng', engine=engine) == ('eng:(40, 20)', 'subprocess')
+
+
+def test_missing_tesserocr_is_remembered(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tesserocr', None)
+    monkeypatch.setattr(ocr_pool, '_tesserocr_available', None)
+    assert ocr_pool._get_tesserocr_api('por') is None
+    assert ocr_pool._tesserocr_available is False
+
+
+class FakePytesseract(types.ModuleType):
+    class TesseractNotFoundError(EnvironmentError):
+        pass
+
+    class TesseractError(RuntimeError):
+        pass
+
+    def __init__(self, error):
+        super().__init__('pytesseract')
+        self.error = error
+
+    def image_to_string(self, image, lang=None, timeout=0):
+        raise self.error
+
+
+@pytest.mark.parametrize('error, expected', [
+    (FakePytesseract.TesseractNotFoundError('tesseract is not installed'), OCRUnavailableError),
+    (FakePytesseract.TesseractError(1, 'Failed loading language'), OCREngineError),
+    (RuntimeError('Tesseract process timeout'), OCRTimeoutError),
+])
+def test_subprocess_errors_are_translated(monkeypatch, error, expected):
+    monkeypatch.setitem(sys.modules, 'pytesseract', FakePytesseract(error))
+    with pytest.raises(expected):
+        ocr_pool._ocr_with_subprocess(Image.new('L', (4, 4)), 'por', 1)
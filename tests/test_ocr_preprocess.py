@@ -0,0 +1,79 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from utils.ocr_preprocess import PreprocessOptions, load_image, otsu_threshold
+
+
+def encode(image, format='PNG', **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def screenshot(size=(1080, 2400), color='white'):
+    """A bordered 'message bubble' with dark text strokes in the middle."""
+    image = Image.new('RGB', size, color)
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.rectangle((width // 4, height // 4, 3 * width // 4, 3 * height // 4), fill=(40, 40, 40))
+    return image
+
+
+def test_disabled_only_decodes():
+    data = encode(screenshot())
+    image = load_image(data, PreprocessOptions(enabled=False))
+    assert image.size == (1080, 2400) and image.mode == 'RGB'
+    assert load_image(data).size == (1080, 2400)
+
+
+def test_long_side_is_capped_and_image_is_grayscale():
+    options = PreprocessOptions(max_side=1000, crop_borders=False)
+    image = load_image(encode(screenshot()), options)
+    assert image.mode == 'L'
+    assert max(image.size) == 1000
+    assert image.size == (450, 1000)
+
+
+def test_high_dpi_scan_is_downscaled_to_target_dpi():
+    options = PreprocessOptions(target_dpi=300, max_side=0, crop_borders=False)
+    image = load_image(encode(screenshot((1200, 1200)), dpi=(600, 600)), options)
+    assert image.size == (600, 600)
+
+
+def test_jpeg_draft_mode_decodes_smaller():
+    options = PreprocessOptions(max_side=500, crop_borders=False)
+    image = load_image(encode(screenshot((4000, 2000)), 'JPEG'), options)
+    assert image.size == (500, 250)
+
+
+def test_uniform_borders_are_cropped_with_margin():
+    image = load_image(encode(screenshot((400, 400))), PreprocessOptions())
+    # Content is 200x200 (inclusive rectangle: 201) plus an 8px margin on each side
+    assert image.size == (217, 217)
+
+
+def test_crop_top_removes_status_bar():
+    options = PreprocessOptions(crop_top=0.25, max_side=0, crop_borders=False)
+    assert load_image(encode(screenshot((100, 400))), options).size == (100, 300)
+
+
+def test_binarize_leaves_two_levels():
+    options = PreprocessOptions(binarize=True, crop_borders=False)
+    image = load_image(encode(screenshot((200, 200), color=(200, 200, 200))), options)
+    histogram = image.histogram()
+    assert {level for level, count in enumerate(histogram) if count} == {0, 255}
+
+
+@pytest.mark.parametrize('histogram, low, high', [
+    ([100 if i in (30, 220) else 0 for i in range(256)], 30, 219),
+    ([0] * 256, 128, 128),
+])
+def test_otsu_threshold(histogram, low, high):
+    assert low <= otsu_threshold(histogram) <= high
+
+
+def test_options_from_config():
+    options = PreprocessOptions.from_config({'OCR_MAX_SIDE': 1500, 'OCR_BINARIZE': True, 'OCR_CROP_TOP': 0.04})
+    assert options == PreprocessOptions(max_side=1500, binarize=True, crop_top=0.04)
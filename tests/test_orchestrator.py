@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.orchestrator import (
+    Deadline,
+    DeadlineExceededError,
+    StageOutcome,
+    get_orchestrator_metrics,
+    run_stages,
+    timed_out_stages,
+)
+
+
+async def _sleep(seconds, value=None):
+    await asyncio.sleep(seconds)
+    return value
+
+
+async def _fail():
+    raise ValueError('boom')
+
+
+def test_deadline_remaining_and_expired():
+    deadline = Deadline(0.05)
+    assert 0 < deadline.remaining() <= 0.05
+    assert not deadline.expired
+    time.sleep(0.06)
+    assert deadline.expired
+    assert deadline.remaining() == 0.0
+    assert deadline.remaining(minimum=1.0) == 1.0
+
+
+def test_stages_run_concurrently():
+    async def run():
+        start = time.monotonic()
+        outcomes = await run_stages({
+            'ocr': _sleep(0.2, 'texto'),
+            'urls': _sleep(0.2, []),
+            'gemini': _sleep(0.2, {'risk_level': 'Baixo'}),
+        }, Deadline(5))
+        return outcomes, time.monotonic() - start
+
+    outcomes, elapsed = asyncio.run(run())
+    assert elapsed < 0.4
+    assert {name: outcome.status for name, outcome in outcomes.items()} == {
+        'ocr': 'ok', 'urls': 'ok', 'gemini': 'ok'
+    }
+    assert outcomes['gemini'].result() == {'risk_level': 'Baixo'}
+    assert outcomes['ocr'].elapsed >= 0.2
+
+
+def test_max_concurrency_serializes_stages():
+    async def run():
+        start = time.monotonic()
+        await run_stages({'a': _sleep(0.1), 'b': _sleep(0.1)}, Deadline(5), max_concurrency=1)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.2
+
+
+def test_slow_stage_is_cut_off_and_the_rest_kept():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        start = time.monotonic()
+        outcomes = await run_stages({'fast': _sleep(0, 'ok'), 'slow': slow()}, Deadline(0.1))
+        return outcomes, time.monotonic() - start
+
+    outcomes, elapsed = asyncio.run(run())
+    assert elapsed < 1
+    assert cancelled == [True]
+    assert outcomes['fast'].result() == 'ok'
+    assert outcomes['slow'].status == 'timeout'
+    assert timed_out_stages(outcomes) == ['slow']
+    with pytest.raises(DeadlineExceededError) as excinfo:
+        outcomes['slow'].result()
+    assert excinfo.value.stage == 'slow'
+
+
+def test_stage_errors_are_captured():
+    outcomes = asyncio.run(run_stages({'bad': _fail(), 'good': _sleep(0, 1)}, Deadline(1)))
+    assert outcomes['bad'].status == 'error'
+    assert isinstance(outcomes['bad'].error, ValueError)
+    assert outcomes['good'].result() == 1
+    assert timed_out_stages(outcomes) == []
+    with pytest.raises(ValueError):
+        outcomes['bad'].result()
+
+
+def test_no_stages():
+    assert asyncio.run(run_stages({}, Deadline(1))) == {}
+
+
+def test_stage_outcome_defaults():
+    outcome = StageOutcome('ocr', 'ok', value='texto')
+    assert outcome.result() == 'texto'
+    assert outcome.error is None and outcome.elapsed == 0.0
+
+
+def test_metrics_count_timeouts_and_partial_results():
+    before = get_orchestrator_metrics()
+    asyncio.run(run_stages({'fast': _sleep(0), 'slow': _sleep(5), 'bad': _fail()}, Deadline(0.05)))
+    after = get_orchestrator_metrics()
+    assert after['orchestrator_runs'] == before['orchestrator_runs'] + 1
+    assert after['orchestrator_stages'] == before['orchestrator_stages'] + 3
+    assert after['orchestrator_stage_timeouts'] == before['orchestrator_stage_timeouts'] + 1
+    assert after['orchestrator_stage_errors'] == before['orchestrator_stage_errors'] + 1
+    assert after['orchestrator_partial_results'] == before['orchestrator_partial_results'] + 1
+    assert after['orchestrator_time_saved'] >= 0.0
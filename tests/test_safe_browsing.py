@@ -0,0 +1,146 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from utils.caching import UrlVerdictCache
+from utils.safe_browsing import SafeBrowsingClient, dedupe, parse_duration
+
+
+class FindServer:
+    """Local stand-in for threatMatches:find that flags URLs containing 'evil'."""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def find(self, request):
+        assert request.query['key'] == 'key'
+        body = await request.json()
+        urls = [entry['url'] for entry in body['threatInfo']['threatEntries']]
+        self.batches.append(urls)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if self.fail:
+            return web.Response(status=503)
+        matches = [
+            {'threatType': 'SOCIAL_ENGINEERING', 'threat': {'url': url}, 'cacheDuration': '300s'}
+            for url in urls if 'evil' in url
+        ]
+        return web.json_response({'matches': matches, 'negativeCacheDuration': '120s'} if matches
+                                 else {'negativeCacheDuration': '120s'})
+
+
+def run_with_server(server: FindServer, test):
+    """Serve ``server`` on a free local port and run ``test(session, api_url)``."""
+    async def _run():
+        app = web.Application()
+        app.router.add_post('/v4/threatMatches:find', server.find)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await test(session, f"http://127.0.0.1:{port}/v4")
+        finally:
+            await runner.cleanup()
+    return asyncio.run(_run())
+
+
+def test_parse_duration_and_dedupe():
+    assert parse_duration('300.5s') == 300.5
+    assert parse_duration(None, 7) == 7
+    assert parse_duration('soon', 7) == 7
+    assert dedupe(['b', 'a', 'b']) == ['b', 'a']
+
+
+def test_matches_are_fanned_out_per_url():
+    server = FindServer()
+    urls = ['http://evil.example/', 'http://ok.example/', 'http://evil.example/']
+
+    async def test(session, api_url):
+        client = SafeBrowsingClient('key', api_url=api_url)
+        return client, await client.find_threat_matches(session, urls)
+
+    client, results = run_with_server(server, test)
+    assert server.batches == [['http://evil.example/', 'http://ok.example/']]
+    assert [m['threatType'] for m in results['http://evil.example/'].matches] == ['SOCIAL_ENGINEERING']
+    assert results['http://ok.example/'].matches == []
+    assert results['http://ok.example/'].negative_cache_duration == 120.0
+    metrics = client.get_metrics()
+    assert metrics['safe_browsing_lookup_requests'] == 1
+    assert metrics['safe_browsing_urls_checked'] == 2
+    assert metrics['safe_browsing_duplicate_urls'] == 1
+
+
+def test_large_lookups_are_split_and_sent_concurrently():
+    server = FindServer(delay=0.1)
+    urls = [f"http://site{i}.example/" for i in range(1200)]
+
+    async def test(session, api_url):
+        client = SafeBrowsingClient('key', api_url=api_url, max_concurrent_requests=2)
+        return await client.find_threat_matches(session, urls)
+
+    results = run_with_server(server, test)
+    assert [len(batch) for batch in server.batches] == [500, 500, 200]
+    assert server.max_in_flight == 2
+    assert set(results) == set(urls)
+
+
+def test_failed_batch_reports_the_error_per_url():
+    server = FindServer(fail=True)
+
+    async def test(session, api_url):
+        client = SafeBrowsingClient('key', api_url=api_url, max_entries_per_request=1)
+        return await client.find_threat_matches(session, ['http://a.example/', 'http://b.example/'])
+
+    results = run_with_server(server, test)
+    assert len(server.batches) == 2
+    for lookup in results.values():
+        assert lookup.matches == []
+        assert isinstance(lookup.error, aiohttp.ClientResponseError)
+
+
+def test_no_urls_no_request():
+    server = FindServer()
+
+    async def test(session, api_url):
+        return await SafeBrowsingClient('key', api_url=api_url).find_threat_matches(session, [])
+
+    assert run_with_server(server, test) == {}
+    assert server.batches == []
+
+
+@pytest.mark.parametrize('count, expected', [(0, 0), (1, 1), (500, 1), (501, 2)])
+def test_batch_count(count, expected):
+    assert SafeBrowsingClient('key')._batch_count(['u'] * count) == expected
+
+
+def test_cached_verdicts_skip_the_round_trip():
+    server = FindServer()
+
+    async def test(session, api_url):
+        client = SafeBrowsingClient('key', api_url=api_url)
+        client.verdict_cache = UrlVerdictCache()
+        await client.find_threat_matches(session, ['http://evil.example/', 'http://ok.example/'])
+        again = await client.find_threat_matches(session, ['http://evil.example/x', 'http://ok.example/'])
+        return client, again
+
+    client, results = run_with_server(server, test)
+    assert server.batches == [['http://evil.example/', 'http://ok.example/']]
+    assert results['http://evil.example/x'].matches[0]['threat'] == {'url': 'http://evil.example/x'}
+    assert results['http://ok.example/'].matches == []
+    metrics = client.get_metrics()
+    assert metrics['safe_browsing_cached_urls'] == 2
+    assert metrics['safe_browsing_saved_round_trips'] == 1
+    assert metrics['url_cache_host_hits'] == 1
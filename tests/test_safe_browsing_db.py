@@ -0,0 +1,223 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from utils.safe_browsing import SafeBrowsingClient
+from utils.safe_browsing_db import (
+    STATE_FILE, SafeBrowsingDatabase, ThreatList, canonicalize_url, url_expressions
+)
+
+
+def full_hash(expression: str) -> bytes:
+    return hashlib.sha256(expression.encode()).digest()
+
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+EVIL = full_hash('evil.example/')
+BAD = full_hash('bad.example/')
+FILLER = sorted(hashlib.sha256(str(i).encode()).digest()[:4] for i in range(200))
+LISTS = (('SOCIAL_ENGINEERING', 'ANY_PLATFORM'), ('MALWARE', 'ANY_PLATFORM'))
+
+
+def checksum(prefixes) -> dict:
+    return {'sha256': b64(hashlib.sha256(b''.join(sorted(prefixes))).digest())}
+
+
+class FixtureServer:
+    """Local stand-in for threatListUpdates:fetch and fullHashes:find."""
+
+    def __init__(self):
+        self.full_prefixes = sorted(FILLER + [EVIL[:4], EVIL[:8]])
+        # Partial update: drop the first 10 prefixes and add BAD
+        self.partial_prefixes = sorted(self.full_prefixes[10:] + [BAD[:4]])
+        self.corrupt_checksum = False
+        self.requests = []
+
+    def _social_engineering(self, state: str) -> dict:
+        if not state:
+            return {
+                'responseType': 'FULL_UPDATE',
+                'newClientState': b64(b's1'),
+                'additions': [
+                    {'rawHashes': {'prefixSize': size, 'rawHashes': b64(b''.join(
+                        p for p in self.full_prefixes if len(p) == size))}}
+                    for size in (4, 8)
+                ],
+                'checksum': checksum(self.full_prefixes),
+            }
+        return {
+            'responseType': 'PARTIAL_UPDATE',
+            'newClientState': b64(b's2'),
+            'removals': [{'rawIndices': {'indices': list(range(10))}}],
+            'additions': [{'rawHashes': {'prefixSize': 4, 'rawHashes': b64(BAD[:4])}}],
+            'checksum': checksum([b'corrupt'] if self.corrupt_checksum else self.partial_prefixes),
+        }
+
+    async def fetch(self, request):
+        body = await request.json()
+        self.requests.append(('fetch', body))
+        responses = []
+        for list_request in body['listUpdateRequests']:
+            response = {'threatType': list_request['threatType'], 'platformType': list_request['platformType']}
+            if list_request['threatType'] == 'SOCIAL_ENGINEERING':
+                response.update(self._social_engineering(list_request['state']))
+            else:
+                response.update(responseType='FULL_UPDATE', newClientState=b64(b'empty'), checksum=checksum([]))
+            responses.append(response)
+        return web.json_response({'listUpdateResponses': responses, 'minimumWaitDuration': '1.5s'})
+
+    async def full_hashes(self, request):
+        body = await request.json()
+        self.requests.append(('full', body))
+        matches = []
+        for entry in body['threatInfo']['threatEntries']:
+            prefix = base64.b64decode(entry['hash'])
+            matches.extend({
+                'threatType': 'SOCIAL_ENGINEERING', 'platformType': 'ANY_PLATFORM', 'threatEntryType': 'URL',
+                'threat': {'hash': b64(candidate)}, 'cacheDuration': '300s',
+            } for candidate in (EVIL, BAD) if candidate.startswith(prefix))
+        return web.json_response({'matches': matches, 'negativeCacheDuration': '300s'})
+
+
+def run_with_server(server: FixtureServer, test):
+    """Serve ``server`` on a free local port and run ``test(session, api_url)``."""
+    async def _run():
+        app = web.Application()
+        app.router.add_post('/v4/threatListUpdates:fetch', server.fetch)
+        app.router.add_post('/v4/fullHashes:find', server.full_hashes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await test(session, f"http://127.0.0.1:{port}/v4")
+        finally:
+            await runner.cleanup()
+    return asyncio.run(_run())
+
+
+@pytest.fixture
+def server():
+    return FixtureServer()
+
+
+def make_db(directory, api_url) -> SafeBrowsingDatabase:
+    return SafeBrowsingDatabase(str(directory), SafeBrowsingClient('key', api_url=api_url), threat_lists=LISTS)
+
+
+def test_full_then_partial_update(tmp_path, server):
+    async def test(session, api_url):
+        db = make_db(tmp_path, api_url)
+        assert not db.ready
+        assert await db.update(session) == 1.5
+        assert db.ready and db.prefix_count() == len(server.full_prefixes)
+
+        results = await db.lookup(session, ['http://evil.example/', 'http://bad.example/', 'http://clean.example/'])
+        assert [m['threatType'] for m in results['http://evil.example/'].matches] == ['SOCIAL_ENGINEERING']
+        assert results['http://bad.example/'].matches == []
+
+        await db.update(session)
+        assert db.prefix_count() == len(server.partial_prefixes)
+        results = await db.lookup(session, ['http://bad.example/x'])
+        assert results['http://bad.example/x'].matches[0]['threat'] == {'url': 'http://bad.example/x'}
+        db.close()
+
+        with open(tmp_path / STATE_FILE, encoding='utf-8') as f:
+            state = json.load(f)
+        assert state['lists']['SOCIAL_ENGINEERING_ANY_PLATFORM_URL'] == {'state': b64(b's2'), 'sizes': [4, 8]}
+        # A second process sharing the directory loads the same data
+        other = make_db(tmp_path, api_url)
+        assert other.ready and other.prefix_count() == len(server.partial_prefixes)
+        other.close()
+    run_with_server(server, test)
+
+    fetches = [body for kind, body in server.requests if kind == 'fetch']
+    assert [r['state'] for r in fetches[1]['listUpdateRequests']] == [b64(b's1'), b64(b'empty')]
+
+
+def test_checksum_mismatch_resets_the_list(tmp_path, server):
+    async def test(session, api_url):
+        db = make_db(tmp_path, api_url)
+        await db.update(session)
+        server.corrupt_checksum = True
+        await db.update(session)
+        assert not db.ready
+        assert db.lists[0].state == ''
+        # The rejected diff was not written; the next update starts from scratch
+        assert db.prefix_count() == 0
+        server.corrupt_checksum = False
+        await db.update(session)
+        assert db.ready and db.prefix_count() == len(server.full_prefixes)
+        db.close()
+    run_with_server(server, test)
+
+
+def test_clean_urls_need_no_round_trip(tmp_path, server):
+    async def test(session, api_url):
+        db = make_db(tmp_path, api_url)
+        await db.update(session)
+        server.requests.clear()
+        results = await db.lookup(session, ['http://clean.example/', 'https://example.org/a/b?c=d'])
+        assert all(not lookup.matches and lookup.error is None for lookup in results.values())
+        # Hits are confirmed once, then answered from the full-hash cache
+        await db.lookup(session, ['http://evil.example/'])
+        await db.lookup(session, ['http://evil.example/'])
+        db.close()
+        return db.metrics
+    metrics = run_with_server(server, test)
+    assert [kind for kind, _ in server.requests] == ['full']
+    assert metrics['full_hash_cache_hits'] == 1
+
+
+def test_apply_update_works_from_a_snapshot(tmp_path):
+    threat_list = ThreatList(str(tmp_path), 'SOCIAL_ENGINEERING', 'ANY_PLATFORM')
+    prefixes = sorted([b'aaaa', b'bbbb', b'cccc'])
+    sizes = threat_list.apply_update({
+        'responseType': 'FULL_UPDATE',
+        'additions': [{'rawHashes': {'prefixSize': 4, 'rawHashes': b64(b''.join(prefixes))}}],
+        'checksum': checksum(prefixes),
+    }, [])
+    threat_list.load('s1', sizes)
+    snapshot = threat_list.sorted_prefixes()
+    # A reload may close the mapped files while the update is merged
+    threat_list.close()
+    sizes = threat_list.apply_update({
+        'responseType': 'PARTIAL_UPDATE',
+        'removals': [{'rawIndices': {'indices': [0]}}],
+        'additions': [{'rawHashes': {'prefixSize': 4, 'rawHashes': b64(b'dddd')}}],
+        'checksum': checksum([b'bbbb', b'cccc', b'dddd']),
+    }, snapshot)
+    assert sizes == [4]
+    with open(os.path.join(tmp_path, 'SOCIAL_ENGINEERING_ANY_PLATFORM_URL_4.bin'), 'rb') as f:
+        assert f.read() == b'bbbbccccdddd'
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('http://www.GOOgle.com/', ('www.google.com', '/', '')),
+    ('http://3279880203/blah', ('195.127.0.11', '/blah', '')),
+    ('http://www.google.com/blah/..', ('www.google.com', '/', '')),
+    ('http://%31%36%38%2e%31%38%38%2e%39%39%2e%32%36/%2E%73%65%63%75%72%65/%77%77%77%2E%65%62%61%79%2E%63%6F%6D/',
+     ('168.188.99.26', '/.secure/www.ebay.com/', '')),
+    ('www.google.com/q?r?s', ('www.google.com', '/q', 'r?s')),
+    ('http://www.google.com.../', ('www.google.com', '/', '')),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_url_expressions():
+    assert url_expressions('http://a.b.c/1/2.html?param=1') == [
+        'a.b.c/1/2.html?param=1', 'a.b.c/1/2.html', 'a.b.c/', 'a.b.c/1/',
+        'b.c/1/2.html?param=1', 'b.c/1/2.html', 'b.c/', 'b.c/1/',
+    ]
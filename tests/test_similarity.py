@@ -0,0 +1,66 @@
+from utils.similarity import FingerprintIndex, SimilarityIndex, message_hosts, simhash, tokenize_message
+
+LEGIT = "Seu pedido 12345 saiu para entrega, acompanhe em correios.com.br/rastreio"
+PHISHING = "Seu pedido 12345 saiu para entrega, acompanhe em correios-rastreio.top/rastreio"
+
+
+def test_tokenize_keeps_link_host_and_collapses_numbers():
+    tokens = tokenize_message(LEGIT)
+    assert '_url_correios.com.br' in tokens
+    assert '_num_' in tokens
+    assert '12345' not in tokens
+
+
+def test_variants_differing_in_amount_and_link_path_match():
+    index = SimilarityIndex(threshold=0.95)
+    index.add("Você ganhou R$ 500! Resgate em bit.ly/abc123", {'risk_level': 'Alto'})
+    match = index.lookup("Você ganhou R$ 900! Resgate em bit.ly/zzz999")
+    assert match is not None
+    assert match['verdict'] == {'risk_level': 'Alto'}
+    assert match['score'] >= 0.95
+
+
+def test_different_link_host_is_not_reused():
+    index = SimilarityIndex(threshold=0.95)
+    index.add(LEGIT, {'risk_level': 'Baixo'})
+    assert index.lookup(PHISHING) is None
+    assert index.lookup(LEGIT.replace('correios.com.br', 'correios.com.br.evil.xyz')) is None
+
+
+def test_added_link_is_not_reused():
+    index = SimilarityIndex(threshold=0.95)
+    text = "Oi, tudo bem? Amanhã tem reunião às 10h na sala 3, leve o relatório impresso por favor"
+    index.add(text, {'risk_level': 'Baixo'})
+    assert index.lookup(text + " bit.ly/x") is None
+
+
+def test_host_mismatch_within_threshold_is_refused():
+    index = SimilarityIndex(threshold=0.0)  # any fingerprint is a neighbour
+    index.add(LEGIT, {'risk_level': 'Baixo'})
+    assert index.lookup(PHISHING) is None
+    assert index.get_metrics()['similarity_host_mismatches'] == 1
+
+
+def test_message_hosts():
+    assert message_hosts("veja bit.ly/x e https://WWW.Itau.com.br/a") == {'bit.ly', 'www.itau.com.br'}
+
+
+def test_disabled_index():
+    index = SimilarityIndex(enabled=False)
+    assert index.add(LEGIT, {}) is None
+    assert index.lookup(LEGIT) is None
+
+
+def test_fingerprint_index_finds_within_distance_and_evicts():
+    index = FingerprintIndex(max_distance=3, max_entries=2)
+    index.add(0b1111, 'a')
+    assert index.nearest(0b1111 ^ 0b111) == (0b1111, 3, 'a')
+    assert index.nearest(0b1111 ^ 0b11111 << 8) is None
+    index.add(1 << 40, 'b')
+    index.add(1 << 50, 'c')
+    assert len(index) == 2
+    assert index.nearest(0b1111) is None
+
+
+def test_empty_message_has_no_fingerprint():
+    assert simhash('') == 0
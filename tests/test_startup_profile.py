@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils.startup_profile import ImportRecord, parse_importtime, profile_import, time_cold_starts
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules create_app() must not import; they load on first use
+DEFERRED_MODULES = ('google.generativeai', 'pytesseract', 'tesserocr', 'bs4', 'PIL.Image', 'magic')
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:        85 |         85 |     marshal
+import time:      1500 |       2100 | encodings
+not an importtime line
+import time:        40 |       3000 |   structlog.processors
+"""
+
+
+def test_parse_importtime():
+    assert parse_importtime(IMPORTTIME) == [
+        ImportRecord('_io', 1, 120, 120),
+        ImportRecord('marshal', 2, 85, 85),
+        ImportRecord('encodings', 0, 1500, 2100),
+        ImportRecord('structlog.processors', 1, 40, 3000),
+    ]
+
+
+def test_profile_import_of_a_real_module():
+    wall, records = profile_import('json')
+    assert wall > 0
+    assert any(record.module == 'json' for record in records)
+
+
+def test_profile_import_reports_failures():
+    with pytest.raises(RuntimeError, match='no_such_module'):
+        profile_import('no_such_module')
+
+
+def test_time_cold_starts():
+    timings = time_cold_starts('', 2)
+    assert len(timings) == 2 and all(timing > 0 for timing in timings)
+
+
+def test_app_startup_defers_heavy_imports():
+    code = (
+        "import sys, app\n"
+        f"print('loaded:', [m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    )
+    completed = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    # structlog writes to stdout too
+    assert "loaded: []" in completed.stdout.splitlines()
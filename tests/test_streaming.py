@@ -0,0 +1,105 @@
+import asyncio
+import io
+import json
+import types
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+import routes.api as api
+from config import Config
+from utils.similarity import ImageHashIndex
+
+PIECES = ['{"risk_level": "Alto", ', '"summary": "golpe", "alerts": [], ', '"recommendation": "ignore"}']
+
+
+class FakeTools:
+    async def analyze_image(self, image_data):
+        return {'extracted_text': 'Pix bloqueado, acesse bit.ly/pix', 'urls_found': ['http://bit.ly/pix'], 'error': None}
+
+    async def analyze_urls(self, urls):
+        return {'url_analysis': [{'url': url, 'status': 'safe'} for url in urls]}
+
+
+class FakeThreadManager:
+    async def generate_content(self, model, prompt, on_text=None, **kwargs):
+        for piece in PIECES:
+            await asyncio.sleep(0.01)
+            if on_text is not None:
+                on_text(piece)
+        return types.SimpleNamespace(prompt_feedback=None, text=''.join(PIECES))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(
+        GEMINI_API_KEY='key', MAX_IMAGE_UPLOAD_BYTES=Config.MAX_IMAGE_UPLOAD_BYTES,
+        ALLOWED_IMAGE_TYPES=Config.ALLOWED_IMAGE_TYPES, ANALYSIS_DEADLINE=5.0, RATELIMIT_ENABLED=False,
+    )
+    app.register_blueprint(api.api, url_prefix='/api')
+    app.gemini_thread_manager = FakeThreadManager()
+    monkeypatch.setattr(api, 'image_hash_index', ImageHashIndex(enabled=False))
+    monkeypatch.setattr(api, 'get_analysis_tools', FakeTools)
+    monkeypatch.setattr(api, 'create_gemini_model', lambda: object())
+    return app.test_client()
+
+
+def upload():
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), 'white').save(buf, 'PNG')
+    return {'image': (io.BytesIO(buf.getvalue()), 'print.png')}
+
+
+def test_ndjson_stream_emits_stages_then_final(client):
+    response = client.post('/api/analyze_image?stream=ndjson', data=upload(), content_type='multipart/form-data')
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    names = [event['event'] for event in events]
+    assert names[:2] == ['ocr', 'urls']
+    assert names[-1] == 'final'
+    assert names.count('url_verdicts') == 1
+    assert ''.join(event['data']['text'] for event in events if event['event'] == 'token') == ''.join(PIECES)
+    final = events[-1]['data']
+    assert final['status'] == 200
+    assert final['result']['text_analysis']['risk_level'] == 'Alto'
+    assert final['result']['url_analysis'] == [{'url': 'http://bit.ly/pix', 'status': 'safe'}]
+
+
+def test_sse_selected_by_accept_header(client):
+    response = client.post('/api/analyze_image', data=upload(), content_type='multipart/form-data',
+                           headers={'Accept': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    blocks = response.get_data(as_text=True).strip().split('\n\n')
+    assert blocks[0].startswith('event: ocr\ndata: {')
+    event, data = blocks[-1].split('\n')
+    assert event == 'event: final'
+    assert json.loads(data.removeprefix('data: '))['status'] == 200
+
+
+def test_plain_json_without_stream_request(client):
+    response = client.post('/api/analyze_image', data=upload(), content_type='multipart/form-data')
+    assert response.mimetype == 'application/json'
+    assert response.get_json()['text_analysis']['summary'] == 'golpe'
+
+
+def test_format_event():
+    assert api._format_event('ndjson', 'token', {'text': 'ã'}) == '{"event": "token", "data": {"text": "ã"}}\n'
+    assert api._format_event('sse', 'ocr', {'a': 1}) == 'event: ocr\ndata: {"a": 1}\n\n'
+
+
+INDEX_SCRIPT = """
+import json
+import app
+page = app.application.test_client().get('/').get_data(as_text=True)
+print('RESULT ' + json.dumps({'page': page}))
+"""
+
+
+def test_home_page_streams_the_image_form():
+    from test_health import run_app_script
+    page = run_app_script(INDEX_SCRIPT)['page']
+    assert 'id="image-analysis-form"' in page and 'id="image-stream-result"' in page
+    assert "fetch('/api/analyze_image?stream=ndjson'" in page
@@ -0,0 +1,122 @@
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from utils.uploads import (
+    MULTIPART_OVERHEAD,
+    UnsupportedUploadError,
+    UploadTooLargeError,
+    content_length_exceeds,
+    get_upload_metrics,
+    read_upload,
+    sniff_mime,
+    upload_size,
+)
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 100
+
+
+class UnseekableStream(io.RawIOBase):
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+    def tell(self):
+        raise OSError('not seekable')
+
+
+class FakeRequest:
+    def __init__(self, content_length):
+        self.content_length = content_length
+
+
+def upload(data, stream=None):
+    return FileStorage(stream=stream or io.BytesIO(data), filename='file')
+
+
+def test_reads_whole_file_once():
+    data = read_upload(upload(PNG), max_bytes=1000, allowed_types={'image/png'})
+    assert data == PNG
+
+
+def test_sniffing_does_not_move_the_stream():
+    storage = upload(PNG)
+    assert sniff_mime(storage) == 'image/png'
+    assert storage.stream.tell() == 0
+
+
+def test_size_comes_from_the_spooled_file():
+    storage = upload(PNG)
+    assert upload_size(storage) == len(PNG)
+    assert storage.stream.tell() == 0
+    assert upload_size(upload(b'', stream=UnseekableStream(PNG))) is None
+
+
+def test_too_large_seekable_upload():
+    before = get_upload_metrics()['upload_rejected_too_large']
+    with pytest.raises(UploadTooLargeError) as excinfo:
+        read_upload(upload(PNG), max_bytes=50)
+    assert excinfo.value.limit == 50
+    assert get_upload_metrics()['upload_rejected_too_large'] == before + 1
+
+
+def test_unseekable_upload_is_read_in_chunks_up_to_the_limit():
+    assert read_upload(upload(b'', stream=UnseekableStream(PNG)), max_bytes=len(PNG)) == PNG
+    with pytest.raises(UploadTooLargeError):
+        read_upload(upload(b'', stream=UnseekableStream(PNG)), max_bytes=len(PNG) - 1)
+
+
+def test_disallowed_type_is_rejected_before_reading():
+    storage = upload(b'%PDF-1.7\n...')
+    with pytest.raises(UnsupportedUploadError) as excinfo:
+        read_upload(storage, max_bytes=1000, allowed_types={'image/png', 'image/jpeg'})
+    assert excinfo.value.detected_type == 'application/pdf'
+    assert storage.stream.tell() == 0
+
+
+def test_content_length_check_allows_multipart_overhead():
+    assert not content_length_exceeds(FakeRequest(None), 100)
+    assert not content_length_exceeds(FakeRequest(100 + MULTIPART_OVERHEAD), 100)
+    assert content_length_exceeds(FakeRequest(101 + MULTIPART_OVERHEAD), 100)
+
+
+def test_metrics_track_bytes_read():
+    before = get_upload_metrics()
+    read_upload(upload(PNG), max_bytes=1000)
+    after = get_upload_metrics()
+    assert after['upload_uploads'] == before['upload_uploads'] + 1
+    assert after['upload_bytes_read'] == before['upload_bytes_read'] + len(PNG)
+    assert after['upload_max_upload_bytes'] >= len(PNG)
+
+
+# Posts without a CSRF token: the size check has to answer before CSRFProtect reads the form
+OVERSIZED_UPLOAD_SCRIPT = """
+import io, json
+import app
+client = app.application.test_client()
+def post(path, size):
+    return client.post(path, data={'image': (io.BytesIO(b'0' * size), 'big.png')},
+                       content_type='multipart/form-data')
+api_big, form_big, api_small = post('/api/analyze_image', 1_200_000), post('/process_analysis', 1_200_000), post('/api/analyze_image', 10)
+print('RESULT ' + json.dumps({
+    'api': [api_big.status_code, api_big.get_json()['text_analysis']['error']],
+    'form': [form_big.status_code, form_big.headers.get('Location')],
+    'small': api_small.status_code,
+}))
+"""
+
+
+def test_oversized_uploads_are_refused_before_csrf():
+    from test_health import run_app_script
+    result = run_app_script(OVERSIZED_UPLOAD_SCRIPT, FLASK_CONFIG='production',
+                            MAX_IMAGE_UPLOAD_BYTES=str(1024 * 1024))
+    assert result['api'] == [413, 'Arquivo muito grande. Limite máximo é 1MB.']
+    assert result['form'] == [302, '/']
+    # Within the limit the request still reaches CSRFProtect
+    assert result['small'] == 400
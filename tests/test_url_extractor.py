@@ -0,0 +1,68 @@
+import pytest
+
+from utils.url_extractor import MAX_URL_LENGTH, extract_urls, find_urls, parse_url
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Resgate em bit.ly/premio123.', ['http://bit.ly/premio123']),
+    ('(wa.me/5511999999999)', ['http://wa.me/5511999999999']),
+    ('chama no wa.me', ['http://wa.me/']),
+    ('https://WWW.Itau.com.br:443/a?b=1#frag', ['https://www.itau.com.br/a?b=1']),
+    ('http://example.com:8080', ['http://example.com:8080/']),
+    ('www.correios-rastreio.top', ['http://www.correios-rastreio.top/']),
+    ('acesse itau-seguro.com agora', ['http://itau-seguro.com/']),
+    ('acesse:https://x.top/p', ['https://x.top/p']),
+    ('http://10.0.0.1', ['http://10.0.0.1/']),
+    ('http://192.168.0.1/pix', ['http://192.168.0.1/pix']),
+    ('https://en.wikipedia.org/wiki/Foo_(bar)), ok', ['https://en.wikipedia.org/wiki/Foo_(bar)']),
+    ('exemplo.to/x', ['http://exemplo.to/x']),
+])
+def test_extracts_canonical_urls(text, expected):
+    assert extract_urls(text) == expected
+
+
+def test_idn_host_is_punycode():
+    (extracted,) = find_urls('itaú.com.br/login')
+    assert extracted.host == 'xn--ita-boa.com.br'
+    assert extracted.url == 'http://xn--ita-boa.com.br/login'
+    assert extracted.raw == 'itaú.com.br/login'
+
+
+@pytest.mark.parametrize('text', [
+    'Oi.Me liga',
+    'feito.Do',
+    'Fiquei feliz.Com certeza',
+    'veja isso.to',
+    'vamos la.es',
+    'isso.is',
+    'R$5.000,00',
+    'arquivo.pdf',
+    'Sr.joao',
+    'e.g.',
+    'fulano@gmail.com',
+    '192.168.0.1',
+    'versão 1.2.3.4',
+    'ftp://example.com/file',
+    'http://999.1.1.1/',
+])
+def test_prose_and_non_links_are_ignored(text):
+    assert extract_urls(text) == []
+
+
+def test_dedups_in_order():
+    text = 'bit.ly/a http://bit.ly/a BIT.LY/a bit.ly/b'
+    assert extract_urls(text) == ['http://bit.ly/a', 'http://bit.ly/b']
+
+
+def test_canonical_urls_are_fixed_points():
+    for url in extract_urls('bit.ly/a https://Nubank.online/x?y=1 itaú.com.br www.a.me'):
+        assert extract_urls(url) == [url]
+
+
+def test_overlong_tokens_are_skipped():
+    assert parse_url('http://a.com/' + 'x' * MAX_URL_LENGTH) is None
+
+
+def test_empty_text():
+    assert extract_urls('') == []
+    assert find_urls(None) == []
@@ -0,0 +1,165 @@
+"""Admission control for bounded concurrent work."""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class AdmissionQueueFullError(Exception):
+    """Raised when a request cannot even be queued."""
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionTimeoutError(Exception):
+    """Raised when a queued request is not admitted before its deadline."""
+    pass
+
+
+class _Waiter:
+    __slots__ = ('loop', 'future', 'granted')
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """Semaphore-backed bounded queue shared by callers on any thread or loop.
+
+    At most ``slots`` requests run at once and at most ``queue_size`` wait for
+    a slot; anything beyond that is rejected immediately instead of piling up
+    and timing out later. Waiters are grouped in priority lanes, served in the
+    order the lanes are given.
+    """
+
+    def __init__(self, slots: int, queue_size: int, lanes: Sequence[str] = ('default',),
+                 name: str = 'admission'):
+        self.slots = slots
+        self.queue_size = queue_size
+        self.lanes = tuple(lanes)
+        self.name = name
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: Dict[str, deque] = {lane: deque() for lane in self.lanes}
+        self._avg_hold_time = 0.0
+        self.metrics = {
+            'admitted': 0,
+            'rejected': 0,
+            'queue_timeouts': 0,
+            'max_queue_depth': 0,
+        }
+
+    def _queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def retry_after(self) -> int:
+        """Estimate in seconds until a queued request would get a slot."""
+        backlog = self._queued() + 1
+        estimate = self._avg_hold_time * backlog / max(self.slots, 1)
+        return max(1, int(estimate + 0.999))
+
+    async def acquire(self, lane: Optional[str] = None, timeout: Optional[float] = None) -> float:
+        """Wait for a slot.
+
+        Args:
+            lane: Priority lane name; unknown lanes use the lowest priority
+            timeout: Maximum time to wait in the queue, in seconds
+
+        Returns:
+            Time spent waiting in the queue, in seconds
+
+        Raises:
+            AdmissionQueueFullError: If the queue is already full
+            AdmissionTimeoutError: If no slot frees up within ``timeout``
+        """
+        if lane not in self._waiters:
+            lane = self.lanes[-1]
+        start = time.monotonic()
+
+        with self._lock:
+            if self._active < self.slots and not self._queued():
+                self._active += 1
+                self.metrics['admitted'] += 1
+                return 0.0
+            queued = self._queued()
+            if queued >= self.queue_size:
+                self.metrics['rejected'] += 1
+                raise AdmissionQueueFullError(
+                    f"{self.name} queue is full ({queued} waiting)",
+                    retry_after=self.retry_after()
+                )
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop, loop.create_future())
+            self._waiters[lane].append(waiter)
+            self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], queued + 1)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters[lane].remove(waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.metrics['queue_timeouts'] += 1
+            if granted:
+                # A slot was handed over while we were giving up; pass it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionTimeoutError(f"Timed out after {timeout}s waiting in {self.name} queue")
+            raise
+
+        with self._lock:
+            self.metrics['admitted'] += 1
+        return time.monotonic() - start
+
+    def release(self, hold_time: Optional[float] = None):
+        """Free a slot, handing it straight to the next waiter if there is one.
+
+        Args:
+            hold_time: How long the slot was held, used for Retry-After estimates
+        """
+        with self._lock:
+            if hold_time is not None:
+                self._avg_hold_time = hold_time if not self._avg_hold_time else \
+                    0.9 * self._avg_hold_time + 0.1 * hold_time
+            while True:
+                waiter = self._next_waiter()
+                if waiter is None:
+                    self._active -= 1
+                    return
+                try:
+                    waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+                except RuntimeError:
+                    # The waiter's event loop is already closed
+                    continue
+                waiter.granted = True
+                return
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for lane in self.lanes:
+            if self._waiters[lane]:
+                return self._waiters[lane].popleft()
+        return None
+
+    def get_metrics(self) -> Dict[str, float]:
+        with self._lock:
+            metrics = {f"{self.name}_{key}": value for key, value in self.metrics.items()}
+            metrics[f"{self.name}_active"] = self._active
+            metrics[f"{self.name}_queued"] = self._queued()
+            for lane in self.lanes:
+                metrics[f"{self.name}_queued_{lane}"] = len(self._waiters[lane])
+        return metrics
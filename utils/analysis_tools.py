@@ -1,50 +1,194 @@
 import os
-import re
-import magic
-import aiohttp
 import asyncio
-from PIL import Image
-import pytesseract
-from bs4 import BeautifulSoup
-import validators
-from urllib.parse import urlparse
-import requests
-from typing import Dict, List, Tuple, Optional
+import threading
+from typing import Dict, List, Optional
 import platform
 import io
 import logging
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import json
 
+from utils.ocr_pool import (
+    OCREngineError, OCRPool, OCRQueueFullError, OCRTimeoutError, OCRUnavailableError, run_ocr
+)
+from utils.ocr_preprocess import PreprocessOptions
+from utils.uploads import SNIFF_BYTES
+from utils.file_types import get_mime_detector
+from utils.http_client import get_http_client
+from utils.orchestrator import Deadline, run_stages, timed_out_stages
+from utils.url_extractor import extract_urls
+from utils.safe_browsing import SafeBrowsingClient, ThreatLookup, DEFAULT_API_URL as DEFAULT_SAFE_BROWSING_API_URL
+
+# Heavy dependencies (PIL, pytesseract, aiohttp, validators and
+# google.generativeai) are imported inside the methods that use them so that
+# importing the app, spawning workers and autoreloading stay fast.
+
 logger = logging.getLogger(__name__)
 
+_shared_instance = None
+_shared_instance_lock = threading.Lock()
+
+def get_analysis_tools() -> 'AnalysisTools':
+    """Return the process-wide AnalysisTools instance, creating it on first use."""
+    global _shared_instance
+    if _shared_instance is None:
+        with _shared_instance_lock:
+            if _shared_instance is None:
+                _shared_instance = AnalysisTools()
+    return _shared_instance
+
+_pytesseract_configured = False
+
+def _import_pytesseract():
+    """Import pytesseract, pointing it at the Tesseract binary on first use."""
+    global _pytesseract_configured
+    import pytesseract
+    if _pytesseract_configured:
+        return pytesseract
+    
+    if platform.system() == 'Windows':
+        tesseract_path_env = os.getenv('TESSERACT_PATH')
+        if tesseract_path_env and os.path.exists(tesseract_path_env):
+             pytesseract.pytesseract.tesseract_cmd = tesseract_path_env
+             logger.info(f"Tesseract path set from TESSERACT_PATH: {tesseract_path_env}")
+        else:
+            default_tesseract_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+            if os.path.exists(default_tesseract_path):
+                pytesseract.pytesseract.tesseract_cmd = default_tesseract_path
+                logger.info(f"Tesseract path set to default: {default_tesseract_path}")
+            else:
+                logger.warning("Tesseract not found at default location or via TESSERACT_PATH. Please install Tesseract or set TESSERACT_PATH.")
+    _pytesseract_configured = True
+    return pytesseract
+
+_tesseract_languages: Optional[List[str]] = None
+_tesseract_languages_lock = threading.Lock()
+_tesseract_language_probes = 0
+
+def get_tesseract_languages(refresh: bool = False) -> Optional[List[str]]:
+    """Return the installed Tesseract languages, discovered once per process.
+    
+    pytesseract.get_languages() spawns a tesseract subprocess, so the result
+    is cached; pass refresh=True (or call refresh_tesseract_languages) after
+    installing new traineddata. Failed discoveries are not cached.
+    
+    Returns:
+        List of language codes, or None if they could not be determined
+    """
+    global _tesseract_languages, _tesseract_language_probes
+    if _tesseract_languages is not None and not refresh:
+        return _tesseract_languages
+    with _tesseract_languages_lock:
+        if _tesseract_languages is not None and not refresh:
+            return _tesseract_languages
+        _tesseract_language_probes += 1
+        try:
+            pytesseract = _import_pytesseract()
+        except ImportError:
+            # tesserocr-only installs: ask the bindings instead of the binary
+            import tesserocr
+            languages = tesserocr.get_languages()[1]
+        else:
+            try:
+                languages = pytesseract.get_languages(config='')
+            except pytesseract.TesseractError as te:
+                logger.warning(f"Pytesseract could not get languages: {te}")
+                return None
+        _tesseract_languages = languages
+        logger.info(f"Tesseract languages discovered: {languages}")
+        return languages
+
+def refresh_tesseract_languages() -> Optional[List[str]]:
+    """Re-run Tesseract language discovery and reset the cached OCR language."""
+    languages = get_tesseract_languages(refresh=True)
+    get_analysis_tools().reset_ocr_lang()
+    return languages
+
+def choose_ocr_lang(available_langs: Optional[List[str]]) -> str:
+    """Pick the Tesseract lang string, preferring Portuguese plus English."""
+    available_langs = available_langs or []
+    if 'por' in available_langs and 'eng' in available_langs:
+        return 'por+eng'
+    elif 'por' in available_langs:
+        return 'por'
+    elif 'eng' in available_langs:
+        return 'eng'
+    lang_to_use = 'eng'
+    if not available_langs:
+        logger.warning(f"Could not detect Tesseract languages. Falling back to '{lang_to_use}'.")
+    else:
+        logger.warning(f"Portuguese ('por') not found in Tesseract languages ({available_langs}). Using '{lang_to_use}'.")
+    return lang_to_use
+
 class AnalysisTools:
     def __init__(self):
         self.google_safe_browsing_key = os.getenv('GOOGLE_SAFE_BROWSING_KEY')
+        self.safe_browsing = SafeBrowsingClient(
+            self.google_safe_browsing_key,
+            api_url=os.getenv('SAFE_BROWSING_API_URL', DEFAULT_SAFE_BROWSING_API_URL)
+        )
+        self._internal_gemini_model = None
+        self._internal_gemini_model_failed = False
+        self._ocr_lang: Optional[str] = None
+        # Set by create_app; without a pool OCR runs in a thread instead
+        self.ocr_pool: Optional[OCRPool] = None
+        self.ocr_engine = 'auto'
+        self.ocr_preprocess: Optional[PreprocessOptions] = PreprocessOptions()
+        # End-to-end budget of verify_document, in seconds
+        self.analysis_deadline = 45.0
+        self.metrics = {
+            'ocr_requests': 0,
+            'ocr_subprocess_spawns': 0,
+            'ocr_engine_calls': 0,
+        }
+    
+    @property
+    def ocr_lang(self) -> str:
+        """Tesseract lang string for OCR, chosen once from the installed languages."""
+        if self._ocr_lang is None:
+            try:
+                available_langs = get_tesseract_languages()
+            except Exception as lang_e:
+                logger.warning(f"Error determining Tesseract languages: {lang_e}. Defaulting to 'por+eng'.")
+                return 'por+eng'
+            lang_to_use = choose_ocr_lang(available_langs)
+            if available_langs is None:
+                # Discovery failed; retry on the next image instead of caching the fallback
+                return lang_to_use
+            self._ocr_lang = lang_to_use
+        return self._ocr_lang
+    
+    def reset_ocr_lang(self):
+        """Forget the cached OCR language so it is chosen again on the next image."""
+        self._ocr_lang = None
+    
+    def get_metrics(self) -> Dict[str, float]:
+        """Get OCR metrics, including Tesseract subprocess spawns per request."""
+        metrics = self.metrics.copy()
+        if self.ocr_pool is not None:
+            metrics.update(self.ocr_pool.get_metrics())
+        metrics.update(self.safe_browsing.get_metrics())
+        metrics['tesseract_language_probes'] = _tesseract_language_probes
+        metrics['tesseract_subprocess_spawns'] = metrics['ocr_subprocess_spawns'] + _tesseract_language_probes
+        if metrics['ocr_requests'] > 0:
+            metrics['tesseract_spawns_per_request'] = metrics['tesseract_subprocess_spawns'] / metrics['ocr_requests']
+        return metrics
+    
+    @property
+    def internal_gemini_model(self):
+        """Gemini model used by analyze_text_with_gemini, created on first use.
         
-        # This model instance inside AnalysisTools will be used by its analyze_text_with_gemini
-        # It relies on genai.configure() having been called already (e.g., in app.py)
-        try:
-            self.internal_gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-            logger.info("AnalysisTools: Internal Gemini model initialized.")
-        except Exception as e:
-            logger.error(f"AnalysisTools: Error initializing internal Gemini model: {str(e)}")
-            logger.error("Make sure genai.configure() was called before instantiating AnalysisTools.")
-            self.internal_gemini_model = None
-        
-        if platform.system() == 'Windows':
-            tesseract_path_env = os.getenv('TESSERACT_PATH')
-            if tesseract_path_env and os.path.exists(tesseract_path_env):
-                 pytesseract.pytesseract.tesseract_cmd = tesseract_path_env
-                 logger.info(f"Tesseract path set from TESSERACT_PATH: {tesseract_path_env}")
-            else:
-                default_tesseract_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-                if os.path.exists(default_tesseract_path):
-                    pytesseract.pytesseract.tesseract_cmd = default_tesseract_path
-                    logger.info(f"Tesseract path set to default: {default_tesseract_path}")
-                else:
-                    logger.warning("Tesseract not found at default location or via TESSERACT_PATH. Please install Tesseract or set TESSERACT_PATH.")
+        It relies on genai.configure() having been called already (see extensions.configure_gemini).
+        """
+        if self._internal_gemini_model is None and not self._internal_gemini_model_failed:
+            try:
+                import google.generativeai as genai
+                self._internal_gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+                logger.info("AnalysisTools: Internal Gemini model initialized.")
+            except Exception as e:
+                logger.error(f"AnalysisTools: Error initializing internal Gemini model: {str(e)}")
+                logger.error("Make sure genai.configure() was called before using AnalysisTools.")
+                self._internal_gemini_model_failed = True
+        return self._internal_gemini_model
 
     async def analyze_text_with_gemini(self, text: str) -> Dict:
         """Analisa texto usando o Gemini Flash. Usado internamente por AnalysisTools."""
@@ -62,6 +206,7 @@ class AnalysisTools:
             }
 
         try:
+            from google.generativeai.types import HarmCategory, HarmBlockThreshold
             safety_settings = {
                 HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
                 HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
@@ -146,6 +291,11 @@ class AnalysisTools:
         """
         Analyze an image for text content using OCR.
         Does NOT call Gemini; returns extracted text for app.py to handle.
+        OCR runs in the OCR process pool (or a worker thread when no pool is
+        set), never on the calling event loop.
+        
+        Raises:
+            OCRQueueFullError: If the OCR pool cannot accept more jobs
         """
         results = {
             'extracted_text': '',
@@ -155,48 +305,39 @@ class AnalysisTools:
         
         try:
             logger.info("AnalysisTools: Analyzing image data for OCR...")
-            image = Image.open(io.BytesIO(image_data))
-            logger.info("AnalysisTools: Image opened with PIL.")
-            
-            try:
-                available_langs = []
-                try:
-                    available_langs = pytesseract.get_languages(config='')
-                except pytesseract.TesseractError as te:
-                    logger.warning(f"Pytesseract could not get languages: {te}")
-
-                if 'por' in available_langs and 'eng' in available_langs:
-                    lang_to_use = 'por+eng'
-                elif 'por' in available_langs:
-                    lang_to_use = 'por'
-                elif 'eng' in available_langs:
-                    lang_to_use = 'eng'
-                else: 
-                    lang_to_use = 'eng'
-                    if not available_langs:
-                        logger.warning(f"Could not detect Tesseract languages. Falling back to '{lang_to_use}'.")
-                    else:
-                        logger.warning(f"Portuguese ('por') not found in Tesseract languages ({available_langs}). Using '{lang_to_use}'.")
-            except Exception as lang_e:
-                lang_to_use = 'por+eng' 
-                logger.warning(f"Error determining Tesseract languages: {lang_e}. Defaulting to 'por+eng'.")
-
-            extracted_text = pytesseract.image_to_string(image, lang=lang_to_use) 
+            self.metrics['ocr_requests'] += 1
+            lang_to_use = self._ocr_lang or await asyncio.to_thread(getattr, self, 'ocr_lang')
+            if self.ocr_pool is not None:
+                extracted_text, engine = await self.ocr_pool.extract_text(image_data, lang_to_use)
+            else:
+                extracted_text, engine = await asyncio.to_thread(
+                    run_ocr, image_data, lang_to_use, 0, self.ocr_engine, self.ocr_preprocess
+                )
+            if engine == 'subprocess':
+                self.metrics['ocr_subprocess_spawns'] += 1
+            else:
+                self.metrics['ocr_engine_calls'] += 1
             results['extracted_text'] = extracted_text.strip()
             logger.info(f"AnalysisTools: OCR Extracted text (first 100 chars): {results['extracted_text'][:100]}")
             
             if results['extracted_text']:
-                urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', 
-                                extracted_text)
+                urls = extract_urls(extracted_text)
                 results['urls_found'].extend(urls)
                 logger.info(f"AnalysisTools: URLs found in OCRed image text: {urls}")
 
-        except pytesseract.TesseractNotFoundError:
+        except OCRQueueFullError:
+            raise
+        except OCRTimeoutError as te:
+            error_msg = f"Tempo limite do OCR excedido: {str(te)}"
+            logger.error(error_msg)
+            results['error'] = error_msg
+            results['extracted_text'] = "[ERRO OCR: Tempo limite excedido]"
+        except OCRUnavailableError:
             error_msg = "Tesseract (OCR) não está instalado ou configurado corretamente. A extração de texto de imagem falhou."
             logger.error(error_msg)
             results['error'] = error_msg
             results['extracted_text'] = "[ERRO OCR: Tesseract não encontrado ou não configurado]"
-        except pytesseract.TesseractError as te:
+        except OCREngineError as te:
             error_msg = f"Erro do Tesseract OCR: {str(te)}. Verifique se os pacotes de idioma (ex: 'por', 'eng') estão instalados."
             logger.error(error_msg, exc_info=True)
             results['error'] = error_msg
@@ -212,7 +353,11 @@ class AnalysisTools:
     async def analyze_urls(self, urls: List[str]) -> Dict:
         """
         Analyze a list of URLs for safety using Google Safe Browsing API.
+        Distinct valid URLs are checked in batched requests; every input URL
+        gets its own entry in 'url_analysis'.
         """
+        import validators
+        
         results = {
             'url_analysis': [], # Will store detailed analysis for each URL
             'suspicious_urls_detected': [] # Will store only URLs flagged as suspicious
@@ -231,91 +376,90 @@ class AnalysisTools:
                 })
             return results
 
-        # The Safe Browsing API v4 lookup endpoint
-        api_url = f"https://safebrowsing.googleapis.com/v4/threatMatches:find?key={self.google_safe_browsing_key}"
+        entries = []
+        valid_urls = []
+        for url_item in urls:
+            url = str(url_item) # Defensive casting
+            analysis_entry = {
+                'url': url,
+                'is_safe': None, # True (safe), False (unsafe), None (error/undetermined)
+                'status_message': 'Pending check',
+                'threat_types': [],
+                'details': ''
+            }
+            if not validators.url(url):
+                analysis_entry['is_safe'] = False
+                analysis_entry['status_message'] = 'Invalid URL format.'
+                analysis_entry['details'] = 'The provided string is not a valid URL.'
+            else:
+                valid_urls.append(url)
+            entries.append(analysis_entry)
 
-        async with aiohttp.ClientSession() as session:
-            for url_item in urls:
-                url = str(url_item) # Defensive casting
-                analysis_entry = {
-                    'url': url,
-                    'is_safe': None, # True (safe), False (unsafe), None (error/undetermined)
-                    'status_message': 'Pending check',
-                    'threat_types': [],
-                    'details': ''
-                }
-
-                if not validators.url(url):
-                    analysis_entry['is_safe'] = False
-                    analysis_entry['status_message'] = 'Invalid URL format.'
-                    analysis_entry['details'] = 'The provided string is not a valid URL.'
-                    results['url_analysis'].append(analysis_entry)
-                    if url not in results['suspicious_urls_detected']:
-                        results['suspicious_urls_detected'].append(url)
-                    continue
-
-                payload = {
-                    "client": {
-                        "clientId": "seraquegolpe-app",
-                        "clientVersion": "1.0.0"
-                    },
-                    "threatInfo": {
-                        "threatTypes": ["MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE", "POTENTIALLY_HARMFUL_APPLICATION"],
-                        "platformTypes": ["ANY_PLATFORM"],
-                        "threatEntryTypes": ["URL"],
-                        "threatEntries": [
-                            {"url": url}
-                        ]
-                    }
-                }
+        # One batched request per 500 distinct URLs instead of one per URL, on
+        # the app-lifetime pooled session (no per-call DNS/TCP/TLS setup)
+        lookups = await get_http_client().run(
+            lambda session: self.safe_browsing.find_threat_matches(session, valid_urls)
+        )
 
-                try:
-                    # Using aiohttp for async HTTP requests
-                    async with session.post(api_url, json=payload, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                        response.raise_for_status()
-                        sb_data = await response.json()
-
-                        if sb_data and 'matches' in sb_data:
-                            analysis_entry['is_safe'] = False
-                            analysis_entry['status_message'] = 'Potentially unsafe URL detected.'
-                            for match in sb_data['matches']:
-                                threat_type = match.get('threatType', 'UNKNOWN')
-                                analysis_entry['threat_types'].append(threat_type)
-                                analysis_entry['details'] += f"Threat: {threat_type}. "
-                            if url not in results['suspicious_urls_detected']:
-                                results['suspicious_urls_detected'].append(url)
-                        else:
-                            analysis_entry['is_safe'] = True
-                            analysis_entry['status_message'] = 'No threats found by Google Safe Browsing.'
-                            analysis_entry['details'] = 'This URL is not currently listed as unsafe.'
-
-                except aiohttp.ClientResponseError as http_err:
-                    error_message = f"HTTP error during Safe Browsing check: {http_err}"
-                    logger.error(error_message)
-                    analysis_entry['is_safe'] = None # Undetermined due to error
-                    analysis_entry['status_message'] = 'Error during Safe Browsing check (HTTP).'
-                    analysis_entry['details'] = str(http_err)
-                except aiohttp.ClientError as client_err:
-                    logger.error(f"Client error during Safe Browsing check: {client_err}")
-                    analysis_entry['is_safe'] = None # Undetermined
-                    analysis_entry['status_message'] = 'Error during Safe Browsing check (Network/Request).'
-                    analysis_entry['details'] = str(client_err)
-                except asyncio.TimeoutError:
-                    logger.error(f"Timeout during Safe Browsing check for {url}")
-                    analysis_entry['is_safe'] = None
-                    analysis_entry['status_message'] = 'Safe Browsing check timed out.'
-                    analysis_entry['details'] = 'The request to Google Safe Browsing API timed out.'
-                except Exception as e:
-                    logger.error(f"Unexpected error during Safe Browsing check for {url}: {e}", exc_info=True)
-                    analysis_entry['is_safe'] = None # Undetermined
-                    analysis_entry['status_message'] = 'Unexpected error during Safe Browsing check.'
-                    analysis_entry['details'] = str(e)
-                
-                results['url_analysis'].append(analysis_entry)
+        for analysis_entry in entries:
+            url = analysis_entry['url']
+            lookup = lookups.get(url)
+            if lookup is not None:
+                self._apply_threat_lookup(analysis_entry, lookup)
+            results['url_analysis'].append(analysis_entry)
+            if analysis_entry['is_safe'] is False and url not in results['suspicious_urls_detected']:
+                results['suspicious_urls_detected'].append(url)
         
         return results
 
-    async def verify_document(self, file_data: bytes) -> Dict:
+    def _apply_threat_lookup(self, analysis_entry: Dict, lookup: ThreatLookup):
+        """Fill an analyze_urls entry from the Safe Browsing result for its URL."""
+        import aiohttp
+        
+        url = analysis_entry['url']
+        error = lookup.error
+        if error is None:
+            if lookup.matches:
+                analysis_entry['is_safe'] = False
+                analysis_entry['status_message'] = 'Potentially unsafe URL detected.'
+                for match in lookup.matches:
+                    threat_type = match.get('threatType', 'UNKNOWN')
+                    analysis_entry['threat_types'].append(threat_type)
+                    analysis_entry['details'] += f"Threat: {threat_type}. "
+            else:
+                analysis_entry['is_safe'] = True
+                analysis_entry['status_message'] = 'No threats found by Google Safe Browsing.'
+                analysis_entry['details'] = 'This URL is not currently listed as unsafe.'
+        elif isinstance(error, aiohttp.ClientResponseError):
+            logger.error(f"HTTP error during Safe Browsing check: {error}")
+            analysis_entry['is_safe'] = None # Undetermined due to error
+            analysis_entry['status_message'] = 'Error during Safe Browsing check (HTTP).'
+            analysis_entry['details'] = str(error)
+        elif isinstance(error, aiohttp.ClientError):
+            logger.error(f"Client error during Safe Browsing check: {error}")
+            analysis_entry['is_safe'] = None # Undetermined
+            analysis_entry['status_message'] = 'Error during Safe Browsing check (Network/Request).'
+            analysis_entry['details'] = str(error)
+        elif isinstance(error, asyncio.TimeoutError):
+            logger.error(f"Timeout during Safe Browsing check for {url}")
+            analysis_entry['is_safe'] = None
+            analysis_entry['status_message'] = 'Safe Browsing check timed out.'
+            analysis_entry['details'] = 'The request to Google Safe Browsing API timed out.'
+        else:
+            logger.error(f"Unexpected error during Safe Browsing check for {url}: {error}")
+            analysis_entry['is_safe'] = None # Undetermined
+            analysis_entry['status_message'] = 'Unexpected error during Safe Browsing check.'
+            analysis_entry['details'] = str(error)
+
+    async def verify_document(self, file_data: bytes, deadline: Optional[Deadline] = None) -> Dict:
+        """Extract and analyze the content of an uploaded document.
+
+        URLs found in the content are checked with Safe Browsing concurrently
+        with the Gemini analysis of the text; stages that overrun ``deadline``
+        (``analysis_deadline`` from now by default) are listed in
+        'timed_out_stages' and the rest is returned.
+        """
+        deadline = deadline or Deadline(self.analysis_deadline)
         results = {
             'file_type': 'Desconhecido',
             'text_content': None, 
@@ -326,9 +470,10 @@ class AnalysisTools:
             'error': None,
             'gemini_analysis': None 
         }
+        stages = {}
         
         try:
-            mime_type = magic.from_buffer(file_data, mime=True)
+            mime_type = get_mime_detector().detect(file_data[:SNIFF_BYTES])
             results['file_type'] = mime_type
             logger.info(f"AnalysisTools: Verifying document. Detected MIME type: {mime_type}")
             
@@ -339,7 +484,7 @@ class AnalysisTools:
             
             elif 'image' in mime_type: 
                 logger.info("AnalysisTools: Document is an image, analyzing with analyze_image...")
-                image_analysis_results = await self.analyze_image(file_data)
+                image_analysis_results = (await run_stages({'ocr': self.analyze_image(file_data)}, deadline))['ocr'].result()
                 results.update(image_analysis_results) 
                 if image_analysis_results.get('error'):
                     results['error'] = image_analysis_results['error']
@@ -355,14 +500,13 @@ class AnalysisTools:
                     logger.info(f"AnalysisTools: Text-based document content (first 100 chars): {str(results['text_content'])[:100]}")
                     
                     if results['text_content'] and not results['text_content'].startswith("["):
-                        urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', 
-                                        results['text_content'])
+                        urls = extract_urls(results['text_content'])
                         results['urls_found'].extend(urls)
                         logger.info(f"AnalysisTools: URLs found in text document: {urls}")
                         
                         if self.internal_gemini_model:
                             logger.info("AnalysisTools: Analyzing extracted document text with its own Gemini model...")
-                            results['gemini_analysis'] = await self.analyze_text_with_gemini(results['text_content'])
+                            stages['gemini'] = self.analyze_text_with_gemini(results['text_content'])
                             
                 except UnicodeDecodeError:
                     err_msg = "Não foi possível decodificar o arquivo de texto (provavelmente não é UTF-8 puro)."
@@ -376,9 +520,26 @@ class AnalysisTools:
                 results['text_content'] = f"[{warn_msg}]"
                 logger.info(warn_msg)
 
+            # URL checks and the Gemini analysis only need the extracted text
+            if results['urls_found']:
+                stages['urls'] = self.analyze_urls(results['urls_found'])
+            outcomes = await run_stages(stages, deadline)
+            stages.clear()
+            if timed_out_stages(outcomes):
+                results['timed_out_stages'] = timed_out_stages(outcomes)
+                results['warnings'].append('Parte da análise não terminou a tempo; os resultados estão incompletos.')
+            if outcomes.get('urls') and outcomes['urls'].status == 'ok':
+                results.update(outcomes['urls'].value)
+            if outcomes.get('gemini') and outcomes['gemini'].status == 'ok':
+                results['gemini_analysis'] = outcomes['gemini'].value
+
         except Exception as e:
             error_msg = f"Erro ao processar documento: {str(e)}"
             results['error'] = error_msg
             logger.error(error_msg, exc_info=True)
+        finally:
+            # Close stage coroutines that never ran because of an earlier error
+            for coro in stages.values():
+                coro.close()
         
         return results
\ No newline at end of file
@@ -1,8 +1,10 @@
 """Async utilities for the Flask application."""
 import asyncio
+import concurrent.futures
+import threading
 from functools import wraps
 import structlog
-from typing import Callable, Any, Coroutine
+from typing import Callable, Any, Coroutine, Optional
 
 logger = structlog.get_logger()
 
@@ -78,4 +80,76 @@ def background_task(f: Callable) -> Callable:
                         error=str(e),
                         exc_info=True)
             raise
-    return wrapper 
\ No newline at end of file
+    return wrapper
+
+class BackgroundEventLoop:
+    """An event loop running forever in a dedicated daemon thread.
+    
+    Coroutines submitted from any thread (or any other event loop) run on this
+    loop, so long-lived async resources such as gRPC channels and HTTP
+    sessions are created once and reused instead of being torn down with a
+    per-call asyncio.run().
+    """
+    
+    def __init__(self, name: str = "background_loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started on first access."""
+        if self._loop is None:
+            self.start()
+        return self._loop
+    
+    def start(self):
+        """Start the loop thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            ready = threading.Event()
+            
+            def _run():
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                self._loop = loop
+                ready.set()
+                try:
+                    loop.run_forever()
+                finally:
+                    self._cancel_pending(loop)
+                    loop.close()
+            
+            self._thread = threading.Thread(target=_run, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"Background event loop '{self.name}' started")
+    
+    @staticmethod
+    def _cancel_pending(loop: asyncio.AbstractEventLoop):
+        pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    async def run(self, coro: Coroutine) -> Any:
+        """Await a coroutine running on the background loop from another loop."""
+        return await asyncio.wrap_future(self.submit(coro))
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop, cancelling whatever is still running on it."""
+        with self._lock:
+            if self._loop is None or self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._loop = None
+            self._thread = None
+            logger.info(f"Background event loop '{self.name}' stopped")
@@ -0,0 +1,362 @@
+"""Caching utilities for analysis verdicts."""
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from utils.safe_browsing import ThreatLookup, parse_duration
+from utils.safe_browsing_db import canonicalize_url
+
+logger = structlog.get_logger()
+
+# Zero-width joiner and variation selectors glue emoji sequences together
+_EMOJI_JOINERS = {'\u200d', '\ufe0e', '\ufe0f'}
+
+
+def _is_emoji(char: str) -> bool:
+    """Return True for pictographic symbols and emoji modifiers."""
+    if char in _EMOJI_JOINERS:
+        return True
+    return unicodedata.category(char) in ('So', 'Sk', 'Cs')
+
+
+def normalize_message(text: str) -> str:
+    """Normalize a message so trivially different copies hash the same.
+
+    Applies NFKC normalization, case folding, emoji removal and whitespace
+    collapsing. Forwarded WhatsApp/SMS messages often differ only in these
+    respects.
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = ''.join(char for char in text if not _is_emoji(char))
+    return ' '.join(text.split())
+
+
+def make_cache_key(text: str, model_name: str, generation_config: Optional[Dict] = None,
+                   namespace: str = 'verdict') -> str:
+    """Build a content-addressed cache key for a prompt/model/config triple."""
+    config_blob = json.dumps(generation_config or {}, sort_keys=True, default=str)
+    digest = hashlib.sha256()
+    for part in (normalize_message(text), model_name or '', config_blob):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return f"{namespace}:{digest.hexdigest()}"
+
+
+class LocalCacheBackend:
+    """Thread-safe in-process LRU cache with TTL and a size cap in bytes.
+
+    Exposes the same ``get``/``set``/``delete`` interface as the cachelib
+    backends used by flask_caching, so both can be used interchangeably.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, default_timeout: int = 3600):
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _sizeof(key: str, value: Any) -> int:
+        if isinstance(value, (bytes, bytearray)):
+            value_size = len(value)
+        elif isinstance(value, str):
+            value_size = len(value.encode('utf-8'))
+        else:
+            value_size = len(json.dumps(value, default=str).encode('utf-8'))
+        return len(key) + value_size
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._size -= size
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        size = self._sizeof(key, value)
+        if size > self.max_bytes:
+            return False
+        timeout = self.default_timeout if timeout is None else timeout
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (expires_at, size, value)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self._size -= entry[1]
+            return True
+
+    def clear(self) -> bool:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class VerdictCache:
+    """Content-addressed cache of Gemini verdicts.
+
+    Follows the Flask extension pattern: instantiate once in extensions.py and
+    call ``init_app`` from the app factory. By default verdicts live in a
+    process-local LRU; setting ``VERDICT_CACHE_BACKEND = 'shared'`` stores them
+    in the flask_caching backend instead (e.g. Redis via ``CACHE_TYPE``) so
+    every worker shares them.
+    """
+
+    def __init__(self, backend: Any = None, timeout: int = 3600, enabled: bool = True):
+        self.backend = backend or LocalCacheBackend(default_timeout=timeout)
+        self.timeout = timeout
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.metrics = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'errors': 0,
+        }
+
+    def init_app(self, app, shared_cache=None):
+        """Configure the cache from the Flask app config.
+
+        Args:
+            app: The Flask application
+            shared_cache: flask_caching ``Cache`` used when the backend is 'shared'
+        """
+        self.enabled = app.config.get('VERDICT_CACHE_ENABLED', True)
+        self.timeout = app.config.get('VERDICT_CACHE_TTL', self.timeout)
+        backend_name = app.config.get('VERDICT_CACHE_BACKEND', 'local')
+
+        if backend_name == 'shared' and shared_cache is not None:
+            # flask_caching keeps the concrete cachelib backend per app
+            self.backend = app.extensions['cache'][shared_cache]
+        else:
+            self.backend = LocalCacheBackend(
+                max_bytes=app.config.get('VERDICT_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+                default_timeout=self.timeout
+            )
+        app.extensions['verdict_cache'] = self
+        logger.info(f"Verdict cache initialized: backend={backend_name}, ttl={self.timeout}s, enabled={self.enabled}")
+
+    def key_for(self, text: str, model_name: str, generation_config: Optional[Dict] = None) -> str:
+        return make_cache_key(text, model_name, generation_config)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Verdict cache lookup failed: {str(e)}")
+            return None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key: str, value: str, timeout: Optional[int] = None):
+        if not self.enabled or not value:
+            return
+        try:
+            if self.backend.set(key, value, timeout=self.timeout if timeout is None else timeout):
+                self._count('stores')
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Verdict cache store failed: {str(e)}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {f"cache_{name}": value for name, value in self.metrics.items()}
+        lookups = metrics['cache_hits'] + metrics['cache_misses']
+        metrics['cache_hit_rate'] = metrics['cache_hits'] / lookups if lookups else 0.0
+        if isinstance(self.backend, LocalCacheBackend):
+            metrics.update({f"cache_{name}": value for name, value in self.backend.stats().items()})
+        return metrics
+
+
+class UrlVerdictCache:
+    """Cache of Safe Browsing verdicts keyed by canonicalized URL.
+
+    Positive verdicts live for the smallest ``cacheDuration`` of their
+    matches and clean ones for the API's ``negativeCacheDuration`` (or
+    ``negative_ttl`` when the response carries none), both capped at
+    ``max_ttl``. A match on a host's root URL is also stored for the host:
+    every URL on that host includes the ``host/`` expression, so it is
+    listed too. Lookup errors are never cached. The backend is chosen like
+    VerdictCache's: process-local by default, or the shared flask_caching
+    backend with ``URL_VERDICT_CACHE_BACKEND = 'shared'``.
+    """
+
+    def __init__(self, backend: Any = None, negative_ttl: int = 300, max_ttl: int = 3600,
+                 enabled: bool = True):
+        self.backend = backend or LocalCacheBackend(max_bytes=8 * 1024 * 1024, default_timeout=negative_ttl)
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.metrics = {
+            'lookups': 0,
+            'hits': 0,
+            'host_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'errors': 0,
+        }
+
+    def init_app(self, app, shared_cache=None):
+        """Configure the cache from the Flask app config.
+
+        Args:
+            app: The Flask application
+            shared_cache: flask_caching ``Cache`` used when the backend is 'shared'
+        """
+        self.enabled = app.config.get('URL_VERDICT_CACHE_ENABLED', True)
+        self.negative_ttl = app.config.get('URL_VERDICT_CACHE_NEGATIVE_TTL', self.negative_ttl)
+        self.max_ttl = app.config.get('URL_VERDICT_CACHE_MAX_TTL', self.max_ttl)
+        backend_name = app.config.get('URL_VERDICT_CACHE_BACKEND', 'local')
+
+        if backend_name == 'shared' and shared_cache is not None:
+            self.backend = app.extensions['cache'][shared_cache]
+        else:
+            self.backend = LocalCacheBackend(
+                max_bytes=app.config.get('URL_VERDICT_CACHE_MAX_BYTES', 8 * 1024 * 1024),
+                default_timeout=self.negative_ttl
+            )
+        app.extensions['url_verdict_cache'] = self
+        logger.info(f"URL verdict cache initialized: backend={backend_name}, enabled={self.enabled}")
+
+    @staticmethod
+    def _keys(url: str) -> Optional[Tuple[str, str, bool]]:
+        """Return (url key, host key, whether the URL is the host root) or None."""
+        canonical = canonicalize_url(url)
+        if canonical is None:
+            return None
+        host, path, query = canonical
+        expression = f"{host}{path}?{query}" if query else f"{host}{path}"
+        url_digest = hashlib.sha256(expression.encode('utf-8')).hexdigest()
+        host_digest = hashlib.sha256(host.encode('utf-8')).hexdigest()
+        return f"url_verdict:{url_digest}", f"url_verdict_host:{host_digest}", path == '/' and not query
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.metrics[name] += value
+
+    def _backend_get(self, key: str) -> Any:
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"URL verdict cache lookup failed: {str(e)}")
+            return None
+
+    def _backend_set(self, key: str, value: Any, ttl: float):
+        ttl = int(min(ttl, self.max_ttl))
+        if ttl <= 0:
+            # A zero timeout means "never expires" to the backends
+            return
+        try:
+            if self.backend.set(key, value, timeout=ttl):
+                self._count('stores')
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"URL verdict cache store failed: {str(e)}")
+
+    def get_many(self, urls: List[str]) -> Dict[str, ThreatLookup]:
+        """Return cached verdicts for the URLs that have one.
+
+        Returns:
+            Dict mapping each cached URL to a ThreatLookup whose matches name
+            that URL
+        """
+        if not self.enabled:
+            return {}
+        results = {}
+        for url in urls:
+            self._count('lookups')
+            keys = self._keys(url)
+            if keys is None:
+                self._count('misses')
+                continue
+            url_key, host_key, _ = keys
+            matches = self._backend_get(url_key)
+            if matches is not None:
+                self._count('hits')
+            else:
+                matches = self._backend_get(host_key)
+                if matches is None:
+                    self._count('misses')
+                    continue
+                self._count('host_hits')
+            results[url] = ThreatLookup([{**match, 'threat': {'url': url}} for match in matches])
+        return results
+
+    def store_many(self, lookups: Dict[str, ThreatLookup]):
+        """Cache the verdicts of successful lookups."""
+        if not self.enabled:
+            return
+        for url, lookup in lookups.items():
+            keys = self._keys(url)
+            if lookup.error is not None or keys is None:
+                continue
+            url_key, host_key, is_host_root = keys
+            if lookup.matches:
+                ttl = min(parse_duration(match.get('cacheDuration'), self.negative_ttl)
+                          for match in lookup.matches)
+                self._backend_set(url_key, lookup.matches, ttl)
+                if is_host_root:
+                    self._backend_set(host_key, lookup.matches, ttl)
+            else:
+                ttl = lookup.negative_cache_duration
+                self._backend_set(url_key, [], self.negative_ttl if ttl is None else ttl)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {f"url_cache_{name}": value for name, value in self.metrics.items()}
+        hits = metrics['url_cache_hits'] + metrics['url_cache_host_hits']
+        lookups = metrics['url_cache_lookups']
+        metrics['url_cache_hit_rate'] = hits / lookups if lookups else 0.0
+        if isinstance(self.backend, LocalCacheBackend):
+            metrics.update({f"url_cache_{name}": value for name, value in self.backend.stats().items()})
+        return metrics
@@ -0,0 +1,160 @@
+"""MIME type detection for uploads with a shared libmagic handle pool."""
+import queue
+import threading
+from typing import Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Reported for files neither the signatures nor libmagic could identify
+UNKNOWN_MIME_TYPE = 'application/octet-stream'
+_WEBP_RIFF = b'RIFF'
+_TEXT_CONTROL_BYTES = bytes(range(0, 9)) + b'\x0b' + bytes(range(14, 32)) + b'\x7f'
+
+
+class MimeDetectionError(Exception):
+    """Raised when libmagic cannot be loaded or no handle frees up in time."""
+    pass
+
+
+def detect_signature(head: bytes) -> Optional[str]:
+    """Identify the common upload types from their leading bytes.
+
+    Covers PNG, JPEG, WebP, PDF and plain UTF-8 text. Anything else,
+    including markup that libmagic would report as HTML or XML, returns None
+    and needs libmagic.
+    """
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(_WEBP_RIFF) and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    return _detect_plain_text(head)
+
+
+def _detect_plain_text(head: bytes) -> Optional[str]:
+    stripped = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if not stripped or stripped[:1] in (b'<', b'{', b'[', b'#', b'%'):
+        return None
+    if len(head.translate(None, _TEXT_CONTROL_BYTES)) != len(head):
+        return None
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # The sniffed head may end in the middle of a multi-byte character
+        if e.start < len(head) - 3:
+            return None
+    return 'text/plain'
+
+
+class MimeDetector:
+    """Thread-safe MIME detection shared across the app.
+
+    Signatures of the common upload types are checked in Python first. Other
+    files go to libmagic through a small pool of ``magic.Magic`` handles, each
+    created once (loading the magic database) and used by one thread at a
+    time, since a libmagic cookie must not be shared concurrently. When
+    libmagic is missing (common on Windows) such files are reported as
+    ``application/octet-stream`` instead of failing the request.
+    """
+
+    def __init__(self, pool_size: int = 4, acquire_timeout: float = 5.0):
+        self.pool_size = pool_size
+        # Seconds to wait for a busy handle before giving up
+        self.acquire_timeout = acquire_timeout
+        self._handles: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.metrics = {
+            'detections': 0,
+            'fast_path_hits': 0,
+            'libmagic_calls': 0,
+            'libmagic_handles': 0,
+            'libmagic_errors': 0,
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def _acquire_handle(self):
+        try:
+            return self._handles.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if not create:
+            try:
+                return self._handles.get(timeout=self.acquire_timeout)
+            except queue.Empty:
+                raise MimeDetectionError("No libmagic handle became available") from None
+        try:
+            import magic
+            handle = magic.Magic(mime=True)
+        except Exception as e:
+            # Give the slot back so a later call can try again instead of waiting forever
+            with self._lock:
+                self._created -= 1
+            raise MimeDetectionError(f"libmagic is unavailable: {e}") from e
+        self._count('libmagic_handles')
+        return handle
+
+    def from_libmagic(self, head: bytes) -> str:
+        """Detect a MIME type with libmagic, bypassing the signature check.
+
+        Raises:
+            MimeDetectionError: If libmagic is unavailable or every handle stays busy
+        """
+        handle = self._acquire_handle()
+        try:
+            self._count('libmagic_calls')
+            return handle.from_buffer(head)
+        finally:
+            self._handles.put(handle)
+
+    def detect(self, head: bytes) -> str:
+        """Detect the MIME type of a file from its first bytes.
+
+        Args:
+            head: The first bytes of the file (see utils.uploads.SNIFF_BYTES)
+
+        Returns:
+            The MIME type, e.g. 'image/png', or ``application/octet-stream``
+            when libmagic is needed but unavailable
+        """
+        self._count('detections')
+        mime_type = detect_signature(head)
+        if mime_type is not None:
+            self._count('fast_path_hits')
+            return mime_type
+        try:
+            return self.from_libmagic(head)
+        except MimeDetectionError as e:
+            self._count('libmagic_errors')
+            logger.warning(f"MIME detection fell back to {UNKNOWN_MIME_TYPE}: {str(e)}")
+            return UNKNOWN_MIME_TYPE
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {f"mime_{name}": value for name, value in self.metrics.items()}
+
+
+_shared_detector = None
+_shared_detector_lock = threading.Lock()
+
+
+def get_mime_detector() -> MimeDetector:
+    """Return the process-wide MimeDetector, creating it on first use."""
+    global _shared_detector
+    if _shared_detector is None:
+        with _shared_detector_lock:
+            if _shared_detector is None:
+                _shared_detector = MimeDetector()
+    return _shared_detector
@@ -0,0 +1,203 @@
+"""Throughput benchmark of GeminiThreadManager against a local fake Gemini backend.
+
+Usage:
+    python -m utils.gemini_benchmark [--requests 500] [--concurrency 50] [--latency-ms 200]
+                                     [--slots 64] [--legacy-workers 5]
+
+A local aiohttp server stands in for Gemini: it waits ``--latency-ms`` and
+returns a verdict. The fake model talks to it over HTTP with one session per
+event loop, like the real client keeps one channel per loop. Two designs are
+timed under the same load of ``--concurrency`` callers:
+
+- legacy: a thread pool where every call runs ``asyncio.run`` and therefore
+  opens (and tears down) its own connection, at most ``--legacy-workers``
+  calls at a time, as GeminiThreadManager did before;
+- loop: GeminiThreadManager multiplexing calls on its long-lived event loop
+  with ``--slots`` admission slots.
+
+Reports requests/sec and p50/p99 latency of each, and the connections the
+fake backend accepted.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import logging
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import structlog
+
+from utils.async_utils import BackgroundEventLoop
+from utils.gemini_thread import GeminiThreadManager
+
+VERDICT = '{"risk_level": "Baixo", "summary": "benchmark", "alerts": [], "recommendation": "-"}'
+
+
+class FakeGeminiBackend:
+    """Local HTTP server answering every prompt after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.url = None
+        self._peers = set()
+        self._loop = BackgroundEventLoop("fake_gemini_backend")
+        self._runner = None
+
+    @property
+    def connections(self) -> int:
+        return len(self._peers)
+
+    def start(self):
+        self._loop.submit(self._start()).result(10)
+
+    async def _start(self):
+        from aiohttp import web
+
+        async def generate(request):
+            # Each connection has its own client port
+            self._peers.add(request.transport.get_extra_info('peername'))
+            await request.read()
+            await asyncio.sleep(self.latency)
+            return web.json_response({'text': VERDICT})
+
+        app = web.Application()
+        app.router.add_post('/generate', generate)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/generate"
+
+    def stop(self):
+        self._loop.submit(self._runner.cleanup()).result(10)
+        self._loop.stop()
+
+
+class FakeResponse:
+    prompt_feedback = None
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel with one HTTP session per event loop."""
+
+    model_name = 'fake-gemini'
+    # Explicit settings keep GeminiThreadManager from importing google.generativeai
+    _custom_safety_settings = {'benchmark': 'none'}
+
+    def __init__(self, url: str):
+        self.url = url
+        self._sessions = {}
+
+    def _session(self):
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None:
+            session = self._sessions[loop] = aiohttp.ClientSession()
+        return session
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> FakeResponse:
+        async with self._session().post(self.url, json={'prompt': prompt}) as response:
+            return FakeResponse((await response.json())['text'])
+
+    async def close_session(self):
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+def legacy_call(model: FakeModel, prompt: str) -> FakeResponse:
+    """One call the old way: a fresh event loop, and with it a fresh connection."""
+    async def _call():
+        try:
+            return await model.generate_content_async(prompt)
+        finally:
+            await model.close_session()
+    return asyncio.run(_call())
+
+
+async def drive(call: Callable[[str], Awaitable], requests: int, concurrency: int) -> Dict[str, float]:
+    """Issue ``requests`` calls from ``concurrency`` callers; return throughput and latency."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def _one(number: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(f"mensagem {number}")
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_one(number) for number in range(requests)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1e3 if latencies else 0.0,
+        'p99_ms': latencies[int(0.99 * (len(latencies) - 1))] * 1e3 if latencies else 0.0,
+        'errors': errors,
+    }
+
+
+def run_legacy(backend: FakeGeminiBackend, requests: int, concurrency: int, workers: int) -> Dict[str, float]:
+    model = FakeModel(backend.url)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        async def call(prompt):
+            return await asyncio.get_running_loop().run_in_executor(executor, legacy_call, model, prompt)
+        return asyncio.run(drive(call, requests, concurrency))
+
+
+def run_loop(backend: FakeGeminiBackend, requests: int, concurrency: int, slots: int) -> Dict[str, float]:
+    model = FakeModel(backend.url)
+    manager = GeminiThreadManager(max_workers=slots, queue_size=requests, default_timeout=60.0)
+    try:
+        async def call(prompt):
+            return await manager.generate_content(model, prompt, use_cache=False, lane='api')
+        return asyncio.run(drive(call, requests, concurrency))
+    finally:
+        manager.event_loop.submit(model.close_session()).result(10)
+        manager.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark GeminiThreadManager against a fake Gemini backend.")
+    parser.add_argument('--requests', type=int, default=500, help="Calls per design")
+    parser.add_argument('--concurrency', type=int, default=50, help="Concurrent callers")
+    parser.add_argument('--latency-ms', type=float, default=200.0, help="Fake backend latency per call")
+    parser.add_argument('--slots', type=int, default=64, help="GeminiThreadManager in-flight slots")
+    parser.add_argument('--legacy-workers', type=int, default=5, help="Threads of the per-call asyncio.run design")
+    args = parser.parse_args(argv)
+    # Per-call debug logs of the manager would dominate the output
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    backend = FakeGeminiBackend(args.latency_ms / 1e3)
+    backend.start()
+    failed = False
+    try:
+        print(f"{args.requests} calls, {args.concurrency} concurrent, backend latency {args.latency_ms:.0f} ms")
+        print(f"{'design':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'connections':>13}{'errors':>8}")
+        for name, run, limit in (('legacy', run_legacy, args.legacy_workers), ('loop', run_loop, args.slots)):
+            connections_before = backend.connections
+            result = run(backend, args.requests, args.concurrency, limit)
+            print(f"{name:<8}{result['rps']:>10.1f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                  f"{backend.connections - connections_before:>13}{result['errors']:>8}")
+            failed = failed or bool(result['errors'])
+    finally:
+        backend.stop()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,14 +19,9 @@ class GeminiClient:
         self.model_name = model_name
         try:
             self.model = genai.GenerativeModel(self.model_name)
+            # No test call here: constructing a client must not touch the network.
+            # Reachability is checked by the app's background health probe.
             logger.info("gemini.client.initialized", model=self.model_name)
-            
-            # Test the connection
-            test_response = self.model.generate_content("Test connection. Respond with 'OK'.")
-            if test_response and test_response.text:
-                logger.info("gemini.client.test_successful", response=test_response.text)
-            else:
-                raise Exception("Received empty response from model during test")
                 
         except Exception as e:
             logger.error("gemini.client.initialization_failed", error=str(e))
@@ -1,22 +1,28 @@
 """Thread-based utilities for Gemini API calls."""
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import structlog
-from functools import partial
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from queue import Full
 import time
-from typing import Optional, Dict, Any
+import json
+import threading
+from typing import Optional, Dict, Any, Callable, List, Sequence
+from utils.caching import VerdictCache
+from utils.async_utils import BackgroundEventLoop
+from utils.admission import AdmissionController, AdmissionQueueFullError, AdmissionTimeoutError
 
 logger = structlog.get_logger()
 
-DEFAULT_SAFETY_SETTINGS = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
+def default_safety_settings() -> Dict:
+    """Safety settings used when none are given.
+    
+    Built on demand so importing this module does not import google.generativeai.
+    """
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+    return {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
 
 DEFAULT_GENERATION_CONFIG = {
     "temperature": 0.7,
@@ -28,45 +34,77 @@ class GeminiThreadManagerError(Exception):
     pass
 
 class GeminiQueueFullError(GeminiThreadManagerError):
-    """Raised when the thread pool queue is full."""
-    pass
+    """Raised when the admission queue is full."""
+    def __init__(self, message: str = "Gemini request queue is full", retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 class GeminiTimeoutError(GeminiThreadManagerError):
     """Raised when a request times out."""
     pass
 
+class CachedGeminiResponse:
+    """Minimal stand-in for a Gemini response served from the verdict cache."""
+    def __init__(self, text: str):
+        self.text = text
+        self.prompt_feedback = None
+        self.candidates = []
+        self.from_cache = True
+
 class GeminiThreadManager:
-    def __init__(self, max_workers: int = 5, queue_size: int = 100, default_timeout: float = 30.0):
-        """Initialize the thread manager with a fixed thread pool.
+    def __init__(self, max_workers: int = 5, queue_size: int = 100, default_timeout: float = 30.0,
+                 verdict_cache: Optional[VerdictCache] = None,
+                 priority_lanes: Sequence[str] = ('form', 'api')):
+        """Initialize the manager and its dedicated Gemini event loop thread.
+        
+        All Gemini calls are multiplexed on one long-lived event loop, so the
+        async client and its channel are created once instead of per call.
         
         Args:
-            max_workers: Maximum number of worker threads
-            queue_size: Maximum number of pending tasks
-            default_timeout: Default timeout for requests in seconds
+            max_workers: Maximum number of Gemini calls in flight at once
+            queue_size: Maximum number of calls waiting for an in-flight slot
+            default_timeout: Default timeout for requests in seconds (queue wait included)
+            verdict_cache: Optional cache consulted before calling Gemini
+            priority_lanes: Admission lanes, highest priority first
         """
-        self.executor = ThreadPoolExecutor(
-            max_workers=max_workers, 
-            thread_name_prefix="gemini_worker"
-        )
+        self.event_loop = BackgroundEventLoop(name="gemini_worker")
+        self.max_workers = max_workers
         self.max_queue_size = queue_size
+        self.admission = AdmissionController(
+            slots=max_workers,
+            queue_size=queue_size,
+            lanes=priority_lanes,
+            name='gemini_admission'
+        )
         self.default_timeout = default_timeout
+        self.verdict_cache = verdict_cache
+        self._models = {}  # settings fingerprint -> shared model instance
+        self._models_lock = threading.Lock()
         self.metrics = {
             'total_requests': 0,
+            'streamed_requests': 0,
             'failed_requests': 0,
             'timeouts': 0,
+            'cancelled': 0,
+            'completed_after_timeout': 0,
             'queue_full': 0,
             'total_processing_time': 0,
+            'total_queue_wait_time': 0,
+            'total_execution_time': 0,
+            'models_constructed': 0,
+            'model_registry_hits': 0,
         }
         
-        logger.info(f"Initialized GeminiThreadManager with {max_workers} workers, queue_size={queue_size}")
+        logger.info(f"Initialized GeminiThreadManager with {max_workers} in-flight slots, queue_size={queue_size}")
         
     def create_model(self, model_name: str = "gemini-1.5-flash", 
                     safety_settings: Optional[Dict] = None, 
                     generation_config: Optional[Dict] = None):
         """Create a new Gemini model instance with specified settings."""
-        effective_safety_settings = safety_settings or DEFAULT_SAFETY_SETTINGS.copy()
+        effective_safety_settings = safety_settings or default_safety_settings()
         
         try:
+            import google.generativeai as genai
             model = genai.GenerativeModel(
                 model_name=model_name,
                 safety_settings=effective_safety_settings
@@ -75,29 +113,72 @@ class GeminiThreadManager:
             model._custom_safety_settings = effective_safety_settings
             model._custom_generation_config = generation_config or DEFAULT_GENERATION_CONFIG.copy()
             
+            self.metrics['models_constructed'] += 1
             logger.debug(f"Created Gemini model: {model_name} with custom settings")
             return model
         except Exception as e:
             logger.error(f"Error creating Gemini model: {str(e)}", exc_info=True)
             raise
     
-    def _run_async_in_thread(self, async_func):
-        """Run an async function in a new event loop within the thread."""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(async_func)
-        except Exception as e:
-            logger.error(f"Error in thread's event loop: {str(e)}", exc_info=True)
-            raise
-        finally:
-            loop.close()
+    @staticmethod
+    def _model_fingerprint(model_name: str, safety_settings: Optional[Dict],
+                           generation_config: Optional[Dict]) -> str:
+        """Build a stable registry key for a model configuration."""
+        safety = 'default' if not safety_settings else sorted(
+            (str(category), str(threshold))
+            for category, threshold in safety_settings.items()
+        )
+        return json.dumps(
+            [model_name, safety, generation_config or DEFAULT_GENERATION_CONFIG],
+            sort_keys=True, default=str
+        )
+    
+    def get_model(self, model_name: str = "gemini-1.5-flash",
+                  safety_settings: Optional[Dict] = None,
+                  generation_config: Optional[Dict] = None):
+        """Return the shared model instance for these settings, creating it once.
+        
+        GenerativeModel instances are safe to share across requests and threads,
+        so one instance per (model_name, safety_settings, generation_config)
+        is kept for the lifetime of the manager.
+        """
+        fingerprint = self._model_fingerprint(model_name, safety_settings, generation_config)
+        model = self._models.get(fingerprint)
+        if model is not None:
+            self.metrics['model_registry_hits'] += 1
+            return model
+        
+        with self._models_lock:
+            model = self._models.get(fingerprint)
+            if model is None:
+                model = self.create_model(model_name, safety_settings, generation_config)
+                self._models[fingerprint] = model
+            return model
+    
+    def warm_models(self, specs: List[Dict[str, Any]]):
+        """Build the registry entries for the given model specs ahead of traffic.
+        
+        Args:
+            specs: List of get_model() keyword argument dicts
+        """
+        for spec in specs:
+            try:
+                self.get_model(**spec)
+            except Exception as e:
+                logger.error(f"Error warming Gemini model {spec.get('model_name')}: {str(e)}")
     
     async def generate_content(self, model: Any, prompt: str, 
                              generation_config: Optional[Dict] = None, 
                              safety_settings: Optional[Dict] = None,
-                             timeout: Optional[float] = None) -> Any:
-        """Generate content using a model in a separate thread.
+                             timeout: Optional[float] = None,
+                             use_cache: bool = True,
+                             lane: Optional[str] = None,
+                             on_text: Optional[Callable[[str], None]] = None) -> Any:
+        """Generate content using a model on the manager's event loop thread.
+        
+        Successful responses are stored in the verdict cache keyed by the
+        normalized prompt, model name and generation config, so repeated
+        messages are answered without a Gemini round trip.
         
         Args:
             model: The Gemini model instance to use
@@ -105,13 +186,17 @@ class GeminiThreadManager:
             generation_config: Override default generation settings
             safety_settings: Override default safety settings
             timeout: Request timeout in seconds (overrides default_timeout)
+            use_cache: Whether to consult and populate the verdict cache
+            lane: Admission priority lane (e.g. 'form' or 'api')
+            on_text: If given, the response is streamed and this is called on
+                the caller's loop with each piece of text as it arrives
             
         Returns:
-            Response from the Gemini model
+            Response from the Gemini model, or a CachedGeminiResponse on a cache hit
             
         Raises:
-            GeminiQueueFullError: If the thread pool queue is full
-            GeminiTimeoutError: If the request times out
+            GeminiQueueFullError: If the admission queue is full
+            GeminiTimeoutError: If the request times out, in the queue or in flight
             Exception: For other failures
         """
         start_time = time.time()
@@ -122,63 +207,151 @@ class GeminiThreadManager:
             model, '_custom_generation_config', DEFAULT_GENERATION_CONFIG.copy()
         )
         effective_safety_settings = safety_settings or getattr(
-            model, '_custom_safety_settings', DEFAULT_SAFETY_SETTINGS.copy()
-        )
+            model, '_custom_safety_settings', None
+        ) or default_safety_settings()
         
-        def _blocking_call():
-            try:
-                return asyncio.run(model.generate_content_async(
-                    prompt,
-                    generation_config=effective_generation_config,
-                    safety_settings=effective_safety_settings
-                ))
-            except Exception as e:
-                logger.error(f"Error in blocking Gemini call: {str(e)}", exc_info=True)
-                self.metrics['failed_requests'] += 1
-                raise
+        cache_key = None
+        if use_cache and self.verdict_cache is not None:
+            cache_key = self.verdict_cache.key_for(
+                prompt, getattr(model, 'model_name', ''), effective_generation_config
+            )
+            cached_text = self.verdict_cache.get(cache_key)
+            if cached_text is not None:
+                logger.debug("Serving Gemini response from verdict cache")
+                if on_text is not None:
+                    on_text(cached_text)
+                return CachedGeminiResponse(cached_text)
         
-        loop = asyncio.get_running_loop()
-        logger.debug("Submitting Gemini call to thread executor")
+        try:
+            queue_wait = await self.admission.acquire(lane=lane, timeout=effective_timeout)
+        except AdmissionQueueFullError as e:
+            self.metrics['queue_full'] += 1
+            self.metrics['failed_requests'] += 1
+            logger.warning(f"Rejecting Gemini call: {str(e)}")
+            raise GeminiQueueFullError(str(e), retry_after=e.retry_after)
+        except AdmissionTimeoutError as e:
+            self.metrics['timeouts'] += 1
+            self.metrics['failed_requests'] += 1
+            raise GeminiTimeoutError(str(e))
+        self.metrics['total_queue_wait_time'] += queue_wait
         
+        logger.debug(f"Submitting Gemini call to the event loop thread after {queue_wait:.2f}s in queue")
+        execution_start = time.time()
+        
+        def _on_done(_):
+            execution_time = time.time() - execution_start
+            self.metrics['total_execution_time'] += execution_time
+            self.admission.release(hold_time=execution_time)
+        
+        remaining_timeout = max(effective_timeout - queue_wait, 0.001)
         try:
-            # Check queue size
-            if hasattr(self.executor, '_work_queue') and \
-               self.executor._work_queue.qsize() >= self.max_queue_size:
-                self.metrics['queue_full'] += 1
-                raise GeminiQueueFullError("Thread pool queue is full")
-            
-            # Submit with timeout
-            future = loop.run_in_executor(self.executor, _blocking_call)
-            response = await asyncio.wait_for(future, timeout=effective_timeout)
+            # The RPC deadline backs up local cancellation if the task cannot be interrupted
+            call_options = {
+                'generation_config': effective_generation_config,
+                'safety_settings': effective_safety_settings,
+                'request_options': {'timeout': remaining_timeout},
+            }
+            if on_text is None:
+                call = model.generate_content_async(prompt, **call_options)
+            else:
+                self.metrics['streamed_requests'] += 1
+                call = self._streamed_call(model, prompt, on_text, asyncio.get_running_loop(), call_options)
+            concurrent_future = self.event_loop.submit(call)
+        except Exception:
+            self.admission.release()
+            self.metrics['failed_requests'] += 1
+            raise
+        concurrent_future.add_done_callback(_on_done)
+        
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(concurrent_future), timeout=remaining_timeout)
             
             processing_time = time.time() - start_time
             self.metrics['total_processing_time'] += processing_time
-            logger.debug(f"Received response from thread executor in {processing_time:.2f}s")
+            logger.debug(f"Received response from event loop thread in {processing_time:.2f}s")
+            
+            if cache_key is not None:
+                self._store_in_cache(cache_key, response)
             
             return response
             
         except asyncio.TimeoutError:
             self.metrics['timeouts'] += 1
             self.metrics['failed_requests'] += 1
+            self._cancel_call(concurrent_future)
             raise GeminiTimeoutError(f"Request timed out after {effective_timeout}s")
+        except asyncio.CancelledError:
+            # The caller went away (e.g. client disconnected); abort the RPC too
+            self._cancel_call(concurrent_future)
+            raise
         except Exception as e:
             self.metrics['failed_requests'] += 1
-            logger.error(f"Error executing Gemini call in thread: {str(e)}", exc_info=True)
+            logger.error(f"Error executing Gemini call: {str(e)}", exc_info=True)
             raise
     
+    @staticmethod
+    async def _streamed_call(model: Any, prompt: str, on_text: Callable[[str], None],
+                             caller_loop: asyncio.AbstractEventLoop, call_options: Dict) -> Any:
+        """Stream a call on the Gemini loop, handing each text chunk to the caller's loop.
+        
+        Returns the response once fully consumed, so its ``text`` and
+        ``prompt_feedback`` read like those of a non-streamed call.
+        """
+        response = await model.generate_content_async(prompt, stream=True, **call_options)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Blocked or empty chunk; the caller inspects prompt_feedback
+                continue
+            if text:
+                caller_loop.call_soon_threadsafe(on_text, text)
+        return response
+    
+    def _cancel_call(self, concurrent_future):
+        """Cancel an abandoned call so its task stops and its slot is freed now.
+        
+        Cancelling the future cancels the task on the Gemini event loop, which
+        aborts the in-flight RPC. If the call finished in the meantime it is
+        counted as completed after timeout instead.
+        """
+        if concurrent_future.cancel() or concurrent_future.cancelled():
+            self.metrics['cancelled'] += 1
+            logger.info("Cancelled abandoned Gemini call")
+        else:
+            self.metrics['completed_after_timeout'] += 1
+            logger.info("Abandoned Gemini call completed before it could be cancelled")
+    
+    def _store_in_cache(self, cache_key: str, response: Any):
+        """Cache the text of a successful, unblocked response."""
+        try:
+            if response.prompt_feedback and response.prompt_feedback.block_reason:
+                return
+            text = response.text
+        except Exception:
+            # .text raises when the response has no valid parts
+            return
+        if text:
+            self.verdict_cache.set(cache_key, text)
+    
     def get_metrics(self) -> Dict[str, float]:
         """Get current metrics."""
         metrics = self.metrics.copy()
         if metrics['total_requests'] > 0:
             metrics['success_rate'] = (metrics['total_requests'] - metrics['failed_requests']) / metrics['total_requests']
             metrics['avg_processing_time'] = metrics['total_processing_time'] / metrics['total_requests']
+            metrics['avg_queue_wait_time'] = metrics['total_queue_wait_time'] / metrics['total_requests']
+        if self.verdict_cache is not None:
+            metrics.update(self.verdict_cache.get_metrics())
+        metrics['registered_models'] = len(self._models)
+        metrics.update(self.admission.get_metrics())
         return metrics
     
     def shutdown(self):
-        """Shutdown the thread executor gracefully."""
-        logger.info("Shutting down GeminiThreadManager executor...")
+        """Stop the Gemini event loop thread, cancelling in-flight calls."""
+        logger.info("Shutting down GeminiThreadManager event loop...")
         try:
-            self.executor.shutdown(wait=True)
+            self.event_loop.stop(timeout=self.default_timeout)
             logger.info("GeminiThreadManager shutdown complete")
         except Exception as e:
             logger.error(f"Error during GeminiThreadManager shutdown: {str(e)}", exc_info=True) 
\ No newline at end of file
@@ -0,0 +1,349 @@
+"""Rule-based pre-filter for scam messages.
+
+Scores a message from compiled Brazilian scam markers (blocked CPF or
+account, prizes, release fees, "new number" family scams, verification code
+requests), an urgency lexicon, Pix key and boleto patterns, and the links it
+contains (URL shorteners, lookalike bank/government domains, punycode, IP
+hosts, throwaway TLDs). Rules only run when one of their trigger words is
+in the message, so scoring takes microseconds and can run before every
+Gemini call; with short-circuiting enabled the high-confidence cases are
+answered without the LLM.
+"""
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set
+
+import structlog
+
+from utils.url_extractor import URL_SHORTENERS, find_urls
+
+logger = structlog.get_logger()
+
+SHORT_CIRCUIT_MODES = ('off', 'scam', 'both')
+
+
+class Rule(NamedTuple):
+    """A text rule; its pattern only runs when one of ``triggers`` is a word of the message."""
+    name: str
+    triggers: Optional[FrozenSet[str]]  # None: always run
+    pattern: str
+    weight: int
+    label: str
+
+
+def _words(*words: str) -> FrozenSet[str]:
+    return frozenset(words)
+
+
+# Patterns run on accent-stripped, case-folded text (see _fold). Every match
+# of a pattern must contain one of its trigger words.
+TEXT_RULES = (
+    Rule('blocked_document', _words('cpf', 'titulo', 'cnh'),
+         r'\b(?:cpf|titulo de eleitor|cnh)\b.{0,30}?\b(?:bloquead|suspens|cancelad|irregular|pendente)',
+         35, 'Alega que seu CPF ou documento está bloqueado ou irregular'),
+    Rule('blocked_account', _words('conta', 'cartao', 'acesso', 'app', 'aplicativo'),
+         r'\b(?:conta|cartao|acesso|app|aplicativo)\b.{0,20}?\b(?:bloquead|suspens|desativad|encerrad)',
+         30, 'Alega bloqueio de conta, cartão ou aplicativo'),
+    Rule('new_number', _words('troquei', 'novo', 'salva'),
+         r'\b(?:troquei de (?:numero|celular|telefone)|(?:meu|esse e o meu|este e o meu) (?:numero|zap) novo|salva (?:esse|este|meu) (?:numero|contato))',
+         35, 'Pessoa conhecida dizendo ter trocado de número'),
+    Rule('verification_code', _words('codigo', 'cod'),
+         r'\b(?:codigo|cod\.?)\b.{0,25}?\b(?:verificacao|confirmacao|seguranca|sms|whatsapp)\b|\b(?:me )?(?:passa|manda|envia|informe?)\b.{0,15}?\bcodigo\b',
+         30, 'Pede código de verificação ou confirmação'),
+    Rule('prize', _words('voce', 'parabens', 'premio', 'resgate'),
+         r'\b(?:voce (?:foi sorteado|ganhou|foi contemplado)|parabens.{0,40}?(?:ganhou|premio|sorteado)|premio de|resgate (?:seu|o) premio)',
+         30, 'Promete prêmio, sorteio ou brinde'),
+    Rule('release_fee', _words('taxa', 'encomenda', 'entrega', 'pacote', 'objeto'),
+         r'\btaxa (?:de )?(?:liberacao|desbloqueio|entrega|alfandega|transferencia|saque)|\b(?:encomenda|entrega|pacote|objeto)\b.{0,30}?\b(?:retid|taxad|pendente|aguardando pagamento)',
+         30, 'Cobra taxa para liberar entrega, prêmio ou valor'),
+    Rule('benefit_bait', _words('restituicao', 'valores', 'dinheiro', 'fgts', 'bolsa', 'auxilio', 'indenizacao'),
+         r'\b(?:restituicao|valores a receber|dinheiro esquecido|fgts|bolsa familia|auxilio|indenizacao)\b',
+         15, 'Menciona benefício, restituição ou valores a receber'),
+    Rule('debt_threat', _words('divida', 'nome', 'protesto', 'negativacao', 'serasa', 'spc', 'acao', 'mandado'),
+         r'\b(?:divida|nome (?:sujo|negativado)|protesto|negativacao|serasa|spc|acao judicial|mandado)\b',
+         15, 'Ameaça com dívida, negativação ou processo'),
+    Rule('update_data', _words('atualize', 'atualizar', 'confirme', 'confirmar', 'regularize', 'regularizar', 'valide', 'validar'),
+         r'\b(?:atualize|atualizar|confirme|confirmar|regularize|regularizar|valide|validar)\b.{0,25}?\b(?:dados|cadastro|conta|cpf|senha|token)',
+         20, 'Pede atualização ou confirmação de dados'),
+    Rule('click_link', _words('clique', 'clica', 'acesse', 'acessa', 'toque'),
+         r'\b(?:clique|clica|acesse|acessa|toque)\b.{0,20}?\b(?:link|aqui|abaixo|site)\b',
+         15, 'Pede para clicar em link'),
+    Rule('credentials', _words('senha', 'token', 'chave', 'numero', 'cvv', 'codigo'),
+         r'\b(?:senha|token|chave de seguranca|numero do cartao|cvv|codigo de seguranca)\b',
+         15, 'Menciona senha, token ou dados do cartão'),
+    Rule('urgency', _words('urgente', 'urgencia', 'imediatamente', 'ultimo', 'ultima', 'nao', 'sera', 'evite'),
+         r'\b(?:urgente|urgencia|imediatamente|ultimo aviso|ultima chance|ultimo dia|nao perca|sera (?:bloquead|cancelad|suspens|encerrad)|evite (?:o )?bloqueio)',
+         15, 'Linguagem de urgência'),
+    Rule('deadline', _words('em', 'ainda', 'ate', 'prazo', 'expira'),
+         r'\b(?:em (?:ate )?\d{1,2} ?(?:h|hs|horas|minutos)|ainda hoje|ate (?:hoje|amanha)|prazo final|expira)\b',
+         10, 'Impõe prazo curto'),
+    Rule('pix_request', _words('pix'),
+         r'\b(?:(?:faz|faca|fazer|manda|mande|envia|envie|transfere|transfira)\b.{0,15}?\bpix|pix\b.{0,20}?\b(?:estornad|devolvid|agendad|bloquead|em analise))',
+         15, 'Pede Pix ou fala de Pix estornado/bloqueado'),
+    Rule('pix_key', _words('pix'),
+         r'\bchave pix\b|\bpix copia e cola\b|br\.gov\.bcb\.pix',
+         10, 'Contém chave Pix ou código Pix'),
+    Rule('pix_key', None,
+         r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b',
+         10, 'Contém chave Pix ou código Pix'),
+    Rule('boleto', _words('boleto', 'segunda'),
+         r'\b(?:boleto|segunda via)\b.{0,25}?\b(?:vencid|venc|pagamento|pague)',
+         10, 'Contém boleto ou linha digitável'),
+    Rule('boleto', None,
+         r'\b\d{5}\.?\d{5} ?\d{5}\.?\d{6} ?\d{5}\.?\d{6} ?\d ?\d{14}\b',
+         10, 'Contém boleto ou linha digitável'),
+)
+
+_WORD_PATTERN = re.compile(r'\w+')
+_COMPILED_RULES = [(rule, re.compile(rule.pattern)) for rule in TEXT_RULES]
+_ALWAYS_RUN = [(rule, regex) for rule, regex in _COMPILED_RULES if rule.triggers is None]
+_RULES_BY_TRIGGER: Dict[str, List] = {}
+for _rule, _regex in _COMPILED_RULES:
+    for _trigger in _rule.triggers or ():
+        _RULES_BY_TRIGGER.setdefault(_trigger, []).append((_rule, _regex))
+
+SUSPICIOUS_TLDS = frozenset({
+    'xyz', 'top', 'click', 'online', 'site', 'shop', 'live', 'icu', 'buzz', 'vip', 'cyou', 'rest',
+    'monster', 'sbs', 'cfd', 'lat', 'store', 'fun', 'space', 'website', 'tk', 'ml', 'ga', 'cf', 'gq',
+})
+# Brand -> registrable domains it legitimately uses
+OFFICIAL_DOMAINS = {
+    'itau': ('itau.com.br', 'itau.com'),
+    'bradesco': ('bradesco.com.br',),
+    'caixa': ('caixa.gov.br',),
+    'santander': ('santander.com.br',),
+    'nubank': ('nubank.com.br', 'nu.com.br'),
+    'bancodobrasil': ('bb.com.br',),
+    'mercadopago': ('mercadopago.com.br', 'mercadopago.com'),
+    'mercadolivre': ('mercadolivre.com.br',),
+    'picpay': ('picpay.com',),
+    'correios': ('correios.com.br',),
+    'receitafederal': ('gov.br',),
+    'detran': ('gov.br',),
+    'govbr': ('gov.br',),
+    'serasa': ('serasa.com.br', 'serasaexperian.com.br'),
+    'netflix': ('netflix.com',),
+    'whatsapp': ('whatsapp.com', 'wa.me'),
+    'magalu': ('magazineluiza.com.br', 'magalu.com'),
+}
+_LONGEST_BRAND = max(map(len, OFFICIAL_DOMAINS))
+_SECOND_LEVEL = frozenset({'com', 'gov', 'org', 'net', 'edu', 'jus', 'mil', 'art', 'app', 'blog', 'co'})
+_LEET = str.maketrans('013457@', 'oieasta')
+
+_IP_HOST = re.compile(r'(?:\d{1,3}\.){3}\d{1,3}$')
+
+URL_RULES = {
+    'shortener': (20, 'Link encurtado esconde o destino'),
+    'lookalike_domain': (40, 'Domínio imita banco, loja ou órgão oficial'),
+    'punycode_domain': (25, 'Domínio com caracteres disfarçados (punycode)'),
+    'ip_host': (25, 'Link aponta para endereço IP'),
+    'suspicious_tld': (15, 'Domínio com terminação frequente em golpes'),
+}
+
+
+class Signal(NamedTuple):
+    name: str
+    weight: int
+    label: str
+
+
+class HeuristicResult(NamedTuple):
+    """Outcome of scoring one message.
+
+    ``verdict`` is 'scam' at or above the scam threshold, 'benign' when no
+    signal fired and the message has no link, and 'uncertain' otherwise.
+    """
+    score: int
+    verdict: str
+    signals: List[Signal]
+    hosts: List[str]
+
+
+def _fold(text: str) -> str:
+    """Strip accents and case so patterns can be written in plain ASCII."""
+    if text.isascii():
+        return text.lower()
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def registrable_domain(host: str) -> str:
+    """Approximate registrable domain, e.g. 'www.itau.com.br' -> 'itau.com.br'."""
+    labels = host.split('.')
+    if len(labels) >= 3 and labels[-1] == 'br' and labels[-2] in _SECOND_LEVEL:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def host_signals(host: str) -> List[str]:
+    """Names of the URL_RULES that fire for a host."""
+    names = []
+    if _IP_HOST.match(host):
+        return ['ip_host']
+    domain = registrable_domain(host)
+    if host in URL_SHORTENERS or domain in URL_SHORTENERS:
+        names.append('shortener')
+    if 'xn--' in host:
+        names.append('punycode_domain')
+    if host.rsplit('.', 1)[-1] in SUSPICIOUS_TLDS:
+        names.append('suspicious_tld')
+    if not host.endswith('.gov.br'):
+        for brand in _brand_tokens(host, domain) & OFFICIAL_DOMAINS.keys():
+            if domain not in OFFICIAL_DOMAINS[brand]:
+                names.append('lookalike_domain')
+                break
+    return names
+
+
+def _brand_tokens(host: str, domain: str) -> Set[str]:
+    """Words of the host (public suffix dropped) and runs of adjacent words joined.
+
+    'receita-federal-gov.top' gives 'receita', 'receitafederal', ... so brands
+    written with or without separators match, while a brand inside an
+    unrelated word ('vitauto') does not.
+    """
+    name = host[:len(host) - len(domain)] + domain.split('.', 1)[0]
+    words = [word.translate(_LEET) for word in re.split(r'[.-]', name) if word]
+    tokens = set()
+    for start in range(len(words)):
+        joined = ''
+        for word in words[start:]:
+            joined += word
+            if len(joined) > _LONGEST_BRAND:
+                break
+            tokens.add(joined)
+    return tokens
+
+
+def extract_hosts(text: str) -> List[str]:
+    """Distinct link hosts in text; IDN hosts come back as punycode."""
+    return list(dict.fromkeys(extracted.host for extracted in find_urls(text)))
+
+
+def score_message(text: str, scam_threshold: int = 70) -> HeuristicResult:
+    """Score a message from 0 (no signal) to 100.
+
+    Only the rules triggered by a word of the message are run, and each
+    counts once however often it matches.
+    """
+    folded = _fold(text or '')
+    candidates = list(_ALWAYS_RUN)
+    for word in set(_WORD_PATTERN.findall(folded)):
+        candidates.extend(_RULES_BY_TRIGGER.get(word, ()))
+    fired = {}
+    for rule, regex in candidates:
+        if rule.name not in fired and regex.search(folded):
+            fired[rule.name] = Signal(rule.name, rule.weight, rule.label)
+
+    hosts = extract_hosts(text or '')
+    for host in hosts:
+        for name in host_signals(host):
+            weight, label = URL_RULES[name]
+            fired[name] = Signal(name, weight, label)
+
+    signals = sorted(fired.values(), key=lambda signal: -signal.weight)
+    score = min(sum(signal.weight for signal in signals), 100)
+    if score >= scam_threshold:
+        verdict = 'scam'
+    elif not signals and not hosts:
+        verdict = 'benign'
+    else:
+        verdict = 'uncertain'
+    return HeuristicResult(score, verdict, signals, hosts)
+
+
+class HeuristicFilter:
+    """Pre-filter in front of Gemini, registered as an extension in extensions.py.
+
+    ``HEURISTICS_SHORT_CIRCUIT`` selects which verdicts are answered locally:
+    'off' only scores (and counts the calls that could have been avoided),
+    'scam' answers high-scoring messages, 'both' also answers messages with
+    no signal and no link.
+    """
+
+    def __init__(self, scam_threshold: int = 70, short_circuit: str = 'off', enabled: bool = True):
+        self.scam_threshold = scam_threshold
+        self.short_circuit = short_circuit
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.metrics = {
+            'evaluated': 0,
+            'scam_verdicts': 0,
+            'benign_verdicts': 0,
+            'llm_calls_avoided': 0,
+            'total_eval_time': 0.0,
+        }
+
+    def init_app(self, app):
+        self.enabled = app.config.get('HEURISTICS_ENABLED', True)
+        self.scam_threshold = app.config.get('HEURISTICS_SCAM_THRESHOLD', self.scam_threshold)
+        self.short_circuit = app.config.get('HEURISTICS_SHORT_CIRCUIT', self.short_circuit)
+        if self.short_circuit not in SHORT_CIRCUIT_MODES:
+            raise ValueError(f"HEURISTICS_SHORT_CIRCUIT must be one of {SHORT_CIRCUIT_MODES}")
+        app.extensions['heuristic_filter'] = self
+        logger.info(f"Heuristic pre-filter initialized: short_circuit={self.short_circuit}, threshold={self.scam_threshold}")
+
+    def evaluate(self, text: str) -> Optional[HeuristicResult]:
+        """Score a message; None when the filter is disabled."""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        result = score_message(text, self.scam_threshold)
+        with self._lock:
+            self.metrics['evaluated'] += 1
+            self.metrics['total_eval_time'] += time.perf_counter() - start
+            if result.verdict == 'scam':
+                self.metrics['scam_verdicts'] += 1
+            elif result.verdict == 'benign':
+                self.metrics['benign_verdicts'] += 1
+        return result
+
+    def answers(self, result: Optional[HeuristicResult]) -> bool:
+        """Whether the configured mode answers this result without the LLM."""
+        if result is None or self.short_circuit == 'off':
+            return False
+        return result.verdict == 'scam' or (result.verdict == 'benign' and self.short_circuit == 'both')
+
+    def short_circuit_verdict(self, text: str) -> Optional[Dict[str, Any]]:
+        """Evaluate a message and return a local verdict if it can skip Gemini.
+
+        Returns:
+            Verdict dict shaped like Gemini's (risk_level, summary, alerts,
+            recommendation), or None when the LLM should decide
+        """
+        result = self.evaluate(text)
+        if not self.answers(result):
+            return None
+        with self._lock:
+            self.metrics['llm_calls_avoided'] += 1
+        return verdict_from_result(result)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {f"heuristics_{name}": value for name, value in self.metrics.items()}
+        evaluated = metrics['heuristics_evaluated']
+        metrics['heuristics_avg_eval_time'] = metrics['heuristics_total_eval_time'] / evaluated if evaluated else 0.0
+        return metrics
+
+
+def verdict_from_result(result: HeuristicResult) -> Dict[str, Any]:
+    """Build a Gemini-shaped verdict from a heuristic result."""
+    if result.verdict == 'scam':
+        return {
+            'risk_level': 'Muito Alto' if result.score >= 90 else 'Alto',
+            'summary': 'A mensagem reúne vários sinais típicos de golpe.',
+            'alerts': [signal.label for signal in result.signals],
+            'recommendation': 'Não clique em links, não faça pagamentos nem informe dados. '
+                              'Confirme diretamente com a empresa ou pessoa pelos canais oficiais.',
+            'source': 'heuristics',
+            'heuristic_score': result.score,
+        }
+    return {
+        'risk_level': 'Baixo',
+        'summary': 'Nenhum sinal comum de golpe foi encontrado na mensagem.',
+        'alerts': [],
+        'recommendation': 'Mesmo assim, desconfie de pedidos de dinheiro ou dados pessoais.',
+        'source': 'heuristics',
+        'heuristic_score': result.score,
+    }
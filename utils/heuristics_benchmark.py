@@ -0,0 +1,77 @@
+"""Throughput benchmark of the heuristic pre-filter.
+
+Usage:
+    python -m utils.heuristics_benchmark [--repeat 2000] [--threshold 70] [FILE]
+
+Scores every message of FILE (one per line; default: a small built-in set of
+Brazilian scam and everyday messages) ``repeat`` times on one core and
+reports messages/sec, latency percentiles and how many Gemini calls each
+short-circuit mode would have avoided.
+"""
+import argparse
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import List
+
+from utils.heuristics import score_message
+
+SAMPLE_MESSAGES = [
+    "Oi, tudo bem? Vamos almoçar amanhã?",
+    "Reunião amanhã às 10h na sala 3, leve o relatório impresso.",
+    "Feliz aniversário! Que seu dia seja incrível 🎉",
+    "Acesse https://www.itau.com.br para ver sua fatura de outubro.",
+    "URGENTE: seu CPF foi bloqueado pela Receita. Regularize seus dados em até 24 horas: "
+    "http://receita-federal-gov.xyz/consulta",
+    "Mãe, troquei de número, salva esse aqui. Faz um pix pra mim urgente?",
+    "Parabéns! Você ganhou um prêmio de R$ 5.000. Resgate seu prêmio: bit.ly/premio123",
+    "Sua encomenda está retida. Pague a taxa de liberação: https://correios-rastreio.top/pagar",
+    "Olá, aqui é do Nubank. Sua conta será bloqueada. Clique no link: https://nubank-seguranca.online/login",
+    "Seu código de verificação do WhatsApp é 123-456. Não compartilhe.",
+    "Boleto vencido: 23793.38128 60007.827136 95000.063305 9 84410000010000",
+    "Você tem valores a receber! Consulte seu CPF e evite o bloqueio: https://cutt.ly/valores",
+]
+
+
+def load_messages(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the heuristic scam pre-filter.")
+    parser.add_argument('file', nargs='?', help="Messages, one per line (default: built-in samples)")
+    parser.add_argument('--repeat', type=int, default=2000, help="Passes over the messages")
+    parser.add_argument('--threshold', type=int, default=70, help="Scam score threshold")
+    args = parser.parse_args(argv)
+
+    messages = load_messages(args.file) if args.file else SAMPLE_MESSAGES
+    if not messages:
+        print("No messages to score", file=sys.stderr)
+        return 1
+
+    verdicts = Counter(score_message(message, args.threshold).verdict for message in messages)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for message in messages:
+            call_start = time.perf_counter()
+            score_message(message, args.threshold)
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    total = len(messages)
+    print(f"{total} messages x {args.repeat}: {len(latencies) / elapsed:,.0f} messages/sec on one core")
+    print(f"latency p50 {statistics.median(latencies) * 1e6:.1f} us, "
+          f"p99 {latencies[int(0.99 * (len(latencies) - 1))] * 1e6:.1f} us")
+    print(f"verdicts: scam {verdicts['scam']}, benign {verdicts['benign']}, uncertain {verdicts['uncertain']}")
+    print(f"Gemini calls avoided: 'scam' mode {verdicts['scam']}/{total}, "
+          f"'both' mode {verdicts['scam'] + verdicts['benign']}/{total}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Shared outbound HTTP client with connection pooling.
+
+Flask runs each async view on a fresh event loop, so an aiohttp session
+opened inside a request is torn down with it and every call pays DNS, TCP
+and TLS setup again. HttpClient keeps one pooled ClientSession per
+long-lived event loop instead:
+
+- ``run(fn)`` executes ``fn(session)`` on the client's own background loop
+  with its app-lifetime session; request handlers use this.
+- ``session()`` returns the session of the current loop, for code that
+  already runs on a long-lived loop (e.g. the Safe Browsing updater).
+
+Sessions share the configured keep-alive, DNS cache, per-host connection
+limit and timeouts, and are closed by ``close()`` at shutdown.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import structlog
+
+from utils.async_utils import BackgroundEventLoop
+
+logger = structlog.get_logger()
+
+
+class HttpClient:
+    """Pooled aiohttp sessions, one per event loop."""
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 30.0, connect_timeout: float = 5.0,
+                 total_timeout: float = 15.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.total_timeout = total_timeout
+        self._sessions: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._background: Optional[BackgroundEventLoop] = None
+        self._lock = threading.Lock()
+        self.metrics = {
+            'sessions_created': 0,
+            'calls': 0,
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0,
+        }
+
+    def configure(self, **options):
+        """Update pool options; only sessions created afterwards use them."""
+        for name, value in options.items():
+            if not hasattr(self, name) or name.startswith('_') or name == 'metrics':
+                raise TypeError(f"Unknown HttpClient option: {name}")
+            setattr(self, name, value)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def _create_session(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        trace_config = aiohttp.TraceConfig()
+        for signal, name in (
+            (trace_config.on_request_start, 'requests'),
+            (trace_config.on_connection_create_end, 'connections_created'),
+            (trace_config.on_connection_reuseconn, 'connections_reused'),
+            (trace_config.on_dns_cache_hit, 'dns_cache_hits'),
+            (trace_config.on_dns_cache_miss, 'dns_cache_misses'),
+        ):
+            signal.append(self._make_counter(name))
+        self._count('sessions_created')
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout),
+            trace_configs=[trace_config]
+        )
+
+    def _make_counter(self, name: str):
+        async def _on_event(session, context, params):
+            self._count(name)
+        return _on_event
+
+    def session(self):
+        """Return the pooled session of the running event loop, creating it on first use.
+
+        Must be called from a coroutine on a long-lived loop; sessions of
+        short-lived loops would only be reclaimed by ``close()``.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is not None and not session.closed:
+                return session
+        session = self._create_session()
+        with self._lock:
+            self._sessions[loop] = session
+        return session
+
+    async def run(self, fn: Callable[[Any], Awaitable[Any]]) -> Any:
+        """Run ``fn(session)`` on the client's background loop and await its result.
+
+        Args:
+            fn: Coroutine function taking the app-lifetime aiohttp session
+
+        Returns:
+            Whatever ``fn`` returns
+        """
+        with self._lock:
+            if self._background is None:
+                self._background = BackgroundEventLoop("http_client")
+            background = self._background
+        self._count('calls')
+
+        async def _call():
+            return await fn(self.session())
+        return await background.run(_call())
+
+    def close(self, timeout: float = 5.0):
+        """Close every session and stop the background loop."""
+        with self._lock:
+            sessions = list(self._sessions.items())
+            self._sessions.clear()
+            background, self._background = self._background, None
+        for loop, session in sessions:
+            if session.closed or loop.is_closed():
+                continue
+            try:
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout)
+                else:
+                    loop.run_until_complete(session.close())
+            except Exception as e:
+                logger.warning(f"Failed to close HTTP session: {str(e)}")
+        if background is not None:
+            background.stop()
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            metrics = {f"http_{name}": value for name, value in self.metrics.items()}
+            metrics['http_open_sessions'] = sum(1 for session in self._sessions.values() if not session.closed)
+        return metrics
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide HttpClient, creating it on first use."""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = HttpClient()
+    return _shared_client
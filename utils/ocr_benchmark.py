@@ -0,0 +1,184 @@
+"""OCR benchmark: images/sec and accuracy per OCR engine on a fixture corpus.
+
+Usage:
+    python -m utils.ocr_benchmark FIXTURE_DIR [--ground-truth DIR] [--engine all]
+                                  [--preprocess both] [--workers 4] [--repeat 3]
+
+FIXTURE_DIR holds screenshots (.png/.jpg/.jpeg/.webp). When ``<name>.txt``
+sits next to an image it is used as ground truth and the character accuracy
+of each engine is reported as well. With ``--ground-truth`` the ``.txt``
+files are read from that directory instead and only the images that have
+one are benchmarked; tests/fixtures/ocr holds the ground truth for the
+screenshots in static/images:
+
+    python -m utils.ocr_benchmark static/images --ground-truth tests/fixtures/ocr
+
+The decode and preprocessing cost of each image is reported first; it needs
+only Pillow. Each engine then runs through the same OCRPool the app uses,
+with one warm-up pass per worker before timing, with and without the
+preprocessing configured for the app (see config.py). Engines that cannot
+run here (no tesseract binary, no tesserocr) are reported as unavailable.
+"""
+import argparse
+import asyncio
+import difflib
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from config import Config
+from utils.analysis_tools import choose_ocr_lang, get_tesseract_languages
+from utils.ocr_pool import OCR_ENGINES, OCRPool, OCREngineError, OCRUnavailableError
+from utils.ocr_preprocess import PreprocessOptions, load_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+class Fixture(NamedTuple):
+    name: str
+    image_data: bytes
+    expected_text: Optional[str]
+
+
+def load_fixtures(directory: str, ground_truth_dir: Optional[str] = None) -> List[Fixture]:
+    """Images of ``directory`` with the ``<name>.txt`` ground truth of each.
+
+    With ``ground_truth_dir`` the texts come from there and images without
+    one are skipped.
+    """
+    fixtures = []
+    for filename in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(filename)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        with open(os.path.join(directory, filename), 'rb') as f:
+            image_data = f.read()
+        expected_path = os.path.join(ground_truth_dir or directory, stem + '.txt')
+        expected_text = None
+        if ground_truth_dir and not os.path.exists(expected_path):
+            continue
+        if os.path.exists(expected_path):
+            with open(expected_path, encoding='utf-8') as f:
+                expected_text = f.read()
+        fixtures.append(Fixture(filename, image_data, expected_text))
+    return fixtures
+
+
+def char_accuracy(expected: str, actual: str) -> float:
+    """Similarity of whitespace-normalized texts, from 0.0 to 1.0."""
+    return difflib.SequenceMatcher(None, ' '.join(expected.split()), ' '.join(actual.split())).ratio()
+
+
+def measure_preprocessing(fixture: Fixture, preprocess: Optional[PreprocessOptions],
+                          repeat: int) -> Dict[str, float]:
+    """Time decoding (and preprocessing) one image in this process, as a pool worker would."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = load_image(fixture.image_data, preprocess)
+        image.load()
+        timings.append(time.perf_counter() - start)
+    return {
+        'ms': statistics.median(timings) * 1000,
+        'size': image.size,
+        'mode': image.mode,
+    }
+
+
+async def benchmark_engine(fixtures: List[Fixture], lang: str, engine: str, workers: int,
+                           repeat: int, preprocess: Optional[PreprocessOptions] = None) -> Dict[str, float]:
+    pool = OCRPool(max_workers=workers, queue_size=len(fixtures) * repeat, job_timeout=120.0,
+                   engine=engine, preprocess=preprocess)
+    try:
+        # Start every worker and load its engine before timing
+        await asyncio.gather(*[pool.extract_text(fixtures[0].image_data, lang) for _ in range(workers)])
+
+        latencies = []
+        accuracies = []
+        engines_used = set()
+
+        async def _run(fixture: Fixture):
+            start = time.perf_counter()
+            text, engine_used = await pool.extract_text(fixture.image_data, lang)
+            latencies.append(time.perf_counter() - start)
+            engines_used.add(engine_used)
+            if fixture.expected_text is not None:
+                accuracies.append(char_accuracy(fixture.expected_text, text))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_run(fixture) for _ in range(repeat) for fixture in fixtures])
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+    latencies.sort()
+    return {
+        'engine': '+'.join(sorted(engines_used)),
+        'images': len(latencies),
+        'images_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        'accuracy': statistics.mean(accuracies) if accuracies else None,
+    }
+
+
+def detect_lang() -> str:
+    """The lang string the app would use, or 'por+eng' when Tesseract is missing."""
+    try:
+        return choose_ocr_lang(get_tesseract_languages())
+    except (EnvironmentError, ImportError):
+        # The engines then report themselves unavailable
+        return 'por+eng'
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark OCR engines on a directory of screenshots.")
+    parser.add_argument('fixtures', help="Directory with images and optional <name>.txt ground truth")
+    parser.add_argument('--ground-truth', help="Directory with the <name>.txt ground truth; "
+                                               "images without one are skipped")
+    parser.add_argument('--engine', default='all', choices=('all',) + OCR_ENGINES[1:],
+                        help="Engine to benchmark (default: all)")
+    parser.add_argument('--preprocess', default='both', choices=('on', 'off', 'both'),
+                        help="Run with the configured preprocessing, without it, or both")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="OCR pool workers")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the corpus")
+    parser.add_argument('--lang', help="Tesseract lang string (default: detected)")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures, args.ground_truth)
+    if not fixtures:
+        print(f"No images found in {args.fixtures}", file=sys.stderr)
+        return 1
+    lang = args.lang or detect_lang()
+    engines = OCR_ENGINES[1:] if args.engine == 'all' else (args.engine,)
+    configured = PreprocessOptions.from_config(vars(Config))._replace(enabled=True)
+    preprocess_modes = {'on': (configured,), 'off': (None,), 'both': (None, configured)}[args.preprocess]
+
+    print(f"{len(fixtures)} fixtures x {args.repeat}, {args.workers} workers, lang={lang}")
+    print(f"preprocessing: {configured}")
+    print(f"{'image':>24} {'preprocess':>10} {'decode ms':>9} {'size':>11} {'mode':>4}")
+    for fixture in fixtures:
+        for preprocess in preprocess_modes:
+            result = measure_preprocessing(fixture, preprocess, args.repeat)
+            size = 'x'.join(map(str, result['size']))
+            print(f"{fixture.name[:24]:>24} {'on' if preprocess else 'off':>10} {result['ms']:9.1f} "
+                  f"{size:>11} {result['mode']:>4}")
+
+    print(f"{'engine':>12} {'preprocess':>10} {'images/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'accuracy':>9}")
+    for engine in engines:
+        for preprocess in preprocess_modes:
+            try:
+                result = asyncio.run(benchmark_engine(fixtures, lang, engine, args.workers, args.repeat, preprocess))
+            except (OCRUnavailableError, OCREngineError) as e:
+                print(f"{engine:>12} {'on' if preprocess else 'off':>10} unavailable: {e}")
+                continue
+            accuracy = f"{result['accuracy']:.3f}" if result['accuracy'] is not None else '-'
+            print(f"{result['engine']:>12} {'on' if preprocess else 'off':>10} {result['images_per_sec']:9.2f} "
+                  f"{result['p50_ms']:8.0f} {result['p95_ms']:8.0f} {accuracy:>9}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
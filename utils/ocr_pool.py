@@ -0,0 +1,263 @@
+"""Process pool that runs OCR off the event loop."""
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import structlog
+
+from utils.admission import AdmissionController, AdmissionQueueFullError, AdmissionTimeoutError
+from utils.ocr_preprocess import PreprocessOptions, load_image
+
+logger = structlog.get_logger()
+
+
+class OCRQueueFullError(Exception):
+    """Raised when the OCR pool cannot accept more jobs."""
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OCRTimeoutError(Exception):
+    """Raised when an OCR job does not finish within its timeout."""
+    pass
+
+
+class OCRUnavailableError(Exception):
+    """Raised in a worker when the Tesseract binary cannot be found.
+
+    pytesseract.TesseractNotFoundError cannot be unpickled in the parent, so
+    workers translate it into this exception.
+    """
+    pass
+
+
+class OCREngineError(Exception):
+    """Raised in a worker when Tesseract fails on an image (e.g. a missing language)."""
+    pass
+
+
+OCR_ENGINES = ('auto', 'tesserocr', 'subprocess')
+
+# Warm tesserocr engines, one per lang string, kept per worker thread since a
+# PyTessBaseAPI must not be shared between threads
+_engines = threading.local()
+_tesserocr_available: Optional[bool] = None
+
+
+def _get_tesserocr_api(lang: str):
+    """Return a loaded tesserocr engine for ``lang``, or None if tesserocr is unusable."""
+    global _tesserocr_available
+    if _tesserocr_available is False:
+        return None
+    apis = getattr(_engines, 'apis', None)
+    if apis is None:
+        apis = _engines.apis = {}
+    api = apis.get(lang)
+    if api is None:
+        try:
+            import tesserocr
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+        except (ImportError, RuntimeError) as e:
+            _tesserocr_available = False
+            logger.warning(f"tesserocr unavailable, using the tesseract subprocess: {str(e)}")
+            return None
+        _tesserocr_available = True
+        apis[lang] = api
+        logger.info(f"Loaded persistent tesserocr engine for lang={lang} in pid {os.getpid()}")
+    return api
+
+
+def _ocr_with_tesserocr(api, image, timeout: float) -> str:
+    api.SetImage(image)
+    try:
+        # Recognize takes milliseconds and returns False when it was interrupted
+        if not api.Recognize(timeout=int(timeout * 1000)):
+            raise OCRTimeoutError(f"Tesseract timed out after {timeout}s")
+        return api.GetUTF8Text()
+    finally:
+        api.Clear()
+
+
+def _ocr_with_subprocess(image, lang: str, timeout: float) -> str:
+    from utils.analysis_tools import _import_pytesseract
+    pytesseract = _import_pytesseract()
+    try:
+        return pytesseract.image_to_string(image, lang=lang, timeout=timeout)
+    except pytesseract.TesseractNotFoundError as e:
+        raise OCRUnavailableError(str(e)) from None
+    except pytesseract.TesseractError as e:
+        raise OCREngineError(str(e)) from None
+    except RuntimeError as e:
+        if 'timeout' in str(e).lower():
+            raise OCRTimeoutError(f"Tesseract timed out after {timeout}s") from None
+        raise
+
+
+def run_ocr(image_data: bytes, lang: str, timeout: float = 0, engine: str = 'subprocess',
+            preprocess: Optional[PreprocessOptions] = None) -> Tuple[str, str]:
+    """Decode an image and run Tesseract on it. Executed in a pool worker.
+
+    Args:
+        image_data: Raw image bytes
+        lang: Tesseract lang string, e.g. 'por+eng'
+        timeout: Seconds after which recognition is aborted (0 = no limit)
+        engine: 'tesserocr' keeps a loaded engine per worker and feeds it the
+            image in memory; 'subprocess' runs the tesseract binary per call;
+            'auto' uses tesserocr when it is installed
+        preprocess: Downscale/grayscale/crop settings applied before OCR
+
+    Returns:
+        Tuple of (extracted text, engine actually used)
+    """
+    image = load_image(image_data, preprocess)
+    if engine != 'subprocess':
+        api = _get_tesserocr_api(lang)
+        if api is not None:
+            return _ocr_with_tesserocr(api, image, timeout), 'tesserocr'
+        if engine == 'tesserocr':
+            logger.warning("OCR engine 'tesserocr' requested but not available; falling back")
+    return _ocr_with_subprocess(image, lang, timeout), 'subprocess'
+
+
+class OCRPool:
+    """Bounded process pool for CPU-bound OCR jobs.
+
+    OCR holds the GIL in Pillow and blocks on the tesseract subprocess, so it
+    runs in worker processes instead of on the caller's event loop. At most
+    ``max_workers`` jobs run at once and at most ``queue_size`` wait; beyond
+    that jobs are rejected with OCRQueueFullError. ``job_timeout`` bounds
+    each job: the worker aborts recognition when it expires. Workers are
+    long-lived, so with the tesserocr engine each keeps its traineddata
+    loaded between jobs.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, queue_size: int = 32,
+                 job_timeout: float = 30.0, start_method: str = 'spawn', engine: str = 'auto',
+                 preprocess: Optional[PreprocessOptions] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.start_method = start_method
+        self.engine = engine
+        self.preprocess = preprocess
+        self.admission = AdmissionController(self.max_workers, queue_size, name='ocr_pool')
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            'jobs': 0,
+            'completed': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'pool_restarts': 0,
+            'total_ocr_time': 0.0,
+            'total_queue_wait_time': 0.0,
+        }
+
+    def _count(self, name: str, value=1):
+        with self._metrics_lock:
+            self.metrics[name] += value
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(self.start_method)
+                    )
+                    logger.info(f"OCR pool started with {self.max_workers} {self.start_method} workers")
+        return self._executor
+
+    def _reset_executor(self, broken: concurrent.futures.ProcessPoolExecutor):
+        with self._executor_lock:
+            if self._executor is broken:
+                self._executor = None
+                self._count('pool_restarts')
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def extract_text(self, image_data: bytes, lang: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """Run OCR on an image in the pool.
+
+        Args:
+            image_data: Raw image bytes
+            lang: Tesseract lang string
+            timeout: Per-job timeout in seconds, defaults to ``job_timeout``
+
+        Returns:
+            Tuple of (extracted text, engine used)
+
+        Raises:
+            OCRQueueFullError: If the pool queue is full
+            OCRTimeoutError: If the job waits or runs longer than ``timeout``
+        """
+        timeout = timeout or self.job_timeout
+        start = time.monotonic()
+        self._count('jobs')
+        try:
+            queue_wait = await self.admission.acquire(timeout=timeout)
+        except AdmissionQueueFullError as e:
+            raise OCRQueueFullError(str(e), retry_after=e.retry_after)
+        except AdmissionTimeoutError as e:
+            self._count('timeouts')
+            raise OCRTimeoutError(str(e))
+        self._count('total_queue_wait_time', queue_wait)
+
+        remaining = max(timeout - (time.monotonic() - start), 1.0)
+        executor = self._get_executor()
+        try:
+            future = executor.submit(run_ocr, image_data, lang, remaining, self.engine, self.preprocess)
+        except BaseException:
+            self.admission.release()
+            raise
+        submitted = time.monotonic()
+
+        def _on_done(_):
+            # The slot is held until the worker is actually free again
+            hold_time = time.monotonic() - submitted
+            self.admission.release(hold_time)
+            self._count('total_ocr_time', hold_time)
+
+        future.add_done_callback(_on_done)
+        try:
+            # Recognition is aborted by the worker at ``remaining``; the grace
+            # period covers image decoding and process start-up
+            result = await asyncio.wait_for(asyncio.wrap_future(future), remaining + 5.0)
+        except (asyncio.TimeoutError, OCRTimeoutError):
+            self._count('timeouts')
+            raise OCRTimeoutError(f"OCR job timed out after {timeout}s")
+        except BrokenProcessPool:
+            self._count('failed')
+            logger.error("OCR pool worker died; restarting pool")
+            self._reset_executor(executor)
+            raise
+        except Exception:
+            self._count('failed')
+            raise
+        self._count('completed')
+        return result
+
+    def get_metrics(self) -> Dict[str, float]:
+        with self._metrics_lock:
+            metrics = {f"ocr_pool_{name}": value for name, value in self.metrics.items()}
+        metrics['ocr_pool_workers'] = self.max_workers
+        if self.metrics['completed']:
+            metrics['ocr_pool_avg_ocr_time'] = self.metrics['total_ocr_time'] / self.metrics['completed']
+        if self.metrics['jobs']:
+            metrics['ocr_pool_avg_queue_wait_time'] = self.metrics['total_queue_wait_time'] / self.metrics['jobs']
+        metrics.update(self.admission.get_metrics())
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+            logger.info("OCR pool shut down")
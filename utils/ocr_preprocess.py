@@ -0,0 +1,157 @@
+"""Image preprocessing that shrinks and cleans up images before OCR."""
+from typing import NamedTuple, Optional, Tuple
+
+# Below this contrast between a border colour and the content the border
+# is considered uniform (JPEG noise, gradients from screenshot tools)
+_BORDER_TOLERANCE = 24
+_BORDER_MARGIN = 8
+
+
+class PreprocessOptions(NamedTuple):
+    """Per-deployment OCR preprocessing settings, picklable for pool workers.
+
+    Attributes:
+        enabled: Run the pipeline at all
+        target_dpi: Downscale images whose DPI metadata is above this
+        max_side: Downscale so the longer side is at most this many pixels
+            (phone screenshots carry no usable DPI); 0 disables it
+        grayscale: Convert to 8-bit grayscale
+        binarize: Apply an Otsu threshold after grayscale conversion
+        crop_borders: Trim uniform margins around the content
+        crop_top: Fraction of the height removed from the top, e.g. 0.04 for
+            a phone status bar
+    """
+    enabled: bool = True
+    target_dpi: int = 300
+    max_side: int = 2000
+    grayscale: bool = True
+    binarize: bool = False
+    crop_borders: bool = True
+    crop_top: float = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> 'PreprocessOptions':
+        return cls(
+            enabled=config.get('OCR_PREPROCESS_ENABLED', True),
+            target_dpi=config.get('OCR_TARGET_DPI', 300),
+            max_side=config.get('OCR_MAX_SIDE', 2000),
+            grayscale=config.get('OCR_GRAYSCALE', True),
+            binarize=config.get('OCR_BINARIZE', False),
+            crop_borders=config.get('OCR_CROP_BORDERS', True),
+            crop_top=config.get('OCR_CROP_TOP', 0.0),
+        )
+
+
+def _scale_factor(size: Tuple[int, int], dpi: Optional[float], options: PreprocessOptions) -> float:
+    scale = 1.0
+    if dpi and options.target_dpi and dpi > options.target_dpi:
+        scale = options.target_dpi / dpi
+    if options.max_side and max(size) * scale > options.max_side:
+        scale = options.max_side / max(size)
+    return scale
+
+
+def _image_dpi(image) -> Optional[float]:
+    dpi = image.info.get('dpi')
+    if not dpi:
+        return None
+    try:
+        return float(dpi[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def otsu_threshold(histogram) -> int:
+    """Return the Otsu threshold for a 256-bin grayscale histogram."""
+    total = sum(histogram)
+    if not total:
+        return 128
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = 0
+    weight_background = 0
+    best_threshold, best_variance = 128, -1.0
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if not weight_background:
+            continue
+        weight_foreground = total - weight_background
+        if not weight_foreground:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+
+def _crop_uniform_borders(image):
+    from PIL import Image, ImageChops
+
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    difference = ImageChops.difference(image, background)
+    if difference.mode != 'L':
+        difference = difference.convert('L')
+    bbox = difference.point(lambda value: 255 if value > _BORDER_TOLERANCE else 0).getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    bbox = (
+        max(left - _BORDER_MARGIN, 0),
+        max(top - _BORDER_MARGIN, 0),
+        min(right + _BORDER_MARGIN, image.width),
+        min(bottom + _BORDER_MARGIN, image.height),
+    )
+    if bbox == (0, 0, image.width, image.height):
+        return image
+    return image.crop(bbox)
+
+
+def load_image(image_data: bytes, options: Optional[PreprocessOptions] = None):
+    """Decode an image and prepare it for Tesseract.
+
+    JPEGs are decoded in draft mode, which lets libjpeg produce a 1/2, 1/4 or
+    1/8 scale image directly instead of decoding full resolution and then
+    resizing.
+
+    Args:
+        image_data: Raw image bytes
+        options: Preprocessing settings; None or disabled only decodes
+
+    Returns:
+        A PIL image ready for OCR
+    """
+    import io
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    if options is None or not options.enabled:
+        return image
+
+    scale = _scale_factor(image.size, _image_dpi(image), options)
+    target_width = max(int(image.width * scale), 1)
+    if image.format == 'JPEG' and scale < 1.0:
+        # Only gets within a power of two of the target; the resize below finishes it
+        image.draft('L' if options.grayscale else 'RGB', (target_width, int(image.height * scale)))
+
+    if options.crop_top:
+        image = image.crop((0, int(image.height * options.crop_top), image.width, image.height))
+
+    if options.grayscale or options.binarize:
+        image = image.convert('L')
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    if image.width > target_width:
+        ratio = target_width / image.width
+        image = image.resize((target_width, max(int(image.height * ratio), 1)), Image.LANCZOS, reducing_gap=2.0)
+
+    if options.crop_borders:
+        image = _crop_uniform_borders(image)
+
+    if options.binarize:
+        threshold = otsu_threshold(image.histogram())
+        image = image.point(lambda value: 255 if value > threshold else 0)
+
+    return image
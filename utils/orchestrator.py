@@ -0,0 +1,145 @@
+"""Concurrent analysis stages under one end-to-end deadline.
+
+An analysis is OCR, then independent stages that only need its text: the
+Safe Browsing lookups of the extracted URLs and the Gemini verdict. Running
+those side by side makes the latency the slowest stage instead of the sum.
+A Deadline is created when the request starts and every stage gets what is
+left of it; a stage still running when it expires is cancelled and reported
+as timed out, so the response carries whatever did finish.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Dict, List, NamedTuple, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class DeadlineExceededError(Exception):
+    """Raised by StageOutcome.result() for a stage cut off by the deadline."""
+    def __init__(self, stage: str):
+        super().__init__(f"Stage '{stage}' did not finish before the analysis deadline")
+        self.stage = stage
+
+
+class Deadline:
+    """An absolute point in time shared by every stage of one analysis."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self, minimum: float = 0.0) -> float:
+        """Seconds left, never less than ``minimum``."""
+        return max(self.expires_at - time.monotonic(), minimum)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+class StageOutcome(NamedTuple):
+    """Result of one stage: status is 'ok', 'error' or 'timeout'."""
+    name: str
+    status: str
+    value: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+    def result(self) -> Any:
+        """Return the stage's value, re-raising its error.
+
+        Raises:
+            DeadlineExceededError: If the stage timed out
+        """
+        if self.status == 'timeout':
+            raise DeadlineExceededError(self.name)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'runs': 0,
+    'stages': 0,
+    'stage_errors': 0,
+    'stage_timeouts': 0,
+    'partial_results': 0,
+    'total_wall_time': 0.0,
+    'total_stage_time': 0.0,
+}
+
+
+async def run_stages(stages: Dict[str, Awaitable], deadline: Deadline,
+                     max_concurrency: Optional[int] = None) -> Dict[str, StageOutcome]:
+    """Run independent stages concurrently until they finish or the deadline passes.
+
+    Args:
+        stages: Awaitables by stage name
+        deadline: Shared deadline; stages still running when it expires are cancelled
+        max_concurrency: Maximum stages running at once (None for no limit)
+
+    Returns:
+        Dict mapping each stage name to its StageOutcome; stage errors are
+        captured, never raised
+    """
+    if not stages:
+        return {}
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    started = time.monotonic()
+    finished_at: Dict[str, float] = {}
+
+    async def _run(name: str, awaitable: Awaitable) -> Any:
+        start = time.monotonic()
+        try:
+            if semaphore is None:
+                return await awaitable
+            async with semaphore:
+                return await awaitable
+        finally:
+            finished_at[name] = time.monotonic() - start
+
+    tasks = {asyncio.ensure_future(_run(name, awaitable)): name for name, awaitable in stages.items()}
+    done, pending = await asyncio.wait(tasks, timeout=deadline.remaining())
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    outcomes = {}
+    for task, name in tasks.items():
+        elapsed = finished_at.get(name, 0.0)
+        if task in pending:
+            outcomes[name] = StageOutcome(name, 'timeout', elapsed=elapsed)
+            logger.warning(f"Analysis stage '{name}' cut off by the deadline after {elapsed:.2f}s")
+        elif task.exception() is not None:
+            outcomes[name] = StageOutcome(name, 'error', error=task.exception(), elapsed=elapsed)
+        else:
+            outcomes[name] = StageOutcome(name, 'ok', value=task.result(), elapsed=elapsed)
+
+    with _metrics_lock:
+        _metrics['runs'] += 1
+        _metrics['stages'] += len(outcomes)
+        _metrics['stage_errors'] += sum(1 for o in outcomes.values() if o.status == 'error')
+        _metrics['stage_timeouts'] += len(pending)
+        _metrics['partial_results'] += 1 if pending else 0
+        _metrics['total_wall_time'] += time.monotonic() - started
+        _metrics['total_stage_time'] += sum(o.elapsed for o in outcomes.values())
+    return outcomes
+
+
+def timed_out_stages(outcomes: Dict[str, StageOutcome]) -> List[str]:
+    return [name for name, outcome in outcomes.items() if outcome.status == 'timeout']
+
+
+def get_orchestrator_metrics() -> Dict[str, float]:
+    """Stage counters; ``time_saved`` is stage time overlapped by running concurrently."""
+    with _metrics_lock:
+        metrics = {f"orchestrator_{name}": value for name, value in _metrics.items()}
+    metrics['orchestrator_time_saved'] = max(
+        metrics['orchestrator_total_stage_time'] - metrics['orchestrator_total_wall_time'], 0.0
+    )
+    return metrics
@@ -0,0 +1,198 @@
+"""Google Safe Browsing v4 client used by AnalysisTools.analyze_urls."""
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+DEFAULT_API_URL = 'https://safebrowsing.googleapis.com/v4'
+# threatMatches:find accepts at most 500 threatEntries per request
+MAX_ENTRIES_PER_REQUEST = 500
+THREAT_TYPES = ["MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE", "POTENTIALLY_HARMFUL_APPLICATION"]
+PLATFORM_TYPES = ["ANY_PLATFORM"]
+CLIENT_INFO = {
+    "clientId": "seraquegolpe-app",
+    "clientVersion": "1.0.0"
+}
+
+
+class ThreatLookup(NamedTuple):
+    """Safe Browsing result for one URL: its matches, or the error that prevented the check."""
+    matches: List[Dict[str, Any]]
+    error: Optional[Exception] = None
+    # Seconds a clean result may be cached, when the API said so
+    negative_cache_duration: Optional[float] = None
+
+
+def parse_duration(value: Optional[str], default: float = 0.0) -> float:
+    """Parse a protobuf Duration string such as '300.5s'."""
+    if not value:
+        return default
+    try:
+        return float(value.rstrip('s'))
+    except ValueError:
+        return default
+
+
+def dedupe(urls: List[str]) -> List[str]:
+    """Remove duplicate URLs, keeping the first occurrence order."""
+    return list(dict.fromkeys(urls))
+
+
+class SafeBrowsingClient:
+    """Batched threatMatches:find lookups.
+
+    URLs are deduplicated and sent in as few requests as the API allows
+    (500 entries each); the matches are fanned back out per URL. ``api_url``
+    can point at a local stand-in server for testing. With a ready
+    ``local_db`` (see utils/safe_browsing_db.py) URLs are matched against the
+    local hash-prefix database instead. With a ``verdict_cache``
+    (utils.caching.UrlVerdictCache) only URLs without a cached verdict are
+    looked up at all.
+    """
+
+    def __init__(self, api_key: str, api_url: str = DEFAULT_API_URL,
+                 max_entries_per_request: int = MAX_ENTRIES_PER_REQUEST, max_concurrent_requests: int = 4):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip('/')
+        self.max_entries_per_request = max_entries_per_request
+        # Batches are sent concurrently, at most this many at a time
+        self.max_concurrent_requests = max_concurrent_requests
+        # Optional SafeBrowsingDatabase; when ready, URLs are matched locally
+        self.local_db = None
+        # Optional UrlVerdictCache shared by every worker
+        self.verdict_cache = None
+        self.metrics = {
+            'lookup_requests': 0,
+            'urls_checked': 0,
+            'duplicate_urls': 0,
+            'cached_urls': 0,
+            'saved_round_trips': 0,
+        }
+
+    async def _post(self, session, method: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Connect and total timeouts come from the session (HTTP_CONNECT_TIMEOUT/HTTP_TOTAL_TIMEOUT)
+        async with session.post(
+            f"{self.api_url}/{method}",
+            params={'key': self.api_key},
+            json=payload
+        ) as response:
+            response.raise_for_status()
+            return await response.json() or {}
+
+    async def fetch_list_updates(self, session, list_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Call threatListUpdates:fetch (Update API).
+
+        Args:
+            session: aiohttp ClientSession
+            list_requests: listUpdateRequests entries (threatType, platformType,
+                threatEntryType, state, constraints)
+        """
+        return await self._post(session, 'threatListUpdates:fetch', {
+            "client": CLIENT_INFO,
+            "listUpdateRequests": list_requests
+        })
+
+    async def find_full_hashes(self, session, prefixes: List[str], client_states: List[str],
+                               threat_types: List[str], platform_types: List[str]) -> Dict[str, Any]:
+        """Call fullHashes:find for base64-encoded hash prefixes (Update API)."""
+        return await self._post(session, 'fullHashes:find', {
+            "client": CLIENT_INFO,
+            "clientStates": client_states,
+            "threatInfo": {
+                "threatTypes": threat_types,
+                "platformTypes": platform_types,
+                "threatEntryTypes": ["URL"],
+                "threatEntries": [{"hash": prefix} for prefix in prefixes]
+            }
+        })
+
+    def _find_payload(self, urls: List[str]) -> Dict[str, Any]:
+        return {
+            "client": CLIENT_INFO,
+            "threatInfo": {
+                "threatTypes": THREAT_TYPES,
+                "platformTypes": PLATFORM_TYPES,
+                "threatEntryTypes": ["URL"],
+                "threatEntries": [{"url": url} for url in urls]
+            }
+        }
+
+    async def _find_batch(self, session, urls: List[str]) -> Dict[str, ThreatLookup]:
+        self.metrics['lookup_requests'] += 1
+        try:
+            sb_data = await self._post(session, 'threatMatches:find', self._find_payload(urls))
+        except Exception as e:
+            logger.error(f"Safe Browsing lookup of {len(urls)} URLs failed: {e!r}")
+            return {url: ThreatLookup([], e) for url in urls}
+
+        negative_cache_duration = None
+        if 'negativeCacheDuration' in sb_data:
+            negative_cache_duration = parse_duration(sb_data['negativeCacheDuration'])
+        results = {url: ThreatLookup([], None, negative_cache_duration) for url in urls}
+        for match in sb_data.get('matches', []):
+            url = match.get('threat', {}).get('url')
+            if url in results:
+                results[url].matches.append(match)
+        return results
+
+    async def find_threat_matches(self, session, urls: List[str]) -> Dict[str, ThreatLookup]:
+        """Look up URLs in Safe Browsing.
+
+        Args:
+            session: aiohttp ClientSession to send the requests on
+            urls: URLs to check; duplicates are looked up once
+
+        Returns:
+            Dict mapping each distinct URL to its ThreatLookup
+        """
+        unique_urls = dedupe(urls)
+        self.metrics['urls_checked'] += len(unique_urls)
+        self.metrics['duplicate_urls'] += len(urls) - len(unique_urls)
+        if not unique_urls:
+            return {}
+
+        results = {}
+        if self.verdict_cache is not None:
+            results = self.verdict_cache.get_many(unique_urls)
+            self.metrics['cached_urls'] += len(results)
+        pending_urls = [url for url in unique_urls if url not in results]
+        if not pending_urls:
+            if self.local_db is None or not self.local_db.ready:
+                self.metrics['saved_round_trips'] += self._batch_count(unique_urls)
+            return results
+
+        if self.local_db is not None and self.local_db.ready:
+            fetched = await self.local_db.lookup(session, pending_urls)
+        else:
+            self.metrics['saved_round_trips'] += self._batch_count(unique_urls) - self._batch_count(pending_urls)
+            batches = [
+                pending_urls[i:i + self.max_entries_per_request]
+                for i in range(0, len(pending_urls), self.max_entries_per_request)
+            ]
+            semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+            async def _limited(batch):
+                async with semaphore:
+                    return await self._find_batch(session, batch)
+
+            fetched = {}
+            for batch_results in await asyncio.gather(*[_limited(batch) for batch in batches]):
+                fetched.update(batch_results)
+
+        if self.verdict_cache is not None:
+            self.verdict_cache.store_many(fetched)
+        results.update(fetched)
+        return results
+
+    def _batch_count(self, urls: List[str]) -> int:
+        return -(-len(urls) // self.max_entries_per_request)
+
+    def get_metrics(self) -> Dict[str, int]:
+        metrics = {f"safe_browsing_{name}": value for name, value in self.metrics.items()}
+        if self.local_db is not None:
+            metrics.update(self.local_db.get_metrics())
+        if self.verdict_cache is not None:
+            metrics.update(self.verdict_cache.get_metrics())
+        return metrics
@@ -0,0 +1,559 @@
+"""Local Safe Browsing hash-prefix database (Update API model).
+
+Threat lists are downloaded with threatListUpdates:fetch and kept on disk as
+sorted, fixed-width hash-prefix files that are memory-mapped for lookups.
+Updates are incremental: removals are indices into the sorted list and
+additions are merged in, after which the SHA-256 checksum sent by the server
+is verified. A URL is checked by hashing its host-suffix/path-prefix
+expressions and binary-searching the prefixes; only a prefix hit needs a
+fullHashes:find round trip to confirm the match.
+"""
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import posixpath
+import re
+import socket
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote_to_bytes
+
+import structlog
+
+from utils.async_utils import BackgroundEventLoop
+from utils.safe_browsing import ThreatLookup, parse_duration
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process updates the database
+    fcntl = None
+
+logger = structlog.get_logger()
+
+# (threatType, platformType) of the URL lists the app subscribes to
+DEFAULT_THREAT_LISTS = (
+    ('MALWARE', 'ANY_PLATFORM'),
+    ('SOCIAL_ENGINEERING', 'ANY_PLATFORM'),
+    ('UNWANTED_SOFTWARE', 'ANY_PLATFORM'),
+    ('POTENTIALLY_HARMFUL_APPLICATION', 'ANDROID'),
+)
+STATE_FILE = 'state.json'
+LOCK_FILE = '.update.lock'
+# Other processes sharing the directory pick up new data this often
+_RELOAD_CHECK_INTERVAL = 5.0
+
+
+# URL canonicalization and expressions, as specified for the Update API
+
+def _escape(value: bytes) -> str:
+    return ''.join(
+        f"%{byte:02X}" if byte <= 0x20 or byte >= 0x7f or byte in (0x23, 0x25) else chr(byte)
+        for byte in value
+    )
+
+
+def _full_unescape(value: str) -> bytes:
+    data = value.encode('utf-8', errors='surrogateescape')
+    for _ in range(10):
+        unescaped = unquote_to_bytes(data)
+        if unescaped == data:
+            break
+        data = unescaped
+    return data
+
+
+def _canonical_host(host: str) -> str:
+    host = re.sub(r'\.{2,}', '.', host.strip('.').lower())
+    try:
+        # Accepts decimal, octal, hex and shorthand forms such as 0x7f.1
+        return socket.inet_ntoa(socket.inet_aton(host))
+    except (OSError, ValueError):
+        pass
+    try:
+        return host.encode('idna').decode('ascii')
+    except UnicodeError:
+        return host
+
+
+def canonicalize_url(url: str) -> Optional[Tuple[str, str, str]]:
+    """Canonicalize a URL for hash-prefix matching.
+
+    Returns:
+        Tuple of (host, path, query) with query None-less ('' if absent),
+        or None if the URL has no host
+    """
+    url = re.sub(r'[\t\r\n]', '', url.strip()).split('#', 1)[0]
+    if '://' not in url:
+        url = 'http://' + url
+    scheme, rest = url.split('://', 1)
+    split_at = min((i for i in (rest.find('/'), rest.find('?')) if i != -1), default=len(rest))
+    authority, path_and_query = rest[:split_at], rest[split_at:]
+    path, _, query = path_and_query.partition('?')
+
+    host = _full_unescape(authority.rsplit('@', 1)[-1]).decode('utf-8', errors='replace')
+    if host.startswith('['):
+        host = host.split(']', 1)[0] + ']'
+    else:
+        host = host.split(':', 1)[0]
+    host = _canonical_host(host)
+    if not host:
+        return None
+
+    path = _full_unescape(path or '/').decode('latin-1')
+    trailing_slash = path.endswith('/') or path.endswith('/.') or path.endswith('/..')
+    path = posixpath.normpath('/' + path.lstrip('/'))
+    if path == '//':
+        path = '/'
+    if trailing_slash and not path.endswith('/'):
+        path += '/'
+    return (
+        _escape(host.encode('utf-8')),
+        _escape(path.encode('latin-1')),
+        _escape(_full_unescape(query)) if query else ''
+    )
+
+
+def url_expressions(url: str) -> List[str]:
+    """Return the host-suffix/path-prefix expressions to look up for a URL."""
+    canonical = canonicalize_url(url)
+    if canonical is None:
+        return []
+    host, path, query = canonical
+
+    hosts = [host]
+    if not re.fullmatch(r'[\d.]+', host):
+        components = host.split('.')
+        for count in range(min(len(components) - 1, 5), 1, -1):
+            suffix = '.'.join(components[-count:])
+            if suffix != host:
+                hosts.append(suffix)
+
+    paths = []
+    if query:
+        paths.append(f"{path}?{query}")
+    paths.append(path)
+    components = path.strip('/').split('/')
+    prefix = '/'
+    for component in [''] + components[:-1]:
+        if component:
+            prefix += component + '/'
+        if prefix not in paths:
+            paths.append(prefix)
+        if len(paths) >= 6:
+            break
+    return list(dict.fromkeys(h + p for h in hosts for p in paths))
+
+
+def url_full_hashes(url: str) -> List[bytes]:
+    return [hashlib.sha256(expression.encode('ascii', errors='replace')).digest()
+            for expression in url_expressions(url)]
+
+
+class PrefixFile:
+    """Sorted fixed-width hash prefixes of one size, memory-mapped read-only."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._file = None
+        self._map = None
+        self.count = 0
+        if os.path.exists(path) and os.path.getsize(path):
+            self._file = open(path, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.count = len(self._map) // size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = index * self.size
+        return self._map[offset:offset + self.size]
+
+    def __contains__(self, prefix: bytes) -> bool:
+        if not self.count:
+            return False
+        index = bisect.bisect_left(self, prefix)
+        return index < self.count and self[index] == prefix
+
+    def prefixes(self) -> List[bytes]:
+        if not self.count:
+            return []
+        data = self._map[:]
+        return [data[i:i + self.size] for i in range(0, len(data), self.size)]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+class ThreatList:
+    """One Safe Browsing list: its client state and prefix files by prefix size."""
+
+    def __init__(self, directory: str, threat_type: str, platform_type: str):
+        self.directory = directory
+        self.threat_type = threat_type
+        self.platform_type = platform_type
+        self.name = f"{threat_type}_{platform_type}_URL"
+        self.state = ''
+        self.files: Dict[int, PrefixFile] = {}
+
+    def _path(self, size: int) -> str:
+        return os.path.join(self.directory, f"{self.name}_{size}.bin")
+
+    def load(self, state: str, sizes: Iterable[int]):
+        self.close()
+        self.state = state
+        self.files = {size: PrefixFile(self._path(size), size) for size in sizes}
+
+    def match(self, full_hash: bytes) -> Optional[bytes]:
+        for size, prefix_file in self.files.items():
+            prefix = full_hash[:size]
+            if prefix in prefix_file:
+                return prefix
+        return None
+
+    def sorted_prefixes(self) -> List[bytes]:
+        prefixes = []
+        for prefix_file in self.files.values():
+            prefixes.extend(prefix_file.prefixes())
+        prefixes.sort()
+        return prefixes
+
+    def apply_update(self, update: Dict[str, Any], prefixes: List[bytes]) -> List[int]:
+        """Apply a listUpdateResponse and write new prefix files.
+
+        Args:
+            update: The listUpdateResponse for this list
+            prefixes: Snapshot of the current sorted prefixes; ignored for a
+                full update. The mapped files are not read here, since another
+                thread may close them on reload.
+
+        Returns:
+            The prefix sizes now stored for this list
+
+        Raises:
+            ValueError: If the resulting checksum does not match the server's
+        """
+        if update.get('responseType') == 'FULL_UPDATE':
+            prefixes = []
+        else:
+            prefixes = list(prefixes)
+
+        removed = set()
+        for removal in update.get('removals', []):
+            removed.update(removal.get('rawIndices', {}).get('indices', []))
+        if removed:
+            prefixes = [prefix for index, prefix in enumerate(prefixes) if index not in removed]
+
+        for addition in update.get('additions', []):
+            raw = addition.get('rawHashes', {})
+            size = raw.get('prefixSize', 4)
+            data = base64.b64decode(raw.get('rawHashes', ''))
+            prefixes.extend(data[i:i + size] for i in range(0, len(data), size))
+        prefixes.sort()
+
+        expected = update.get('checksum', {}).get('sha256')
+        if expected and hashlib.sha256(b''.join(prefixes)).digest() != base64.b64decode(expected):
+            raise ValueError(f"Checksum mismatch for {self.name}")
+
+        by_size: Dict[int, List[bytes]] = {}
+        for prefix in prefixes:
+            by_size.setdefault(len(prefix), []).append(prefix)
+        for size, sized in by_size.items():
+            temp_path = self._path(size) + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(b''.join(sized))
+            os.replace(temp_path, self._path(size))
+        for size in set(self.files) - set(by_size):
+            if os.path.exists(self._path(size)):
+                os.remove(self._path(size))
+        return sorted(by_size)
+
+    def close(self):
+        for prefix_file in self.files.values():
+            prefix_file.close()
+        self.files = {}
+
+
+class SafeBrowsingDatabase:
+    """Local hash-prefix matching with remote fullHashes confirmation.
+
+    ``ready`` is False until every list has been downloaded once; until then
+    SafeBrowsingClient keeps using threatMatches:find. Several processes can
+    share ``directory``: updates are serialized with a file lock and the
+    other processes reload when state.json changes.
+    """
+
+    def __init__(self, directory: str, client, threat_lists=DEFAULT_THREAT_LISTS):
+        self.directory = directory
+        self.client = client
+        os.makedirs(directory, exist_ok=True)
+        self.lists = [ThreatList(directory, threat_type, platform_type)
+                      for threat_type, platform_type in threat_lists]
+        self._lock = threading.RLock()
+        self._state_mtime = None
+        self._last_reload_check = 0.0
+        # fullHashes:find results must be cached for their cacheDuration /
+        # negativeCacheDuration (full hash -> (expires, matches), prefix -> expires)
+        self._positive_cache: Dict[bytes, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._negative_cache: Dict[bytes, float] = {}
+        self._updater: Optional[BackgroundEventLoop] = None
+        self.metrics = {
+            'local_lookups': 0,
+            'local_clean': 0,
+            'prefix_hits': 0,
+            'full_hash_requests': 0,
+            'full_hash_cache_hits': 0,
+            'updates': 0,
+            'update_failures': 0,
+        }
+        self._reload()
+
+    @property
+    def ready(self) -> bool:
+        return all(threat_list.state for threat_list in self.lists)
+
+    def _state_path(self) -> str:
+        return os.path.join(self.directory, STATE_FILE)
+
+    def _reload(self):
+        """(Re)load list states and map the prefix files from disk."""
+        try:
+            mtime = os.stat(self._state_path()).st_mtime_ns
+            with open(self._state_path(), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for threat_list in self.lists:
+                list_state = state.get('lists', {}).get(threat_list.name, {})
+                threat_list.load(list_state.get('state', ''), list_state.get('sizes', []))
+            self._state_mtime = mtime
+        logger.info(f"Safe Browsing database loaded: {self.prefix_count()} prefixes")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_reload_check < _RELOAD_CHECK_INTERVAL:
+            return
+        self._last_reload_check = now
+        try:
+            mtime = os.stat(self._state_path()).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._state_mtime:
+            self._reload()
+
+    def prefix_count(self) -> int:
+        return sum(len(f) for threat_list in self.lists for f in threat_list.files.values())
+
+    async def update(self, session) -> float:
+        """Fetch and apply list diffs.
+
+        Returns:
+            Seconds the server asks the client to wait before the next update
+        """
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), 'w')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another process is updating; pick up its result instead
+                    self._maybe_reload()
+                    return 0.0
+            self._reload()
+            response = await self.client.fetch_list_updates(session, [{
+                "threatType": threat_list.threat_type,
+                "platformType": threat_list.platform_type,
+                "threatEntryType": "URL",
+                "state": threat_list.state,
+                "constraints": {"supportedCompressions": ["RAW"]}
+            } for threat_list in self.lists])
+
+            by_name = {threat_list.name: threat_list for threat_list in self.lists}
+            state = {'lists': {}}
+            for threat_list in self.lists:
+                state['lists'][threat_list.name] = {
+                    'state': threat_list.state,
+                    'sizes': sorted(threat_list.files),
+                }
+            for update in response.get('listUpdateResponses', []):
+                name = f"{update.get('threatType')}_{update.get('platformType')}_URL"
+                threat_list = by_name.get(name)
+                if threat_list is None:
+                    continue
+                try:
+                    sizes = await asyncio.to_thread(self._apply_update, threat_list, update)
+                except ValueError as e:
+                    # Start this list over on the next update
+                    logger.error(f"Safe Browsing update rejected: {str(e)}")
+                    state['lists'][name] = {'state': '', 'sizes': []}
+                    continue
+                state['lists'][name] = {'state': update.get('newClientState', ''), 'sizes': sizes}
+
+            wait = parse_duration(response.get('minimumWaitDuration'))
+            temp_path = self._state_path() + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self._state_path())
+            # Lookups only see the new files once every list has been written
+            self._reload()
+            self.metrics['updates'] += 1
+            return wait
+        except Exception:
+            self.metrics['update_failures'] += 1
+            raise
+        finally:
+            lock_file.close()
+
+    def _apply_update(self, threat_list: ThreatList, update: Dict[str, Any]) -> List[int]:
+        # Copy the prefixes while lookups and reloads are held off, then merge
+        # and write from the copy
+        prefixes = []
+        if update.get('responseType') != 'FULL_UPDATE':
+            with self._lock:
+                prefixes = threat_list.sorted_prefixes()
+        return threat_list.apply_update(update, prefixes)
+
+    def start_updates(self, interval: float = 1800.0, session_factory=None):
+        """Keep the database updated from a background event loop.
+
+        Args:
+            interval: Seconds between updates (the server's minimum wait wins)
+            session_factory: Callable returning the aiohttp session to use
+        """
+        async def _run():
+            import aiohttp
+            while True:
+                wait = interval
+                try:
+                    if session_factory is not None:
+                        wait = max(await self.update(session_factory()), interval)
+                    else:
+                        async with aiohttp.ClientSession() as session:
+                            wait = max(await self.update(session), interval)
+                except Exception as e:
+                    logger.error(f"Safe Browsing database update failed: {str(e)}")
+                    wait = min(interval, 300.0)
+                await asyncio.sleep(wait)
+
+        self._updater = BackgroundEventLoop("safe_browsing_update")
+        self._updater.submit(_run())
+
+    def stop_updates(self):
+        if self._updater is not None:
+            self._updater.stop()
+            self._updater = None
+
+    def _client_states(self) -> List[str]:
+        return [threat_list.state for threat_list in self.lists]
+
+    async def _confirm(self, session, prefixes: Set[bytes]) -> Dict[bytes, List[Dict[str, Any]]]:
+        """Resolve prefix hits to full-hash matches, using the response cache."""
+        now = time.time()
+        self._positive_cache = {h: entry for h, entry in self._positive_cache.items() if entry[0] > now}
+        self._negative_cache = {p: expires for p, expires in self._negative_cache.items() if expires > now}
+        matches: Dict[bytes, List[Dict[str, Any]]] = {}
+        to_request = set()
+        for prefix in prefixes:
+            # Unexpired positive entries win over the negative cache
+            cached = [(full_hash, entry[1]) for full_hash, entry in self._positive_cache.items()
+                      if full_hash.startswith(prefix) and entry[0] > now]
+            if cached:
+                self.metrics['full_hash_cache_hits'] += 1
+                for full_hash, cached_matches in cached:
+                    matches[full_hash] = cached_matches
+                continue
+            if self._negative_cache.get(prefix, 0) > now:
+                self.metrics['full_hash_cache_hits'] += 1
+                continue
+            to_request.add(prefix)
+        if not to_request:
+            return matches
+
+        self.metrics['full_hash_requests'] += 1
+        response = await self.client.find_full_hashes(
+            session,
+            [base64.b64encode(prefix).decode('ascii') for prefix in sorted(to_request)],
+            self._client_states(),
+            sorted({threat_list.threat_type for threat_list in self.lists}),
+            sorted({threat_list.platform_type for threat_list in self.lists})
+        )
+        negative_expires = now + parse_duration(response.get('negativeCacheDuration'), 300.0)
+        for prefix in to_request:
+            self._negative_cache[prefix] = negative_expires
+        for match in response.get('matches', []):
+            full_hash = base64.b64decode(match.get('threat', {}).get('hash', ''))
+            expires = now + parse_duration(match.get('cacheDuration'), 300.0)
+            entry = self._positive_cache.get(full_hash)
+            cached_matches = entry[1] if entry and entry[0] > now else []
+            cached_matches.append(match)
+            self._positive_cache[full_hash] = (expires, cached_matches)
+            matches[full_hash] = cached_matches
+        return matches
+
+    async def lookup(self, session, urls: List[str]) -> Dict[str, ThreatLookup]:
+        """Check URLs locally, confirming prefix hits with fullHashes:find.
+
+        Returns:
+            Dict mapping each URL to its ThreatLookup, with matches shaped like
+            threatMatches:find matches
+        """
+        self._maybe_reload()
+        url_hashes: Dict[str, List[bytes]] = {}
+        hit_prefixes: Set[bytes] = set()
+        with self._lock:
+            for url in urls:
+                self.metrics['local_lookups'] += 1
+                full_hashes = url_full_hashes(url)
+                hits = [prefix for full_hash in full_hashes for threat_list in self.lists
+                        if (prefix := threat_list.match(full_hash)) is not None]
+                if hits:
+                    self.metrics['prefix_hits'] += 1
+                    hit_prefixes.update(hits)
+                    url_hashes[url] = full_hashes
+                else:
+                    self.metrics['local_clean'] += 1
+
+        results = {url: ThreatLookup([]) for url in urls}
+        if not hit_prefixes:
+            return results
+        try:
+            confirmed = await self._confirm(session, hit_prefixes)
+        except Exception as e:
+            logger.error(f"Safe Browsing fullHashes lookup failed: {e!r}")
+            for url in url_hashes:
+                results[url] = ThreatLookup([], e)
+            return results
+
+        for url, full_hashes in url_hashes.items():
+            for full_hash in full_hashes:
+                for match in confirmed.get(full_hash, []):
+                    results[url].matches.append({
+                        'threatType': match.get('threatType'),
+                        'platformType': match.get('platformType'),
+                        'threatEntryType': 'URL',
+                        'threat': {'url': url},
+                        'cacheDuration': match.get('cacheDuration'),
+                    })
+        return results
+
+    def get_metrics(self) -> Dict[str, Any]:
+        metrics = {f"safe_browsing_db_{name}": value for name, value in self.metrics.items()}
+        metrics['safe_browsing_db_ready'] = self.ready
+        metrics['safe_browsing_db_prefixes'] = self.prefix_count()
+        return metrics
+
+    def close(self):
+        self.stop_updates()
+        with self._lock:
+            for threat_list in self.lists:
+                threat_list.close()
@@ -0,0 +1,388 @@
+"""Near-duplicate detection for previously analyzed messages."""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import structlog
+
+from utils.caching import normalize_message
+from utils.url_extractor import find_urls, parse_url
+
+logger = structlog.get_logger()
+
+FINGERPRINT_BITS = 64
+# Fine image hashes are 16x16 difference hashes (256 bits)
+FINE_IMAGE_HASH_SIZE = 16
+
+# Campaign variants usually differ in amounts, phone numbers and names, so
+# numbers are collapsed to a placeholder before shingling. Links keep their
+# host: the same text pointing at another domain is not the same message.
+_NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)*')
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize_message(text: str) -> List[str]:
+    """Tokenize a message, replacing volatile parts with placeholder tokens.
+
+    Numbers become ``_num_`` and links ``_url_<host>``, so variants that only
+    differ in a short-link path still match.
+    """
+    tokens = []
+    for word in normalize_message(text).split():
+        extracted = parse_url(word) if '.' in word else None
+        if extracted is not None:
+            tokens.append(f"_url_{extracted.host}")
+        else:
+            tokens.extend(_TOKEN_PATTERN.findall(_NUMBER_PATTERN.sub(' _num_ ', word)))
+    return tokens
+
+
+def message_hosts(text: str) -> FrozenSet[str]:
+    """Hosts of the links in a message."""
+    return frozenset(extracted.host for extracted in find_urls(text))
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text: str, shingle_size: int = 1) -> int:
+    """Compute a 64-bit SimHash over word shingles of a message.
+
+    Single-word shingles keep short campaign variants (a different name or
+    amount) within a few bits of each other.
+    """
+    tokens = tokenize_message(text)
+    if not tokens:
+        return 0
+    if len(tokens) < shingle_size:
+        shingles = [' '.join(tokens)]
+    else:
+        shingles = [' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        value = _shingle_hash(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            if value >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class FingerprintIndex:
+    """Bounded Hamming-distance index over 64-bit fingerprints.
+
+    Fingerprints are split into ``max_distance + 1`` bands; by the pigeonhole
+    principle any fingerprint within ``max_distance`` bits of the query shares
+    at least one band exactly, so a lookup only compares the query against the
+    members of a handful of hash buckets instead of the whole index.
+    """
+
+    def __init__(self, max_distance: int = 3, max_entries: int = 100000):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        band_count = max_distance + 1
+        width = FINGERPRINT_BITS // band_count
+        self._bands = []  # (shift, mask) per band
+        for band in range(band_count):
+            shift = band * width
+            bits = FINGERPRINT_BITS - shift if band == band_count - 1 else width
+            self._bands.append((shift, (1 << bits) - 1))
+        self._buckets = [dict() for _ in self._bands]
+        self._entries = OrderedDict()  # fingerprint -> payload
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, fingerprint: int, payload: Any):
+        with self._lock:
+            if fingerprint in self._entries:
+                self._entries[fingerprint] = payload
+                self._entries.move_to_end(fingerprint)
+                return
+            self._entries[fingerprint] = payload
+            for buckets, (shift, mask) in zip(self._buckets, self._bands):
+                buckets.setdefault(fingerprint >> shift & mask, []).append(fingerprint)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._remove_from_buckets(evicted)
+
+    def _remove_from_buckets(self, fingerprint: int):
+        for buckets, (shift, mask) in zip(self._buckets, self._bands):
+            key = fingerprint >> shift & mask
+            members = buckets.get(key)
+            if members:
+                members.remove(fingerprint)
+                if not members:
+                    del buckets[key]
+
+    def nearest(self, fingerprint: int) -> Optional[Tuple[int, int, Any]]:
+        """Return (fingerprint, distance, payload) of the closest match within max_distance."""
+        best = None
+        with self._lock:
+            seen = set()
+            for buckets, (shift, mask) in zip(self._buckets, self._bands):
+                for candidate in buckets.get(fingerprint >> shift & mask, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = (candidate ^ fingerprint).bit_count()
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (candidate, distance)
+                        if distance == 0:
+                            break
+            if best is None:
+                return None
+            return best[0], best[1], self._entries[best[0]]
+
+
+class SimilarityIndex:
+    """SimHash index of analyzed messages and their verdicts.
+
+    Registered as an extension in extensions.py. ``SIMILARITY_THRESHOLD`` is the
+    minimum similarity (1 - hamming_distance / 64) for a stored verdict to be
+    reused; lower thresholds need more bands and make lookups slower.
+    A verdict is only reused when both messages link to the same hosts, since
+    a few bits of SimHash cannot tell a legitimate link from a phishing one.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 100000, enabled: bool = True):
+        self.enabled = enabled
+        self._configure(threshold, max_entries)
+        self._lock = threading.Lock()
+        self.metrics = {
+            'lookups': 0,
+            'hits': 0,
+            'host_mismatches': 0,
+            'stored': 0,
+        }
+
+    def _configure(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        max_distance = int((1.0 - threshold) * FINGERPRINT_BITS)
+        self.index = FingerprintIndex(max_distance=max_distance, max_entries=max_entries)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SIMILARITY_INDEX_ENABLED', True)
+        self._configure(
+            app.config.get('SIMILARITY_THRESHOLD', 0.95),
+            app.config.get('SIMILARITY_INDEX_MAX_ENTRIES', 100000)
+        )
+        app.extensions['similarity_index'] = self
+        logger.info(f"Similarity index initialized: threshold={self.threshold}, max_distance={self.index.max_distance}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def lookup(self, text: str) -> Optional[Dict[str, Any]]:
+        """Find a stored verdict for a near-duplicate message.
+
+        Returns:
+            Dict with 'neighbor_id', 'score' and 'verdict', or None
+        """
+        if not self.enabled:
+            return None
+        fingerprint = simhash(text)
+        if not fingerprint:
+            return None
+        self._count('lookups')
+        match = self.index.nearest(fingerprint)
+        if match is None:
+            return None
+        neighbor, distance, (hosts, verdict) = match
+        if hosts != message_hosts(text):
+            self._count('host_mismatches')
+            return None
+        self._count('hits')
+        return {
+            'neighbor_id': f"{neighbor:016x}",
+            'score': round(1.0 - distance / FINGERPRINT_BITS, 4),
+            'verdict': verdict,
+        }
+
+    def add(self, text: str, verdict: Dict[str, Any]) -> Optional[str]:
+        """Store the verdict for a message and return its neighbor id."""
+        if not self.enabled:
+            return None
+        fingerprint = simhash(text)
+        if not fingerprint:
+            return None
+        self.index.add(fingerprint, (message_hosts(text), verdict))
+        self._count('stored')
+        return f"{fingerprint:016x}"
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {f"similarity_{name}": value for name, value in self.metrics.items()}
+        metrics['similarity_entries'] = len(self.index)
+        return metrics
+
+
+def image_hashes(image_data: bytes) -> Tuple[int, int]:
+    """Compute a 64-bit and a 256-bit difference hash (dHash) of an image.
+
+    The image is shrunk to (n+1)xn grayscale and every bit records whether a
+    pixel is brighter than its right neighbour, so re-compression, resizing
+    and small colour shifts flip only a few bits. The coarse hash is indexed;
+    the fine hash confirms a match, since chat screenshots sharing one app
+    layout can land close together at 8x8.
+
+    Returns:
+        Tuple of (coarse 64-bit hash, fine 256-bit hash)
+    """
+    import io
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    # JPEGs decode straight at 1/8 scale; a no-op for other formats
+    image.draft('L', (FINE_IMAGE_HASH_SIZE * 8, FINE_IMAGE_HASH_SIZE * 8))
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    image = image.resize((FINE_IMAGE_HASH_SIZE * 4 + 4, FINE_IMAGE_HASH_SIZE * 4), Image.BOX).convert('L')
+
+    def _dhash(size: int) -> int:
+        # One byte per pixel in mode 'L'
+        pixels = image.resize((size + 1, size), Image.BOX).tobytes()
+        value = 0
+        for row in range(size):
+            offset = row * (size + 1)
+            for column in range(size):
+                value = value << 1 | (pixels[offset + column] > pixels[offset + column + 1])
+        return value
+
+    return _dhash(8), _dhash(FINE_IMAGE_HASH_SIZE)
+
+
+class ImageHashIndex:
+    """Perceptual-hash index of analyzed images and their results.
+
+    Registered as an extension in extensions.py. A stored result is reused
+    when the coarse hash is within ``IMAGE_HASH_MAX_DISTANCE`` bits of the
+    upload and the fine hash within ``IMAGE_HASH_VERIFY_DISTANCE`` bits, which
+    lets forwarded, re-compressed or resized copies of the same screenshot
+    skip the LLM. Only byte-identical uploads (same SHA-256) also skip OCR.
+    Every other match, even at hash distance 0, is reused only once the
+    upload's OCR text links to the same hosts: two chat screenshots with the
+    same layout hash alike whatever their text says.
+    """
+
+    def __init__(self, max_distance: int = 6, verify_distance: int = 12, max_entries: int = 10000,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.verify_distance = verify_distance
+        self.index = FingerprintIndex(max_distance=max_distance, max_entries=max_entries)
+        self._lock = threading.Lock()
+        self.metrics = {
+            'lookups': 0,
+            'hits': 0,
+            'exact_hits': 0,
+            'unverified': 0,
+            'host_mismatches': 0,
+            'stored': 0,
+            'errors': 0,
+        }
+
+    def init_app(self, app):
+        self.enabled = app.config.get('IMAGE_HASH_INDEX_ENABLED', True)
+        self.verify_distance = app.config.get('IMAGE_HASH_VERIFY_DISTANCE', 12)
+        self.index = FingerprintIndex(
+            max_distance=app.config.get('IMAGE_HASH_MAX_DISTANCE', 6),
+            max_entries=app.config.get('IMAGE_HASH_MAX_ENTRIES', 10000)
+        )
+        app.extensions['image_hash_index'] = self
+        logger.info(f"Image hash index initialized: max_distance={self.index.max_distance}, verify_distance={self.verify_distance}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def fingerprint(self, image_data: bytes) -> Optional[Tuple[int, int, str]]:
+        """Hash an uploaded image; None if disabled, blank or undecodable.
+
+        Decodes the image, so call it off the event loop.
+
+        Returns:
+            Tuple of (coarse dHash, fine dHash, SHA-256 hex digest of the bytes)
+        """
+        if not self.enabled:
+            return None
+        try:
+            coarse, fine = image_hashes(image_data)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Could not hash image: {str(e)}")
+            return None
+        if not coarse:
+            return None
+        return coarse, fine, hashlib.sha256(image_data).hexdigest()
+
+    def lookup(self, fingerprint: Optional[Tuple[int, int, str]]) -> Optional[Dict[str, Any]]:
+        """Find the stored result of a near-identical image.
+
+        Reuse the result right away only when 'exact' is set (the stored
+        image had the same bytes); otherwise confirm the match with
+        ``same_links`` once the upload is OCRed.
+
+        Returns:
+            Dict with 'neighbor_id', 'distance', 'exact', 'hosts' and 'result', or None
+        """
+        if fingerprint is None:
+            return None
+        coarse, fine, digest = fingerprint
+        self._count('lookups')
+        match = self.index.nearest(coarse)
+        if match is None:
+            return None
+        neighbor, distance, (neighbor_fine, neighbor_digest, hosts, result) = match
+        fine_distance = (neighbor_fine ^ fine).bit_count()
+        if fine_distance > self.verify_distance:
+            self._count('unverified')
+            return None
+        exact = digest == neighbor_digest
+        if exact:
+            self._count('hits')
+            self._count('exact_hits')
+        return {
+            'neighbor_id': f"{neighbor:016x}",
+            'distance': distance,
+            'exact': exact,
+            'hosts': hosts,
+            'result': result,
+        }
+
+    def same_links(self, similar: Dict[str, Any], text: str) -> bool:
+        """Whether the OCR text of an upload links to the hosts of its near match."""
+        if similar['hosts'] != message_hosts(text or ''):
+            self._count('host_mismatches')
+            return False
+        self._count('hits')
+        return True
+
+    def add(self, fingerprint: Optional[Tuple[int, int, str]], result: Dict[str, Any]) -> Optional[str]:
+        """Store the analysis result for an image and return its neighbor id.
+
+        ``result['extracted_text']`` is the OCR text the stored hosts come from.
+        """
+        if fingerprint is None:
+            return None
+        coarse, fine, digest = fingerprint
+        self.index.add(coarse, (fine, digest, message_hosts(result.get('extracted_text') or ''), result))
+        self._count('stored')
+        return f"{coarse:016x}"
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {f"image_hash_{name}": value for name, value in self.metrics.items()}
+        metrics['image_hash_entries'] = len(self.index)
+        return metrics
@@ -0,0 +1,73 @@
+"""Lookup latency benchmark of the SimHash fingerprint index.
+
+Usage:
+    python -m utils.similarity_benchmark [--entries 1000000] [--lookups 10000] [--threshold 0.95]
+
+Fills a FingerprintIndex with random 64-bit fingerprints and times lookups of
+near neighbours (stored fingerprints with a few flipped bits) and of misses,
+reporting p50/p99 latency. Fails when the p99 exceeds ``--max-p99-ms``.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import List
+
+from utils.similarity import FINGERPRINT_BITS, FingerprintIndex
+
+
+def flip_bits(rng: random.Random, fingerprint: int, count: int) -> int:
+    for bit in rng.sample(range(FINGERPRINT_BITS), count):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def time_lookups(index: FingerprintIndex, queries: List[int]) -> List[float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.nearest(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def report(label: str, latencies: List[float]) -> float:
+    p99 = latencies[int(0.99 * (len(latencies) - 1))] * 1e3
+    print(f"{label:<8} p50 {statistics.median(latencies) * 1e3:.4f} ms, p99 {p99:.4f} ms, "
+          f"max {latencies[-1] * 1e3:.4f} ms")
+    return p99
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark SimHash index lookups.")
+    parser.add_argument('--entries', type=int, default=1000000, help="Stored fingerprints")
+    parser.add_argument('--lookups', type=int, default=10000, help="Lookups per kind")
+    parser.add_argument('--threshold', type=float, default=0.95, help="SIMILARITY_THRESHOLD to emulate")
+    parser.add_argument('--max-p99-ms', type=float, default=1.0, help="Fail above this p99 latency")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    max_distance = int((1.0 - args.threshold) * FINGERPRINT_BITS)
+    index = FingerprintIndex(max_distance=max_distance, max_entries=args.entries)
+
+    start = time.perf_counter()
+    stored = [rng.getrandbits(FINGERPRINT_BITS) for _ in range(args.entries)]
+    for fingerprint in stored:
+        index.add(fingerprint, None)
+    print(f"{len(index):,} fingerprints, max distance {max_distance}, "
+          f"filled in {time.perf_counter() - start:.1f}s")
+
+    near = [flip_bits(rng, rng.choice(stored), rng.randint(0, max_distance)) for _ in range(args.lookups)]
+    misses = [rng.getrandbits(FINGERPRINT_BITS) for _ in range(args.lookups)]
+    worst = max(report('near', time_lookups(index, near)), report('miss', time_lookups(index, misses)))
+    if worst > args.max_p99_ms:
+        print(f"FAIL p99 {worst:.4f} ms above {args.max_p99_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
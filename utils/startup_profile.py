@@ -0,0 +1,109 @@
+"""Startup profiler: reports per-module import time for the app.
+
+Usage:
+    python -m utils.startup_profile [--module app] [--top 25] [--repeat 5]
+
+Imports the target module in a fresh interpreter with ``-X importtime`` and
+prints the slowest modules by cumulative and self time, plus the total wall
+time of the import (which for ``app`` includes create_app()). With
+``--repeat N`` it also times N plain cold starts (no ``-X importtime``
+overhead) next to a bare interpreter start, for before/after comparisons.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, NamedTuple, Tuple
+
+
+class ImportRecord(NamedTuple):
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """Parse the stderr produced by ``python -X importtime``."""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped)) // 2
+        records.append(ImportRecord(stripped, depth, int(fields[0]), int(fields[1])))
+    return records
+
+
+def profile_import(module: str) -> Tuple[float, List[ImportRecord]]:
+    """Import ``module`` in a subprocess and return (wall seconds, records)."""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=project_root,
+        capture_output=True,
+        text=True
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"Importing {module} failed:\n" + '\n'.join(errors[-20:]))
+    return wall, parse_importtime(completed.stderr)
+
+
+def time_cold_starts(module: str, repeat: int) -> List[float]:
+    """Wall seconds of ``repeat`` fresh interpreters importing ``module``."""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = f'import {module}' if module else 'pass'
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=project_root, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _print_table(title: str, records: List[ImportRecord], key, top: int):
+    print(f"\n{title}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for record in sorted(records, key=key, reverse=True)[:top]:
+        print(f"{record.cumulative_us / 1000:14.1f} {record.self_us / 1000:9.1f}  {'  ' * record.depth}{record.module}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report per-module import time for the app.")
+    parser.add_argument('--module', default='app', help="Module to import (default: app)")
+    parser.add_argument('--top', type=int, default=25, help="Number of modules to list")
+    parser.add_argument('--repeat', type=int, default=0, help="Also time this many plain cold starts")
+    args = parser.parse_args(argv)
+
+    try:
+        wall, records = profile_import(args.module)
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    top_level = [record for record in records if record.depth == 0]
+    total_import_ms = sum(record.cumulative_us for record in top_level) / 1000
+    print(f"Imported '{args.module}' in {wall:.2f}s wall time "
+          f"({total_import_ms:.0f} ms in imports, {len(records)} modules)")
+    _print_table("Slowest top-level imports (cumulative):", top_level, lambda r: r.cumulative_us, args.top)
+    _print_table("Slowest modules (self):", records, lambda r: r.self_us, args.top)
+
+    if args.repeat:
+        baseline = time_cold_starts('', args.repeat)
+        timings = time_cold_starts(args.module, args.repeat)
+        print(f"\nCold start over {args.repeat} runs: median {statistics.median(timings):.3f}s, "
+              f"min {min(timings):.3f}s (bare interpreter {statistics.median(baseline):.3f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Bounded handling of uploaded files.
+
+Werkzeug already streams multipart bodies into a spooled temporary file, so
+an upload is only held in memory when the app reads it. These helpers keep it
+to one read: requests whose Content-Length is over the limit are rejected
+before the body is parsed, the MIME type is sniffed from the first few KB,
+the size is checked from the spooled file without reading it, and the file
+is then read exactly once into a single bytes object.
+
+Within the request process that object is shared, not copied: hashing and
+the similarity index read it directly. OCR runs in a ProcessPoolExecutor, so
+the bytes are pickled to the worker, one copy per OCR job. Handing workers a
+shared-memory block instead would need a segment created, named and unlinked
+per job, with cleanup when a worker dies or a job times out; for a buffer
+capped at MAX_IMAGE_UPLOAD_BYTES that copy is a small cost next to the OCR
+itself, so it is not worth that lifecycle.
+"""
+import threading
+from typing import Dict, Iterable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import structlog
+
+from utils.file_types import get_mime_detector
+
+logger = structlog.get_logger()
+
+# libmagic needs no more than this to identify images, PDFs and text
+SNIFF_BYTES = 2048
+# Room for multipart boundaries, part headers and small form fields
+MULTIPART_OVERHEAD = 64 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+    def __init__(self, message: str, limit: int):
+        super().__init__(message)
+        self.limit = limit
+
+
+class UnsupportedUploadError(Exception):
+    """Raised when the sniffed MIME type of an upload is not allowed."""
+    def __init__(self, message: str, detected_type: str):
+        super().__init__(message)
+        self.detected_type = detected_type
+
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'uploads': 0,
+    'rejected_too_large': 0,
+    'rejected_type': 0,
+    'bytes_read': 0,
+    'max_upload_bytes': 0,
+    'max_rss_growth_kb': 0,
+}
+
+
+def _count(name: str, value: int = 1):
+    with _metrics_lock:
+        _metrics[name] += value
+
+
+def _peak_rss_kb() -> Optional[int]:
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def content_length_exceeds(request, max_bytes: int) -> bool:
+    """Whether the declared request size rules out an upload within ``max_bytes``.
+
+    Checked before request.files is touched, so oversized bodies are refused
+    without being parsed or spooled.
+    """
+    if request.content_length is not None and request.content_length > max_bytes + MULTIPART_OVERHEAD:
+        _count('rejected_too_large')
+        return True
+    return False
+
+
+def sniff_mime(file_storage, sniff_bytes: int = SNIFF_BYTES) -> str:
+    """Detect the MIME type of an uploaded file from its first bytes only."""
+    stream = file_storage.stream
+    position = stream.tell()
+    head = stream.read(sniff_bytes)
+    stream.seek(position)
+    return get_mime_detector().detect(head)
+
+
+def upload_size(file_storage) -> Optional[int]:
+    """Size of a spooled upload without reading it, or None if the stream is not seekable."""
+    stream = file_storage.stream
+    try:
+        position = stream.tell()
+        size = stream.seek(0, 2) - position
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def read_upload(file_storage, max_bytes: int, allowed_types: Optional[Iterable[str]] = None) -> bytes:
+    """Validate and read an uploaded file once.
+
+    Args:
+        file_storage: Werkzeug FileStorage from request.files
+        max_bytes: Maximum accepted size
+        allowed_types: MIME types accepted after sniffing; None accepts any
+
+    Returns:
+        The file contents
+
+    Raises:
+        UploadTooLargeError: If the file is larger than ``max_bytes``
+        UnsupportedUploadError: If the sniffed MIME type is not allowed
+    """
+    rss_before = _peak_rss_kb()
+    _count('uploads')
+
+    if allowed_types is not None:
+        detected_type = sniff_mime(file_storage)
+        if detected_type not in allowed_types:
+            _count('rejected_type')
+            raise UnsupportedUploadError(f"Unsupported file type: {detected_type}", detected_type)
+
+    size = upload_size(file_storage)
+    if size is not None:
+        if size > max_bytes:
+            _count('rejected_too_large')
+            raise UploadTooLargeError(f"Upload of {size} bytes exceeds limit of {max_bytes}", max_bytes)
+        data = file_storage.stream.read(max_bytes + 1)
+    else:
+        # Not seekable: read in chunks and stop as soon as the limit is passed
+        chunks = []
+        received = 0
+        while True:
+            chunk = file_storage.stream.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            if received > max_bytes:
+                _count('rejected_too_large')
+                raise UploadTooLargeError(f"Upload exceeds limit of {max_bytes} bytes", max_bytes)
+            chunks.append(chunk)
+        data = b''.join(chunks)
+
+    if len(data) > max_bytes:
+        _count('rejected_too_large')
+        raise UploadTooLargeError(f"Upload exceeds limit of {max_bytes} bytes", max_bytes)
+
+    with _metrics_lock:
+        _metrics['bytes_read'] += len(data)
+        _metrics['max_upload_bytes'] = max(_metrics['max_upload_bytes'], len(data))
+        rss_after = _peak_rss_kb()
+        if rss_before is not None:
+            _metrics['max_rss_growth_kb'] = max(_metrics['max_rss_growth_kb'], rss_after - rss_before)
+    return data
+
+
+def get_upload_metrics() -> Dict[str, int]:
+    """Upload counters; peak RSS is the process high-water mark in KB."""
+    with _metrics_lock:
+        metrics = {f"upload_{name}": value for name, value in _metrics.items()}
+    peak_rss = _peak_rss_kb()
+    if peak_rss is not None:
+        metrics['upload_process_peak_rss_kb'] = peak_rss
+    return metrics
@@ -0,0 +1,172 @@
+"""URL extraction shared by the OCR, document and heuristic analyzers.
+
+Scam messages mostly carry scheme-less links (``bit.ly/x``, ``wa.me/55...``)
+and OCR output is full of long punctuation runs, so instead of one big
+regex over the whole text the extractor scans whitespace-separated tokens:
+only tokens containing a dot are parsed, each with an anchored pattern that
+has no nested or overlapping repetition. Extraction is therefore linear in
+the length of the text. Hosts are IDNA-encoded (``itaú.com`` becomes
+``xn--ita-boa.com``) and every URL is returned in canonical form, once.
+"""
+import re
+from typing import List, NamedTuple, Optional
+
+# Longer tokens are OCR garbage or data URIs, not links worth checking
+MAX_URL_LENGTH = 2048
+
+# TLDs accepted for links written without a scheme or "www."; with a scheme
+# any alphabetic or punycode TLD is accepted
+SCHEMELESS_TLDS = frozenset({
+    'com', 'net', 'org', 'info', 'biz', 'br', 'ly', 'me', 'gl', 'co', 'io', 'cc', 'ai', 'app', 'dev',
+    'link', 'site', 'online', 'xyz', 'top', 'click', 'shop', 'live', 'store', 'vip', 'icu', 'buzz',
+    'pw', 'gd', 'at', 'id', 'do', 'to', 'tk', 'ml', 'ga', 'cf', 'gq', 'us', 'uk', 'pt', 'es', 'ar',
+    'mx', 'cl', 'tv', 'ws', 'fun', 'space', 'website', 'gy', 'sh', 'is', 'la', 'lat', 'sbs', 'cfd',
+    'rest', 'monster', 'cyou', 'tech', 'club', 'pro', 'page', 'news', 'blog',
+})
+# TLDs that are also Portuguese or English words ("Oi.Me liga", "feito.Do"):
+# without a scheme they only count with a path or on a known link host
+AMBIGUOUS_TLDS = frozenset({
+    'do', 'me', 'la', 'to', 'is', 'at', 'es', 'pt', 'ar', 'us', 'id', 'co', 'sh', 'tv', 'cl', 'pro', 'fun',
+})
+URL_SHORTENERS = frozenset({
+    'bit.ly', 'bitly.com', 'tinyurl.com', 'cutt.ly', 'encurtador.com.br', 't.co', 'is.gd', 'rb.gy',
+    'shorturl.at', 'ow.ly', 's.id', 'goo.gl', 'abre.ai', 'bit.do', 'tiny.cc', 't.ly', 'v.gd', 'l1nk.dev',
+    'encr.pw', 'curt.link', 'migre.me', 'short.gy',
+})
+# Bare hosts recognized as links even on an ambiguous TLD
+KNOWN_LINK_HOSTS = URL_SHORTENERS | {'wa.me', 't.me'}
+
+_LEADING_PUNCTUATION = '([{<"\'“‘«*'
+_TRAILING_PUNCTUATION = '.,;:!?)]}>"\'”’»*'
+
+_URL_TOKEN = re.compile(
+    r'(?P<scheme>https?)://'
+    r'|(?P<www>www\.)',
+    re.IGNORECASE
+)
+_URL_PARTS = re.compile(
+    r'(?:(?P<scheme>[a-z][a-z0-9+.-]{0,15})://)?'
+    r'(?:(?P<userinfo>[^\s/?#@]{1,256})@)?'
+    r'(?P<host>[^\s/?#:@]{1,253})'
+    r'(?::(?P<port>\d{1,5}))?'
+    r'(?P<path>[/?#][^\s]*)?',
+    re.IGNORECASE
+)
+_LABEL = re.compile(r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?')
+_IPV4 = re.compile(r'\d{1,3}(?:\.\d{1,3}){3}')
+_DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+
+class ExtractedURL(NamedTuple):
+    """A URL found in text: as written, canonicalized, and its (IDNA) host."""
+    raw: str
+    url: str
+    host: str
+
+
+def _strip_punctuation(token: str) -> str:
+    token = token.lstrip(_LEADING_PUNCTUATION)
+    while token and token[-1] in _TRAILING_PUNCTUATION:
+        # Keep a closing parenthesis that belongs to the URL, e.g. /Foo_(bar)
+        if token[-1] == ')' and token.count('(') >= token.count(')'):
+            break
+        token = token[:-1]
+    return token
+
+
+def _canonical_host(host: str) -> Optional[str]:
+    host = host.rstrip('.').lower()
+    if not host.isascii():
+        try:
+            host = host.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+    if _IPV4.fullmatch(host):
+        return host if all(int(part) <= 255 for part in host.split('.')) else None
+    labels = host.split('.')
+    if len(labels) < 2:
+        return None
+    for label in labels:
+        if not _LABEL.fullmatch(label):
+            return None
+    tld = labels[-1]
+    if not (tld.isalpha() or tld.startswith('xn--')):
+        return None
+    return host
+
+
+def _looks_like_link(host: str, parts) -> bool:
+    """Whether a host written without scheme or "www." is a link rather than prose."""
+    if parts.group('path') or host in KNOWN_LINK_HOSTS:
+        return _IPV4.fullmatch(host) is not None or host.rsplit('.', 1)[-1] in SCHEMELESS_TLDS
+    if _IPV4.fullmatch(host):
+        return False
+    tld = host.rsplit('.', 1)[-1]
+    if tld not in SCHEMELESS_TLDS or tld in AMBIGUOUS_TLDS:
+        return False
+    # "feliz.Com certeza": a capitalized TLD after a lowercase word starts a sentence
+    raw_labels = parts.group('host').rstrip('.').rsplit('.', 1)
+    return not (raw_labels[-1].istitle() and not raw_labels[0].isupper())
+
+
+def parse_url(token: str) -> Optional[ExtractedURL]:
+    """Parse one whitespace-free token as a URL.
+
+    Returns:
+        The ExtractedURL, or None if the token is not a plausible link
+    """
+    if len(token) > MAX_URL_LENGTH:
+        return None
+    raw = _strip_punctuation(token)
+    # URLs glued to preceding text by OCR ("acesse:https://...")
+    marker = _URL_TOKEN.search(raw)
+    if marker is not None and marker.start():
+        raw = raw[marker.start():]
+    if '.' not in raw:
+        return None
+
+    parts = _URL_PARTS.fullmatch(raw)
+    if parts is None:
+        return None
+    scheme = (parts.group('scheme') or '').lower()
+    if scheme and scheme not in ('http', 'https'):
+        return None
+    if not scheme and parts.group('userinfo'):
+        # user@example.com is an e-mail address
+        return None
+
+    host = _canonical_host(parts.group('host'))
+    if host is None:
+        return None
+    if not scheme and not host.startswith('www.') and not _looks_like_link(host, parts):
+        return None
+
+    scheme = scheme or 'http'
+    port = parts.group('port')
+    port = f":{port}" if port and port != _DEFAULT_PORTS[scheme] else ''
+    path = (parts.group('path') or '/').split('#', 1)[0]
+    if path.startswith('?'):
+        path = '/' + path
+    return ExtractedURL(raw, f"{scheme}://{host}{port}{path or '/'}", host)
+
+
+def find_urls(text: str) -> List[ExtractedURL]:
+    """Find the distinct URLs in text, in order of first appearance."""
+    if not text:
+        return []
+    found = {}
+    seen = set()
+    for token in text.split():
+        # Campaign texts and OCR repeat the same link; parse each token once
+        if '.' not in token or token in seen:
+            continue
+        seen.add(token)
+        extracted = parse_url(token)
+        if extracted is not None and extracted.url not in found:
+            found[extracted.url] = extracted
+    return list(found.values())
+
+
+def extract_urls(text: str) -> List[str]:
+    """Return the canonical form of each distinct URL in text."""
+    return [extracted.url for extracted in find_urls(text)]
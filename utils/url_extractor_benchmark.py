@@ -0,0 +1,143 @@
+"""Fuzz and benchmark suite for the URL extractor on adversarial OCR output.
+
+Usage:
+    python -m utils.url_extractor_benchmark [--fuzz 5000] [--seed 1] [--sizes 1000,10000,100000]
+
+Fuzzing feeds random OCR-like noise with planted links to the extractor and
+checks that it never raises, finds every planted link, returns each URL once
+and that canonical URLs extract to themselves. The benchmark times the
+extractor against the regex it replaced on inputs built to make scanners
+backtrack (long URL-ish punctuation runs, dotted runs, broken %-escapes) and
+fails if a tenfold larger input costs far more than tenfold time.
+"""
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from typing import Callable, Dict, List
+
+from utils.url_extractor import MAX_URL_LENGTH, extract_urls
+
+# The per-call regex analyze_image and verify_document used before
+LEGACY_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+PLANTED_LINKS = [
+    ('bit.ly/premio123', 'http://bit.ly/premio123'),
+    ('wa.me/5511999999999', 'http://wa.me/5511999999999'),
+    ('https://nubank-seguranca.online/login', 'https://nubank-seguranca.online/login'),
+    ('HTTP://Receita-Federal.xyz/consulta?cpf=1', 'http://receita-federal.xyz/consulta?cpf=1'),
+    ('www.correios-rastreio.top', 'http://www.correios-rastreio.top/'),
+    ('itaú.com.br/login', 'http://xn--ita-boa.com.br/login'),
+    ('http://xn--nubnk-3qa.com/entrar', 'http://xn--nubnk-3qa.com/entrar'),
+    ('http://192.168.10.5:8080/pix', 'http://192.168.10.5:8080/pix'),
+]
+# Characters OCR produces from screenshots: letters, digits, punctuation, look-alikes
+OCR_ALPHABET = string.ascii_letters + string.digits + '.,;:!?-_/\\|()[]{}@#$%&*+=~\'"' + 'áéíóúãõçÀÉ°ºª€'
+
+
+def adversarial_inputs(size: int) -> Dict[str, str]:
+    """Inputs of about ``size`` characters that stress regex-based scanners."""
+    def repeat(unit: str) -> str:
+        return (unit * (size // len(unit) + 1))[:size]
+    return {
+        'punctuation_run': 'http://' + repeat('$-_@.&+!*(),'),
+        'dotted_run': repeat('a.'),
+        'broken_escapes': 'https://x.com/' + repeat('%2'),
+        'scheme_run': repeat('http://'),
+        'link_run': ' '.join(f"bit.ly/{i}" for i in range(size // 10 + 1))[:size],
+    }
+
+
+def ocr_noise(rng: random.Random, length: int) -> str:
+    """Random OCR-like text: short noise words separated by whitespace."""
+    words = []
+    total = 0
+    while total < length:
+        word = ''.join(rng.choice(OCR_ALPHABET) for _ in range(rng.randint(1, 12)))
+        words.append(word)
+        total += len(word) + 1
+    return ' '.join(words)
+
+
+def fuzz(iterations: int, seed: int) -> List[str]:
+    """Run the fuzz checks and return a description of each failure."""
+    rng = random.Random(seed)
+    failures = []
+    for i in range(iterations):
+        planted = rng.sample(PLANTED_LINKS, rng.randint(0, 3))
+        words = ocr_noise(rng, rng.randint(0, 400)).split()
+        for raw, _ in planted:
+            words.insert(rng.randint(0, len(words)), rng.choice(('', '(', '"')) + raw + rng.choice(('', '.', ',', ')', '!')))
+        text = rng.choice((' ', '\n', '\t')).join(words)
+        try:
+            urls = extract_urls(text)
+        except Exception as e:
+            failures.append(f"#{i}: {type(e).__name__}: {e} on {text[:80]!r}")
+            continue
+        if len(urls) != len(set(urls)):
+            failures.append(f"#{i}: duplicate URLs {urls}")
+        for _, expected in planted:
+            if expected not in urls:
+                failures.append(f"#{i}: missed {expected} in {text[:80]!r}")
+        for url in urls:
+            if len(url) > MAX_URL_LENGTH + len('http://') or extract_urls(url) != [url]:
+                failures.append(f"#{i}: {url!r} is not canonical")
+    return failures
+
+
+def best_time(fn: Callable[[str], object], text: str, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(sizes: List[int], max_growth: float) -> List[str]:
+    """Time both scanners per input kind and size; return linearity failures."""
+    failures = []
+    print(f"{'input':<16}{'chars':>9}{'legacy ms':>12}{'extractor ms':>14}")
+    for kind in adversarial_inputs(1):
+        previous = None
+        for size in sizes:
+            text = adversarial_inputs(size)[kind]
+            legacy = best_time(LEGACY_PATTERN.findall, text)
+            current = best_time(extract_urls, text)
+            print(f"{kind:<16}{size:>9}{legacy * 1e3:>12.2f}{current * 1e3:>14.2f}")
+            if previous is not None:
+                prev_size, prev_time = previous
+                # Sub-millisecond timings are too noisy to judge
+                growth = current / max(prev_time, 1e-4)
+                if growth > max_growth * size / prev_size:
+                    failures.append(f"{kind}: {prev_size} -> {size} chars took {growth:.1f}x longer")
+            previous = (size, current)
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fuzz and benchmark the URL extractor.")
+    parser.add_argument('--fuzz', type=int, default=5000, help="Fuzz iterations (0 to skip)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Comma-separated input sizes")
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                        help="Allowed time growth beyond linear between consecutive sizes")
+    args = parser.parse_args(argv)
+
+    failures = []
+    if args.fuzz:
+        start = time.perf_counter()
+        fuzz_failures = fuzz(args.fuzz, args.seed)
+        print(f"fuzz: {args.fuzz} inputs in {time.perf_counter() - start:.2f}s, {len(fuzz_failures)} failures")
+        failures.extend(fuzz_failures)
+    failures.extend(benchmark(sorted(int(size) for size in args.sizes.split(',')), args.max_growth))
+
+    for failure in failures[:20]:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())